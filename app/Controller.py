@@ -45,7 +45,7 @@ class Controller:
         self.ui.update_progress("Performing benign evaluation...")
         clean_metrics = self.core.perform_benign_evaluation()
         self.ui.update_progress("perform_attacks...")
-        metrics_att, adv_examples = self.core.perform_attacks(attacks)
+        metrics_att, adv_examples = self.core.perform_attacks(attacks, progress_callback=self.ui.update_progress)
         self.ui.update_progress("perform_defenses...")
         metrics_deff, defended_examples = self.core.perform_defenses(defenses)
         self.ui.update_progress("perform_defenses_on_attacks...")
@@ -95,6 +95,7 @@ class Controller:
         print(clean_metrics)
         report = Report_Generator(clean_metrics)
         report.generate_pdf(self.dataloader, adv_examples)
+        self.core.cleanup_spill_dir()
 
 
     def create_dataloader(self,model_fpath, model_library, x_test_fpath, y_test_fpath):
@@ -0,0 +1,102 @@
+from contextlib import closing
+import os
+import sqlite3
+import tempfile
+import time
+import zipfile
+import numpy as np
+from app.Core.trial_store import TrialStore
+
+# Attack configuration keys that only steer the parameter optimization and do not change the generated examples
+OPTIMIZATION_KEYS = ('applicable_to', 'n_calls', 'n_initial_points', 'n_parallel_calls')
+
+class AdversarialStore:
+    """
+    The AdversarialStore class keeps generated adversarial examples on disk as compressed .npz files, addressed by a
+    hash of everything they were generated from: the model digest, the attacked input, the attack name, its
+    canonicalized parameters and its seed. An SQLite index tracks the size and last use of every entry, and the least
+    recently used entries are evicted once the store exceeds its size bound.
+    """
+    def __init__(self, root, max_bytes=1024 * 1024 * 1024):
+        """
+        Initializes the AdversarialStore, creating its directory and index if needed.
+
+        :param root: The directory of the store.
+        :param max_bytes: The maximum total size of the stored files.
+        """
+        self.root = root
+        self.max_bytes = max_bytes
+        os.makedirs(self.root, exist_ok=True)
+        with closing(sqlite3.connect(self.get_index_path())) as connection, connection:
+            connection.execute("CREATE TABLE IF NOT EXISTS entries (key TEXT PRIMARY KEY, size INTEGER NOT NULL, last_used INTEGER NOT NULL)")
+
+    def get_index_path(self):
+        return os.path.join(self.root, "index.sqlite")
+
+    def get_path(self, key):
+        return os.path.join(self.root, key + ".npz")
+
+    @staticmethod
+    def make_key(model_digest, x_digest, attack_config, seed):
+        """
+        Hashes the inputs of an attack run into a store key.
+
+        :param model_digest: The digest of the attacked model.
+        :param x_digest: The content hash of the attacked input.
+        :param attack_config: The attack configuration, whose optimization-only keys are ignored.
+        :param seed: The seed of the attack, e.g. (random_state, n_shards).
+        """
+        params = {key: value for key, value in attack_config.items() if key not in OPTIMIZATION_KEYS}
+        return TrialStore.make_key(model_digest, x_digest, attack_config['name'], params, seed)
+
+    def get(self, key):
+        """
+        Returns the stored arrays of key and marks the entry as used. An entry evicted or removed concurrently,
+        e.g. by another process sharing the store, is a miss.
+
+        :return: A dict with the adversarial examples ("x_adv") and the query counts saved with them, or None.
+        """
+        with closing(sqlite3.connect(self.get_index_path())) as connection, connection:
+            found = connection.execute("UPDATE entries SET last_used = ? WHERE key = ?", (time.time_ns(), key)).rowcount
+        if not found:
+            return None
+        try:
+            with np.load(self.get_path(key)) as entry:
+                return {name: entry[name] for name in entry.files}
+        except (OSError, ValueError, zipfile.BadZipFile):
+            return None
+
+    def put(self, key, **arrays):
+        """
+        Stores the arrays (at least "x_adv") under key, then evicts least recently used entries beyond max_bytes.
+        """
+        fd, tmp_path = tempfile.mkstemp(dir=self.root, prefix=".tmp_", suffix=".npz")
+        with os.fdopen(fd, "wb") as f:
+            np.savez_compressed(f, **arrays)
+        os.replace(tmp_path, self.get_path(key))
+        with closing(sqlite3.connect(self.get_index_path())) as connection, connection:
+            connection.execute("INSERT OR REPLACE INTO entries (key, size, last_used) VALUES (?, ?, ?)",
+                               (key, os.path.getsize(self.get_path(key)), time.time_ns()))
+            self.evict(connection)
+
+    def evict(self, connection):
+        """
+        Removes the least recently used entries until the store fits in max_bytes.
+        """
+        total = connection.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+        for key, size in connection.execute("SELECT key, size FROM entries ORDER BY last_used").fetchall():
+            if total <= self.max_bytes:
+                break
+            connection.execute("DELETE FROM entries WHERE key = ?", (key,))
+            if os.path.exists(self.get_path(key)):
+                os.remove(self.get_path(key))
+            total -= size
+
+    @property
+    def total_bytes(self):
+        with closing(sqlite3.connect(self.get_index_path())) as connection:
+            return connection.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+
+    def __len__(self):
+        with closing(sqlite3.connect(self.get_index_path())) as connection:
+            return connection.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
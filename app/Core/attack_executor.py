@@ -1,22 +1,75 @@
 from art.attacks.evasion import ZooAttack, HopSkipJump, SignOPTAttack, BoundaryAttack, DecisionTreeAttack, CubeAttack, SamplingAttack
+from concurrent.futures import ProcessPoolExecutor
+import os
+import tempfile
 import numpy as np
+from app.Core.query_counter import QueryCounter
+from app.Core.adversarial_store import AdversarialStore
+from app.Core.prediction_cache import PredictionCache
 # Import other attacks as needed
 
+# Attacks that loop over the samples one by one, so generating row by row attributes their queries to each sample
+PER_SAMPLE_ATTACKS = ('HopSkipJump', 'BoundaryAttack', 'SignOPTAttack')
+
+# State of a shard worker, set once by init_shard_worker so that the attack and x are not sent with every shard
+shard_state = {}
+
+def init_shard_worker(attack_config, model, clip_values, x_path, count_queries=False, query_cache_rows=100000):
+    """
+    Initializes a shard worker with its own attack instance and a read-only memory map of the input.
+    """
+    shard_state["executor"] = AttackExecutor(attack_config, model, clip_values, count_queries=count_queries, query_cache_rows=query_cache_rows)
+    shard_state["x"] = np.load(x_path, mmap_mode="r")
+
+def run_shard(start, stop, seed):
+    """
+    Attacks the rows [start, stop) of the input in a shard worker, seeding numpy's global generator
+    (which the ART attacks draw from) with the seed of the shard.
+
+    :return: The adversarial rows and the query counts of the shard.
+    """
+    np.random.seed(seed)
+    executor = shard_state["executor"]
+    executor.reset_query_counts()
+    x_adv = executor.execute_attack(np.asarray(shard_state["x"][start:stop]))
+    return x_adv, executor.get_query_counts()
+
 class AttackExecutor:
     """
     The AttackExecutor class is responsible for initializing and executing adversarial attacks on a given model.
     """
-    def __init__(self, attack_config, model, clip_values):
+    def __init__(self, attack_config, model, clip_values, n_shards=None, random_state=None, count_queries=False, query_cache_rows=100000,
+                 store=None, model_digest=None):
         """
         Initializes the AttackExecutor with an attack configuration and a model.
         
         :param attack_config: A dictionary containing the configuration for the attack to be executed.
                               This includes the name of the attack and any necessary parameters.
         :param model: The machine learning model to be attacked.
+        :param n_shards: If > 1, x is split into this many row shards which are attacked in parallel worker processes.
+                         Only valid for attacks treating every sample independently (all the supported ones).
+        :param random_state: Seed from which the per-shard seeds are derived, so that a sharded run is reproducible
+                             for a given number of shards. Every batch attacked by execute_attack gets its own seeds.
+        :param count_queries: If True, the attack queries the model through a QueryCounter, which counts its queries
+                              (per sample for the PER_SAMPLE_ATTACKS) and answers repeated rows from a cache.
+        :param query_cache_rows: The maximum number of prediction rows cached by the QueryCounter.
+        :param store: An optional AdversarialStore, checked before generating and updated after.
+        :param model_digest: The digest of the attacked model, the store is only used when it is known.
         """
         self.attack_config = attack_config
         self.model = model
         self.clip_values = clip_values
+        self.n_shards = n_shards
+        self.random_state = random_state
+        self.seed_sequence = np.random.SeedSequence(random_state)
+        self.batch_index = 0
+        self.count_queries = count_queries
+        self.query_cache_rows = query_cache_rows
+        self.store = store if model_digest is not None else None
+        self.model_digest = model_digest
+        self.query_counter = QueryCounter(model, max_rows=query_cache_rows) if count_queries else None
+        self.shard_queries = [0, 0]
+        self.sample_queries = []
         self.attack = self.initialize_attack()
 
     def initialize_attack(self):
@@ -26,6 +79,7 @@ class AttackExecutor:
         :return: An instance of the specified attack.
         """
         attack_name = self.attack_config['name']
+        model = self.query_counter.estimator if self.query_counter is not None else self.model
         if attack_name == 'ZooAttack':
             max_iter = self.attack_config.get('max_iter')
             targeted = self.attack_config.get('targeted')
@@ -40,7 +94,7 @@ class AttackExecutor:
             use_resize = self.attack_config.get('use_resize')
             variable_h = self.attack_config.get('variable_h')
 
-            attack = ZooAttack(classifier=self.model, max_iter=max_iter,learning_rate=learning_rate,
+            attack = ZooAttack(classifier=model, max_iter=max_iter,learning_rate=learning_rate,
                                binary_search_steps=binary_search_steps,use_resize=use_resize,variable_h=variable_h,confidence=confidence,initial_const=initial_const,
                                batch_size=batch_size,use_importance=use_importance,nb_parallel=nb_parallel,abort_early=abort_early)
             return attack
@@ -54,7 +108,7 @@ class AttackExecutor:
             norm = np.inf
             batch_size = self.attack_config.get('norm')
             targeted = self.attack_config.get('targeted')
-            attack = HopSkipJump(classifier=self.model,max_iter=max_iter,
+            attack = HopSkipJump(classifier=model,max_iter=max_iter,
                                  max_eval=max_eval,init_eval=init_eval,init_size=init_size,norm=norm,batch_size=batch_size,targeted=targeted)
             return attack
         
@@ -69,7 +123,7 @@ class AttackExecutor:
             beta = self.attack_config.get('beta')
             batch_size = self.attack_config.get('batch_size')
 
-            attack = SignOPTAttack(estimator=self.model,targeted=targeted,epsilon=epsilon,max_iter=max_iter,
+            attack = SignOPTAttack(estimator=model,targeted=targeted,epsilon=epsilon,max_iter=max_iter,
                                    num_trial=num_trial,query_limit=query_limit,k=k,alpha=alpha,beta=beta,verbose=True)
             attack.clip_min = self.clip_values[0]
             attack.clip_max = self.clip_values[1]
@@ -88,20 +142,20 @@ class AttackExecutor:
             min_epsilon = self.attack_config.get('min_epsilon')
 
 
-            attack = BoundaryAttack(estimator=self.model, max_iter=max_iter, batch_size=batch_size,
+            attack = BoundaryAttack(estimator=model, max_iter=max_iter, batch_size=batch_size,
                                     epsilon=epsilon,targeted=targeted,delta=delta,step_adapt=step_adapt,
                                     num_trial=num_trial,sample_size=sample_size,init_size=init_size,min_epsilon=min_epsilon)
             return attack
         
         elif attack_name == 'Papernot_DT_Attack':
             offset = self.attack_config.get('offset')
-            attack = DecisionTreeAttack(classifier=self.model, offset=offset)
+            attack = DecisionTreeAttack(classifier=model, offset=offset)
             return attack
         
         elif attack_name == 'SamplingAttack':
             eps = self.attack_config.get('eps')
             n_trials = self.attack_config.get('n_trials')
-            attack = SamplingAttack(estimator=self.model, eps=eps,n_trials=n_trials,min_val=self.clip_values[0], max_val=self.clip_values[1])
+            attack = SamplingAttack(estimator=model, eps=eps,n_trials=n_trials,min_val=self.clip_values[0], max_val=self.clip_values[1])
 
             return attack
         
@@ -109,7 +163,7 @@ class AttackExecutor:
             eps = self.attack_config.get('eps')
             n_trials = self.attack_config.get('n_trials')
             p = self.attack_config.get('p')
-            attack = CubeAttack(estimator=self.model, eps=eps,n_trials=n_trials, p=p)
+            attack = CubeAttack(estimator=model, eps=eps,n_trials=n_trials, p=p)
 
             return attack
         
@@ -118,10 +172,126 @@ class AttackExecutor:
 
     def execute_attack(self, x):
         """
-        Executes the initialized attack on the provided input data.
+        Executes the initialized attack on the provided input data. With a store, adversarial examples already
+        generated from the same model, input, attack parameters and seed are loaded instead, along with the
+        query counts of their generation.
         
-        :param x: The input data to be attacked.
+        :param x: The input data to be attacked, e.g. the next batch of the input.
         :return: The adversarially perturbed input data.
         """
+        batch_index = self.batch_index
+        self.batch_index += 1
+        if self.store is None:
+            return self.generate(x, batch_index)
+        key = AdversarialStore.make_key(self.model_digest, PredictionCache.hash_array(x), self.attack_config,
+                                        (self.random_state, self.n_shards, batch_index))
+        entry = self.store.get(key)
+        if entry is not None:
+            if self.count_queries and "queries" in entry:
+                self.shard_queries[0] += int(entry["queries"])
+                self.shard_queries[1] += int(entry["model_queries"])
+                if "sample_queries" in entry:
+                    self.sample_queries.append(entry["sample_queries"])
+            return entry["x_adv"]
+        before = self.get_query_counts()
+        n_sample_queries = len(self.sample_queries)
+        x_adv = self.generate(x, batch_index)
+        arrays = {"x_adv": x_adv}
+        if before is not None:
+            after = self.get_query_counts()
+            arrays["queries"] = after["queries"] - before["queries"]
+            arrays["model_queries"] = after["model_queries"] - before["model_queries"]
+            if len(self.sample_queries) > n_sample_queries:
+                arrays["sample_queries"] = np.concatenate(self.sample_queries[n_sample_queries:])
+        self.store.put(key, **arrays)
+        return x_adv
+
+    def generate(self, x, batch_index=0):
+        """
+        Generates the adversarial examples of x with the initialized attack.
+
+        :param batch_index: The index of x among the batches of the input, from which the shard seeds are derived.
+        """
+        if self.n_shards and self.n_shards > 1 and len(x) > 1:
+            return self.execute_sharded(x, batch_index)
+        if self.query_counter is not None and self.attack_config['name'] in PER_SAMPLE_ATTACKS:
+            x_adv = []
+            sample_queries = np.zeros(len(x), dtype=np.int64)
+            for i in range(len(x)):
+                queries = self.query_counter.queries
+                x_adv.append(self.attack.generate(x=x[i:i + 1]))
+                sample_queries[i] = self.query_counter.queries - queries
+            self.sample_queries.append(sample_queries)
+            return np.concatenate(x_adv) if x_adv else self.attack.generate(x=x)
         x_adv = self.attack.generate(x=x)
         return x_adv
+
+    def reset_query_counts(self):
+        if self.query_counter is not None:
+            self.query_counter.queries = 0
+            self.query_counter.model_queries = 0
+        self.shard_queries = [0, 0]
+        self.sample_queries = []
+
+    def get_query_counts(self):
+        """
+        Returns the queries sent to the model by the executed attacks, None if they are not counted.
+        
+        :return: A dictionary with the queried rows, the rows the model actually predicted (after the cache)
+                 and the queries per sample (None if the attack does not run sample by sample).
+        """
+        if not self.count_queries:
+            return None
+        return {
+            "queries": self.query_counter.queries + self.shard_queries[0],
+            "model_queries": self.query_counter.model_queries + self.shard_queries[1],
+            "sample_queries": np.concatenate(self.sample_queries) if self.sample_queries else None,
+        }
+
+    def get_query_metrics(self, n_samples):
+        """
+        Returns the query cost of the executed attacks as metrics, to be reported next to the accuracy.
+        
+        :param n_samples: The number of attacked samples.
+        """
+        counts = self.get_query_counts()
+        if counts is None:
+            return {}
+        metrics = {
+            "queries": int(counts["queries"]),
+            "model_queries": int(counts["model_queries"]),
+            "queries_per_sample": counts["queries"] / n_samples if n_samples else 0.0,
+        }
+        if counts["sample_queries"] is not None and len(counts["sample_queries"]):
+            metrics["max_queries_per_sample"] = int(counts["sample_queries"].max())
+        return metrics
+
+    def execute_sharded(self, x, batch_index=0):
+        """
+        Executes the attack on row shards of x in a pool of worker processes and stitches the shards back in order.
+        The workers read x from a memory-mapped copy instead of receiving it with every shard.
+        
+        :param x: The input data to be attacked.
+        :param batch_index: The index of x among the batches of the input. Every (batch, shard) pair is seeded from
+                            its own SeedSequence child, so the batches do not replay the same random streams.
+        :return: The adversarially perturbed input data.
+        """
+        n_shards = min(self.n_shards, len(x))
+        bounds = np.linspace(0, len(x), n_shards + 1).astype(int)
+        batch_sequence = np.random.SeedSequence(self.seed_sequence.entropy, spawn_key=(batch_index,))
+        seeds = [seq.generate_state(1)[0] for seq in batch_sequence.spawn(n_shards)]
+        with tempfile.TemporaryDirectory(prefix="auto_defense_ml_shards_") as tmp_dir:
+            x_path = os.path.join(tmp_dir, "x.npy")
+            np.save(x_path, x)
+            with ProcessPoolExecutor(max_workers=n_shards, initializer=init_shard_worker,
+                                     initargs=(self.attack_config, self.model, self.clip_values, x_path,
+                                               self.count_queries, self.query_cache_rows)) as pool:
+                shards = list(pool.map(run_shard, bounds[:-1], bounds[1:], seeds))
+        for _, counts in shards:
+            if counts is not None:
+                self.shard_queries[0] += counts["queries"]
+                self.shard_queries[1] += counts["model_queries"]
+                if counts["sample_queries"] is not None:
+                    self.sample_queries.append(counts["sample_queries"])
+        x_adv = np.concatenate([x_shard for x_shard, _ in shards])
+        return x_adv
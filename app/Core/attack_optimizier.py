@@ -1,10 +1,47 @@
-from skopt import gp_minimize
+from skopt import gp_minimize, Optimizer
 from skopt.space import Real, Integer
+from skopt.utils import create_result
 from app.Core.metrics_evaluator import MetricsEvaluator
 from app.Core.attack_executor import AttackExecutor
+from app.Core.successive_halving import SuccessiveHalving
+from app.Core.trial_store import TrialStore
 from app.data_loader import DataLoader
+from app.config import pipeline_settings
+from concurrent.futures import ProcessPoolExecutor
 import numpy as np
 
+# State of an optimization worker, set once by init_worker so that the model and data are not sent with every candidate
+worker_state = {}
+
+def evaluate_attack_config(attack_config, classifier, x, y, clip_values):
+    """
+    Runs an attack configuration and evaluates the model on its adversarial examples.
+
+    :return: The accuracy on the adversarial examples and their mean L2 perturbation.
+    """
+    executor = AttackExecutor(attack_config, classifier, clip_values)
+    x_adv = executor.execute_attack(x)
+    evaluator = MetricsEvaluator(classifier, x_adv, y)
+    metrics = evaluator.get_metrics()
+    # Calculate the perturbation size
+    perturbation = np.mean(np.linalg.norm(x - x_adv, axis=1))
+    return metrics['overall_accuracy'], perturbation
+
+def init_worker(classifier, x, y, clip_values):
+    worker_state.update(classifier=classifier, x=x, y=y, clip_values=clip_values)
+
+def run_candidate(attack_config):
+    """
+    Evaluates one candidate configuration in an optimization worker.
+
+    :return: The accuracy and perturbation, or an infinite accuracy and None if the attack failed.
+    """
+    try:
+        return evaluate_attack_config(attack_config, worker_state["classifier"], worker_state["x"], worker_state["y"], worker_state["clip_values"])
+    except Exception as e:
+        print(f"Error during attack optimization execution: {e}")
+        return float('inf'), None
+
 class AttackOptimizier:
     def __init__(self,attack, dataloader, classifier, logger=None):
         self.attack = attack
@@ -85,32 +122,67 @@ class AttackOptimizier:
 
          
 
-    def optimize(self):
-        # Define the objective function to be minimized
+    def validate_budget(self, n_calls, n_initial_points, n_parallel_calls, y0):
+        """
+        Checks the search budget of the attack configuration.
+
+        :param y0: The stored trials, which may replace the initial points.
+        :raises ValueError: If the budget does not allow a single evaluation.
+        """
         attack_name = self.attack['name']
-        def objective(params):
-            attack_config = self.attack.copy()      
-            if attack_name in self.attack_param_mapping:
-                param_names = self.attack_param_mapping[attack_name]
-                attack_params = dict(zip(param_names, params))
+        if not isinstance(n_calls, int) or n_calls < 1:
+            raise ValueError(f"attack_optimizier.optimize()::{attack_name}: n_calls must be an integer >= 1, got {n_calls}")
+        if not isinstance(n_initial_points, int) or (n_initial_points < 1 and not y0):
+            raise ValueError(f"attack_optimizier.optimize()::{attack_name}: n_initial_points must be an integer >= 1 "
+                             f"when no stored trials warm-start the optimizer, got {n_initial_points}")
+        if not isinstance(n_parallel_calls, int) or n_parallel_calls < 1:
+            raise ValueError(f"attack_optimizier.optimize()::{attack_name}: n_parallel_calls must be an integer >= 1, got {n_parallel_calls}")
 
-                attack_params = self.validate_parameters_format(attack_params)
+    def get_study_key(self):
+        """
+        Identifies this optimization (model file, test data, attack and its fixed parameters) in the trial store.
+        The optimized parameters and the search budget are left out, so that every run of the study shares its trials.
+        """
+        excluded = set(self.attack_param_mapping[self.attack['name']]) | {'n_calls', 'n_initial_points', 'n_parallel_calls'}
+        config = {key: value for key, value in self.attack.items() if key not in excluded}
+        return TrialStore.make_key("attack", self.__dataloader.model_digest, self.__dataloader.data_digest, config)
 
-                attack_config.update(attack_params)
-            else:
-                raise ValueError(f"Unsupported attack for optimization: {attack_name}")
-            
-            try:
-                executor = AttackExecutor(attack_config, self.__classifier, self.__dataloader.clip_values)
-                x_adv = executor.execute_attack(self.__dataloader.x)
-                evaluator = MetricsEvaluator(self.__classifier, x_adv, self.__dataloader.y)
-                metrics = evaluator.get_metrics()
+    def get_attack_config(self, params):
+        attack_name = self.attack['name']
+        attack_config = self.attack.copy()      
+        if attack_name in self.attack_param_mapping:
+            param_names = self.attack_param_mapping[attack_name]
+            attack_params = dict(zip(param_names, params))
 
-                # Calculate the perturbation size 
-                perturbation = np.mean(np.linalg.norm(self.__dataloader.x - x_adv, axis=1))         
+            attack_params = self.validate_parameters_format(attack_params)
+
+            attack_config.update(attack_params)
+        else:
+            raise ValueError(f"Unsupported attack for optimization: {attack_name}")
+        return attack_config
+
+    def optimize(self):
+        # Define the objective function to be minimized
+        attack_name = self.attack['name']
+        n_calls = self.attack.get('n_calls', 10)
+        n_initial_points = self.attack.get('n_initial_points', 10)
+        n_parallel_calls = self.attack.get('n_parallel_calls', 1)
+        store = TrialStore(pipeline_settings["trial_store"]) if pipeline_settings["trial_store"] else None
+        study = self.get_study_key() if store is not None else None
+        x0, y0 = store.get_trials(study) if store is not None else ([], [])
+        self.validate_budget(n_calls, n_initial_points, n_parallel_calls, y0)
+        def objective(params, indices=None):
+            attack_config = self.get_attack_config(params)
+            x, y = self.__dataloader.x, self.__dataloader.y
+            if indices is not None: # subsampled evaluation of successive halving
+                x, y = x[indices], y[indices]
+            try:
+                accuracy, perturbation = evaluate_attack_config(attack_config, self.__classifier, x, y, self.__dataloader.clip_values)
                 # Combine the objectives
-                combined_objective = metrics['overall_accuracy']
-                self.update_logger(attack_config,params,perturbation,metrics['overall_accuracy'] )
+                combined_objective = accuracy
+                self.update_logger(attack_config,params,perturbation,accuracy)
+                if store is not None and indices is None:
+                    store.add_trial(study, params, combined_objective)
                 return combined_objective
             except Exception as e:
                 # Handle potential errors during attack execution and evaluation
@@ -120,7 +192,22 @@ class AttackOptimizier:
             
 
         # Perform Bayesian optimization
-        result = gp_minimize(objective, self.space, n_calls=10, random_state=0)
+        if pipeline_settings["search_mode"] == "halving":
+            search = SuccessiveHalving(self.space, n_candidates=pipeline_settings["halving_candidates"],
+                                       min_samples=pipeline_settings["halving_min_samples"], eta=pipeline_settings["halving_eta"], random_state=0)
+            result = search.run(objective, self.__dataloader.y)
+            self.logger.info(f"OPTIMIZIER-HALVING::{attack_name}::{search.describe_budget(n_calls)}")
+        elif len(y0) >= n_calls:
+            # The study already has enough trials, answer from the store without running any attack
+            result = create_result(x0, y0, space=self.space)
+            self.logger.info(f"OPTIMIZIER-CACHED::{attack_name}::trials={len(y0)}")
+        elif n_parallel_calls > 1:
+            result = self.optimize_parallel(n_calls, n_initial_points, n_parallel_calls, x0, y0, store, study)
+        else:
+            # Warm-start from the stored trials, n_calls counting them too
+            n_remaining = n_calls - len(y0)
+            result = gp_minimize(objective, self.space, n_calls=n_remaining, n_initial_points=min(max(n_initial_points - len(y0), 0), n_remaining),
+                                 x0=x0 or None, y0=y0 or None, random_state=0)
         
         optimized_params = dict(zip(self.attack_param_mapping[attack_name], result.x))
         optimized_params = self.validate_parameters_format(optimized_params)
@@ -129,3 +216,28 @@ class AttackOptimizier:
         optimized_attack = self.attack.copy()
         optimized_attack.update(optimized_params)
         return optimized_attack
+
+    def optimize_parallel(self, n_calls, n_initial_points, n_parallel_calls, x0=None, y0=None, store=None, study=None):
+        """
+        Bayesian optimization evaluating n_parallel_calls candidates at a time: each round asks the optimizer
+        for a batch of points, runs their attacks concurrently in worker processes and tells it the results.
+        The optimizer is warm-started with the stored trials x0, y0, and new trials are recorded in store.
+
+        :return: The skopt OptimizeResult of the last round.
+        """
+        optimizer = Optimizer(self.space, base_estimator="GP", n_initial_points=max(n_initial_points - len(y0 or []), 0), random_state=0)
+        result = optimizer.tell(x0, y0) if y0 else None
+        initargs = (self.__classifier, self.__dataloader.x, self.__dataloader.y, self.__dataloader.clip_values)
+        with ProcessPoolExecutor(max_workers=n_parallel_calls, initializer=init_worker, initargs=initargs) as pool:
+            while len(optimizer.yi) < n_calls:
+                candidates = optimizer.ask(n_points=min(n_parallel_calls, n_calls - len(optimizer.yi)))
+                attack_configs = [self.get_attack_config(params) for params in candidates]
+                objectives = []
+                for attack_config, params, (accuracy, perturbation) in zip(attack_configs, candidates, pool.map(run_candidate, attack_configs)):
+                    if perturbation is not None:
+                        self.update_logger(attack_config, params, perturbation, accuracy)
+                    if store is not None:
+                        store.add_trial(study, params, accuracy)
+                    objectives.append(accuracy)
+                result = optimizer.tell(candidates, objectives)
+        return result
@@ -0,0 +1,112 @@
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import os
+import re
+import tempfile
+import numpy as np
+from app.Core.attack_executor import AttackExecutor
+
+# State of a pool worker, set once by init_worker so that the model and x are not sent with every task
+worker_state = {}
+
+def spill_path(spill_dir, name):
+    """
+    Returns the path of the .npy file under which the array called name is spilled.
+    """
+    return os.path.join(spill_dir, re.sub(r"[^\w.-]+", "_", name) + ".npy")
+
+def write_batches(path, x, transform, batch_size=None):
+    """
+    Applies transform to x batch by batch, writing the result into a .npy file at path. The file is written under a
+    temporary name and then renamed, so a previous array at path that is still memory-mapped is never truncated.
+
+    :param path: The .npy file to write.
+    :param x: The input array, possibly memory-mapped.
+    :param transform: A callable mapping a batch of rows to a batch of the same number of rows.
+    :param batch_size: The number of rows transformed at once, all of them if None.
+    :return: The written array, memory-mapped read-only.
+    """
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".tmp_", suffix=".npy")
+    os.close(fd)
+    try:
+        if len(x) == 0:
+            np.save(tmp_path, transform(x))
+        else:
+            batch_size = batch_size or len(x)
+            x_out = None
+            for start in range(0, len(x), batch_size):
+                batch = transform(np.asarray(x[start:start + batch_size]))
+                if x_out is None:
+                    x_out = np.lib.format.open_memmap(tmp_path, mode="w+", dtype=batch.dtype, shape=(len(x),) + batch.shape[1:])
+                x_out[start:start + len(batch)] = batch
+            x_out.flush()
+            del x_out
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return np.load(path, mmap_mode="r")
+
+def init_worker(model, x_path):
+    """
+    Initializes a pool worker with the model and a read-only memory map of the shared input.
+    """
+    worker_state["model"] = model
+    worker_state["x"] = np.load(x_path, mmap_mode="r")
+
+def run_attack(attack_config, clip_values, out_path, batch_size=None, count_queries=False, query_cache_rows=100000,
+               store=None, model_digest=None):
+    """
+    Runs one attack in a pool worker on the shared input and spills the adversarial examples to out_path.
+
+    :return: The name of the attack, the path of its adversarial examples and its query metrics.
+    """
+    executor = AttackExecutor(attack_config=attack_config, model=worker_state["model"], clip_values=clip_values,
+                              count_queries=count_queries, query_cache_rows=query_cache_rows,
+                              store=store, model_digest=model_digest)
+    write_batches(out_path, worker_state["x"], executor.execute_attack, batch_size)
+    return attack_config['name'], out_path, executor.get_query_metrics(len(worker_state["x"]))
+
+class AttackPool:
+    """
+    The AttackPool class runs independent attacks concurrently in a pool of worker processes.
+    Each worker receives the model once, when it starts, and reads x from a memory-mapped .npy file.
+    The adversarial examples are returned the same way, so no array is pickled per task.
+    """
+    def __init__(self, model, n_workers, spill_dir):
+        """
+        Initializes the AttackPool.
+
+        :param model: The (ART wrapped) model to be attacked.
+        :param n_workers: The maximum number of worker processes.
+        :param spill_dir: The directory where the shared input and the adversarial examples are written.
+        """
+        self.model = model
+        self.n_workers = n_workers
+        self.spill_dir = spill_dir
+
+    def run(self, attacks, x, clip_values, batch_size=None, count_queries=False, query_cache_rows=100000,
+            store=None, model_digest=None):
+        """
+        Runs the attacks on x and yields their results in completion order.
+
+        :param attacks: The attack configurations.
+        :param x: The input data to be attacked.
+        :param clip_values: The clip values passed to every AttackExecutor.
+        :param batch_size: If set, the workers attack x batch by batch.
+        :param count_queries: If True, the queries of each attack are counted (see AttackExecutor).
+        :param query_cache_rows: The maximum number of prediction rows cached per attack.
+        :param store: An optional AdversarialStore the workers check before generating (see AttackExecutor).
+        :param model_digest: The digest of the model, identifying it in the store.
+        :return: A generator of (attack name, memory-mapped adversarial examples, query metrics).
+        """
+        x_path = spill_path(self.spill_dir, "x_shared")
+        write_batches(x_path, x, lambda batch: batch, batch_size)
+        n_workers = max(1, min(self.n_workers, len(attacks)))
+        with ProcessPoolExecutor(max_workers=n_workers, initializer=init_worker, initargs=(self.model, x_path)) as pool:
+            futures = [pool.submit(run_attack, att, clip_values, spill_path(self.spill_dir, f"adv_{att['name']}"), batch_size,
+                                   count_queries, query_cache_rows, store, model_digest)
+                       for att in attacks]
+            for future in as_completed(futures):
+                name, path, query_metrics = future.result()
+                yield name, np.load(path, mmap_mode="r"), query_metrics
@@ -1,8 +1,268 @@
 from sklearn.tree import DecisionTreeClassifier
 from sklearn.ensemble import RandomForestClassifier
 from sklearn.utils.validation import check_is_fitted
+from sklearn.ensemble._base import _partition_estimators
+from joblib import Parallel, delayed
 import numpy as np
 from sklearn.tree import _tree
+import hashlib
+import threading
+
+
+try:
+    from numba import njit
+except ImportError:  # numba is optional, traverse_chunk_numpy is used instead
+    njit = None
+
+
+def traverse_chunk_numpy(feature, threshold, children_left, children_right, tables, X, samples, randoms, leaves):
+    """
+    Walks a chunk of Monte Carlo walkers down the tree level by level with NumPy array operations.
+    
+    Parameters:
+    - feature, threshold, children_left, children_right (array-like): The fitted tree arrays.
+    - tables (tuple): The node probability tables, see batch_traverse_tree.
+    - X (array-like): The validated input samples array.
+    - samples (array-like): The row of X that every walker is classifying.
+    - randoms (array-like): Uniform draws of shape (n_walkers, max_depth); walker w uses randoms[w, depth] at depth.
+    - leaves (array-like): Output buffer, filled with the leaf node ID reached by every walker.
+    """
+    base, center, scale, lower, upper, depth_step, depth_cap = tables
+    leaves[:] = 0
+    active = np.flatnonzero(feature[leaves] != _tree.TREE_UNDEFINED)
+    depth = 0
+    while active.size:
+        nodes = leaves[active]
+        values = X[samples[active], feature[nodes]]
+        go_left = values <= threshold[nodes]
+        p = base[nodes, (~go_left).view(np.int8)] - np.abs(values - center[nodes]) / scale[nodes]
+        p = np.clip(p, lower, upper) + min(depth_step * depth, depth_cap)
+        # Keep the sample's branch when rand > p, otherwise take the other one.
+        go_left ^= randoms[active, depth] <= p
+        leaves[active] = np.where(go_left, children_left[nodes], children_right[nodes])
+        active = active[feature[leaves[active]] != _tree.TREE_UNDEFINED]
+        depth += 1
+
+
+if njit is not None:
+    @njit(cache=True, nogil=True)
+    def traverse_chunk_numba(feature, threshold, children_left, children_right, base, center, scale, lower, upper,
+                             depth_step, depth_cap, X, samples, randoms, leaves):
+        # Same walk as traverse_chunk_numpy, one walker at a time, compiled by numba.
+        for walker in range(leaves.shape[0]):
+            node = 0
+            depth = 0
+            while feature[node] != -2:  # _tree.TREE_UNDEFINED
+                value = X[samples[walker], feature[node]]
+                go_left = value <= threshold[node]
+                p = base[node, 0 if go_left else 1] - abs(value - center[node]) / scale[node]
+                p = min(max(p, lower), upper) + min(depth_step * depth, depth_cap)
+                if randoms[walker, depth] <= p:
+                    go_left = not go_left
+                node = children_left[node] if go_left else children_right[node]
+                depth += 1
+            leaves[walker] = node
+else:
+    traverse_chunk_numba = None
+
+
+def get_seed_sequence(random_state):
+    """
+    Converts random_state into a SeedSequence from which independent random streams can be spawned.
+    
+    Parameters:
+    - random_state (None, int, SeedSequence, Generator or RandomState): None draws fresh entropy from the OS, an int or a
+                                                                         SeedSequence gives the same streams on every call,
+                                                                         a Generator/RandomState is advanced once per call.
+    
+    Returns:
+    - A numpy.random.SeedSequence.
+    """
+    if isinstance(random_state, np.random.SeedSequence):
+        return random_state
+    if isinstance(random_state, np.random.Generator):
+        return np.random.SeedSequence(int(random_state.integers(2**63)))
+    if isinstance(random_state, np.random.RandomState):
+        return np.random.SeedSequence(int(random_state.randint(2**31)))
+    return np.random.SeedSequence(random_state)
+
+
+def batch_traverse_tree(tree, X, n_simulations, tables, rng=None, chunk_size=65536, use_numba=None):
+    """
+    Moves n_simulations Monte Carlo walkers per sample down a fitted tree without recursion.
+    
+    Every prob_type is expressed through the same per-node tables, chosen once per prediction call, so that at an
+    internal node the probability of taking the opposite branch is
+    
+        clip(base[node, direction] - |x[feature[node]] - center[node]| / scale[node], lower, upper)
+        + min(depth_step * depth, depth_cap)
+    
+    where direction is 0 when the sample's value sends the walker left and 1 otherwise. Walkers are processed in
+    chunks of chunk_size, with one bulk draw from rng per chunk into a reused buffer, so the result only depends on
+    the state of rng.
+    
+    Parameters:
+    - tree (sklearn.tree._tree.Tree): The fitted tree structure to traverse.
+    - X (array-like): The validated input samples array.
+    - n_simulations (int): The number of walkers to simulate per sample.
+    - tables (tuple): (base, center, scale, lower, upper, depth_step, depth_cap) as described above.
+    - rng (numpy.random.Generator, optional): The random stream to draw from. Defaults to a freshly seeded Generator.
+    - chunk_size (int): The number of walkers simulated together.
+    - use_numba (bool, optional): Whether to use the numba kernel. Defaults to using it when numba is installed.
+    
+    Returns:
+    - leaves (array-like): The leaf node ID reached by every walker, of shape (n_samples, n_simulations).
+    """
+    if use_numba is None:
+        use_numba = traverse_chunk_numba is not None
+    if rng is None:
+        rng = np.random.default_rng()
+    X = np.ascontiguousarray(X)
+    feature, threshold = tree.feature, tree.threshold
+    children_left, children_right = tree.children_left, tree.children_right
+    n_walkers = X.shape[0] * n_simulations
+    leaves = np.empty(n_walkers, dtype=np.intp)
+    buffer = np.empty((min(chunk_size, n_walkers), tree.max_depth))
+    for start in range(0, n_walkers, chunk_size):
+        stop = min(start + chunk_size, n_walkers)
+        samples = np.arange(start, stop) // n_simulations
+        randoms = buffer[:stop - start]
+        rng.random(out=randoms)
+        if use_numba:
+            traverse_chunk_numba(feature, threshold, children_left, children_right, *tables, X, samples, randoms, leaves[start:stop])
+        else:
+            traverse_chunk_numpy(feature, threshold, children_left, children_right, tables, X, samples, randoms, leaves[start:stop])
+    return leaves.reshape(X.shape[0], n_simulations)
+
+
+def node_feature_values(tree, feature_values, leaf_value=0.0):
+    """
+    Looks up a per-feature value for every node, by the feature the node splits on.
+    
+    Parameters:
+    - tree (Tree): The sklearn tree structure.
+    - feature_values (array-like): One value per feature.
+    - leaf_value (float): The value of the leaves, which split on no feature (tree.feature is -2).
+    
+    Returns:
+    - The per-node values, of shape (node_count,).
+    """
+    is_leaf = tree.feature < 0
+    values = np.asarray(feature_values, dtype=np.float64)[np.where(is_leaf, 0, tree.feature)]
+    return np.where(is_leaf, leaf_value, values)
+
+
+def average_leaf_values(node_values, leaves):
+    """
+    Averages node_values over the simulations of every sample, reusing one preallocated buffer.
+    
+    Parameters:
+    - node_values (array-like): Per-node values of shape (node_count, n_classes).
+    - leaves (array-like): Leaf node IDs of shape (n_samples, n_simulations), as returned by batch_traverse_tree.
+    
+    Returns:
+    - The summed leaf values per sample, of shape (n_samples, n_classes).
+    """
+    total = np.zeros((leaves.shape[0], node_values.shape[1]), dtype=np.float64)
+    buffer = np.empty_like(total)
+    for simulation in range(leaves.shape[1]):
+        np.take(node_values, leaves[:, simulation], axis=0, out=buffer)
+        total += buffer
+    return total
+
+
+def adaptive_average(simulate, n_samples, n_simulations, min_simulations, confidence_interval):
+    """
+    Averages per-simulation class values, simulating further only the samples whose estimate has not converged.
+    
+    Simulations are run in rounds of min_simulations. After every round a sample stops once the 95% confidence
+    interval of its running class-probability estimate (1.96 standard errors, widest class) is within
+    +/- confidence_interval, or once it reached n_simulations.
+    
+    Parameters:
+    - simulate (callable): Called as simulate(rows, n) and returning the values of n new simulations for the given
+                           sample rows, of shape (len(rows), n, n_classes).
+    - n_samples (int): The number of samples.
+    - n_simulations (int): The maximum number of simulations per sample.
+    - min_simulations (int): The number of simulations per round, and the minimum per sample.
+    - confidence_interval (float): The half-width of the confidence interval at which a sample stops.
+    
+    Returns:
+    - proba (array-like): The averaged class values per sample.
+    - counts (array-like): The number of simulations run for every sample.
+    """
+    counts = np.zeros(n_samples, dtype=np.intp)
+    total, total_sq = None, None
+    active = np.arange(n_samples)
+    while active.size:
+        n = min(max(min_simulations, 1), n_simulations - counts[active[0]])
+        values = simulate(active, n)
+        if total is None:
+            total = np.zeros((n_samples, values.shape[2]))
+            total_sq = np.zeros((n_samples, values.shape[2]))
+        total[active] += values.sum(axis=1)
+        total_sq[active] += np.square(values).sum(axis=1)
+        counts[active] += n
+
+        # All active samples share the same count, so they reach the cap together.
+        active_counts = counts[active][:, None]
+        mean = total[active] / active_counts
+        variance = np.maximum(total_sq[active] / active_counts - np.square(mean), 0)
+        half_width = 1.96 * np.sqrt(variance / active_counts).max(axis=1)
+        active = active[(half_width > confidence_interval) & (counts[active] < n_simulations)]
+    return total / counts[:, None], counts
+
+
+class ProbabilityTableCache:
+    """
+    Caches the values the TTTS probability functions need but that never change between simulations:
+    per-node tables derived from a fitted tree (built once per tree) and per-feature statistics of the reference X.
+    
+    Node tables are dropped when the set of bound trees changes (e.g. after refitting), and the feature statistics
+    are recomputed when the content of the reference X changes. An X modified in place is recognised by its content
+    hash only when a different array object is passed in.
+    """
+    def __init__(self):
+        self.trees = ()
+        self.node_tables = {}
+        self.X = None
+        self.X_digest = None
+        self.feature_mean = None
+        self.feature_std = None
+
+    def bind(self, trees):
+        """
+        Sets the trees the node tables belong to, invalidating the tables if any of them was replaced.
+        
+        Parameters:
+        - trees (list): The fitted sklearn.tree._tree.Tree objects currently used by the classifier.
+        """
+        if len(trees) != len(self.trees) or any(new is not old for new, old in zip(trees, self.trees)):
+            self.trees = tuple(trees)
+            self.node_tables = {}
+
+    def node_table(self, tree, name, build):
+        """
+        Returns the table called name for tree, building it with build(tree) on first use.
+        """
+        tables = self.node_tables.setdefault(id(tree), {})
+        if name not in tables:
+            tables[name] = build(tree)
+        return tables[name]
+
+    def feature_statistics(self, X):
+        """
+        Returns the per-feature mean and standard deviation of X, recomputing them only when X changes.
+        """
+        if X is not self.X:
+            digest = (X.shape, X.dtype.str, hashlib.sha1(np.ascontiguousarray(X).view(np.uint8)).hexdigest())
+            if digest != self.X_digest:
+                self.feature_mean = np.mean(X, axis=0)
+                self.feature_std = np.std(X, axis=0)
+                self.X_digest = digest
+            self.X = X
+        return self.feature_mean, self.feature_std
+
 
 class MonteCarloDecisionTreeClassifier(DecisionTreeClassifier):
     """
@@ -18,12 +278,20 @@ class MonteCarloDecisionTreeClassifier(DecisionTreeClassifier):
     prob_type (str):    Specifies the type of probability utilized for decision-making at each node. 
                         Available options are 'fixed', 'depth', 'certainty', 'agreement', 'distance', 'confidence', and 'bayes'.
     n_simulations (int): Determines the number of simulations to perform for each prediction to compute the average probabilities.
+                         In adaptive mode this is the maximum number of simulations per sample.
+    adaptive (bool):    If True, samples stop being simulated once their running estimate has converged, see adaptive_average.
+    min_simulations (int): The number of simulations per round in adaptive mode.
+    confidence_interval (float): The confidence interval half-width at which a sample stops in adaptive mode.
+    simulation_random_state (None, int, SeedSequence or Generator): Seeds the simulations, see get_seed_sequence.
+                        With an int, predict_proba returns bit-identical results across calls and runs.
+
+    After predict_proba, simulation_counts_ holds the number of simulations run for every sample.
 
     Additional parameters are derived from the base class, DecisionTreeClassifier.
 
     """
     
-    def __init__(self, prob_type='depth', n_simulations=10, criterion='gini', splitter='best', max_depth=None, min_samples_split=2, min_samples_leaf=1, min_weight_fraction_leaf=0.0, max_features=None, random_state=None, max_leaf_nodes=None, min_impurity_decrease=0.0, class_weight=None, ccp_alpha=0.0):
+    def __init__(self, prob_type='depth', n_simulations=10, adaptive=False, min_simulations=2, confidence_interval=0.05, simulation_random_state=None, criterion='gini', splitter='best', max_depth=None, min_samples_split=2, min_samples_leaf=1, min_weight_fraction_leaf=0.0, max_features=None, random_state=None, max_leaf_nodes=None, min_impurity_decrease=0.0, class_weight=None, ccp_alpha=0.0):
         # Initialize the superclass with the provided parameters.
         super().__init__(criterion=criterion, splitter=splitter, max_depth=max_depth, min_samples_split=min_samples_split, min_samples_leaf=min_samples_leaf, min_weight_fraction_leaf=min_weight_fraction_leaf, max_features=max_features, random_state=random_state, max_leaf_nodes=max_leaf_nodes, min_impurity_decrease=min_impurity_decrease, class_weight=class_weight, ccp_alpha=ccp_alpha)
         # Validate and set the probability type and number of simulations.
@@ -31,6 +299,45 @@ class MonteCarloDecisionTreeClassifier(DecisionTreeClassifier):
             raise ValueError('Invalid prob_type')
         self.prob_type = prob_type
         self.n_simulations = n_simulations
+        self.adaptive = adaptive
+        self.min_simulations = min_simulations
+        self.confidence_interval = confidence_interval
+        self.simulation_random_state = simulation_random_state
+
+    def get_probability_cache(self):
+        """
+        Returns the ProbabilityTableCache bound to the current tree_, creating it on first use.
+        """
+        if getattr(self, '_probability_cache', None) is None:
+            self._probability_cache = ProbabilityTableCache()
+        self._probability_cache.bind([self.tree_])
+        return self._probability_cache
+
+    def build_uncertainty_table(self, tree):
+        """
+        Builds the per-node 1 - majority class ratio (capped at 0.5) shared by the 'certainty' and 'agreement' types.
+        """
+        node_values = tree.value.reshape(tree.node_count, -1)
+        p = 1 - np.max(node_values, axis=1) / np.sum(node_values, axis=1)
+        return np.minimum(p, 0.5)
+
+    def build_distribution_table(self, tree):
+        """
+        Builds the per-node normalized class distribution averaged by predict_proba.
+        """
+        node_values = tree.value.reshape(tree.node_count, -1)
+        return node_values / node_values.sum(axis=1, keepdims=True)
+
+    def build_bayes_table(self, tree):
+        """
+        Builds the per-node Bayesian probability for walkers heading left (column 0) and right (column 1).
+        """
+        parent_samples = tree.n_node_samples
+        is_leaf = (tree.children_left == _tree.TREE_LEAF) | (tree.children_right == _tree.TREE_LEAF)
+        p_child = np.stack([tree.n_node_samples[tree.children_left] / parent_samples,
+                            tree.n_node_samples[tree.children_right] / parent_samples], axis=1)
+        # P(parent | child) = P(child | parent) * P(parent) / P(child), see get_bayes_based_probability
+        return np.where(is_leaf[:, None], 0, 0.5 / p_child)
    
     def get_depth_based_probability(self, depth):
         """
@@ -54,12 +361,8 @@ class MonteCarloDecisionTreeClassifier(DecisionTreeClassifier):
         Returns:
         - Probability (float): A value representing uncertainty, based on the distribution of class samples at the node.
         """
-        node_values = self.tree_.value[node_id].flatten()
-        total = np.sum(node_values)
-        distribution = node_values / total
-        max_certainty = np.max(distribution)
-        p = 1 - max_certainty
-        return min(p, 0.5)
+        cache = self.get_probability_cache()
+        return cache.node_table(self.tree_, 'uncertainty', self.build_uncertainty_table)[node_id]
     
     def get_agreement_based_probability(self, node_id):
         """
@@ -71,10 +374,8 @@ class MonteCarloDecisionTreeClassifier(DecisionTreeClassifier):
         Returns:
         - Probability (float): A value representing uncertainty, based on the ratio of the majority class to total samples at the node.
         """
-        node_values = self.tree_.value[node_id].flatten()
-        majority_class_ratio = np.max(node_values) / np.sum(node_values)
-        p = 1 - majority_class_ratio
-        return min(p, 0.5)
+        cache = self.get_probability_cache()
+        return cache.node_table(self.tree_, 'uncertainty', self.build_uncertainty_table)[node_id]
     
     def get_distance_based_probability(self, node_id, sample):
         """
@@ -89,7 +390,7 @@ class MonteCarloDecisionTreeClassifier(DecisionTreeClassifier):
         """
         feature_index = self.tree_.feature[node_id]
         distance = abs(sample[feature_index] - self.tree_.threshold[node_id])
-        max_distance = np.max(abs(self.tree_.threshold))
+        max_distance = self.get_probability_cache().node_table(self.tree_, 'max_distance', lambda tree: np.max(abs(tree.threshold)))
         p = 0.1-min((distance/max_distance),0.1)
         return min(p, 0.5)
 
@@ -109,9 +410,9 @@ class MonteCarloDecisionTreeClassifier(DecisionTreeClassifier):
         if feature_index == _tree.TREE_UNDEFINED:
             return 0
         
-        feature_values = X[:, feature_index]
-        avg = np.mean(feature_values)
-        std = np.std(feature_values)
+        feature_mean, feature_std = self.get_probability_cache().feature_statistics(X)
+        avg = feature_mean[feature_index]
+        std = feature_std[feature_index]
         
         distance = abs(sample[feature_index] - avg)
         p = max(0.1 - (distance / (std + 1e-9)), 0)
@@ -148,9 +449,61 @@ class MonteCarloDecisionTreeClassifier(DecisionTreeClassifier):
         p_parent_given_child = p_child_given_parent * p_parent / p_child
         return p_parent_given_child
     
+    def get_probability_function(self):
+        """
+        Selects the per-node probability function for the configured prob_type.
+        
+        Returns:
+        - A callable (node, sample, X, depth) -> probability, built on the get_*_based_probability methods.
+        """
+        if self.prob_type == 'fixed':
+            return lambda node, sample, X, depth: 0.05
+        elif self.prob_type == 'depth':
+            return lambda node, sample, X, depth: self.get_depth_based_probability(depth)
+        elif self.prob_type == 'certainty':
+            return lambda node, sample, X, depth: self.get_certainty_based_probability(node)
+        elif self.prob_type == 'agreement':
+            return lambda node, sample, X, depth: self.get_agreement_based_probability(node)
+        elif self.prob_type == 'distance':
+            return lambda node, sample, X, depth: self.get_distance_based_probability(node, sample)
+        elif self.prob_type == 'confidence':
+            return lambda node, sample, X, depth: self.get_confidence_based_probability(X, node, sample)
+        elif self.prob_type == 'bayes':
+            return lambda node, sample, X, depth: self.get_bayes_based_probability(node, sample)
+        else:
+            raise ValueError('Invalid prob_type')
+
+    def find_leaf(self, node, sample, X, depth=0, rng=None):
+        """
+        Iteratively walks the tree from node for a single sample, with a probabilistic decision at each node.
+        
+        Parameters:
+        - node (int): The node ID to start from.
+        - sample (array-like): The input sample being classified.
+        - X (array-like): The input samples array.
+        - depth (int): The depth of the starting node in the tree.
+        - rng (numpy.random.Generator, optional): The random stream to draw from. Defaults to the global np.random.
+        
+        Returns:
+        - The ID of the leaf reached.
+        """
+        probability = self.get_probability_function()
+        rng = np.random if rng is None else rng
+        feature, threshold = self.tree_.feature, self.tree_.threshold
+        children_left, children_right = self.tree_.children_left, self.tree_.children_right
+        while feature[node] != _tree.TREE_UNDEFINED:
+            p = probability(node, sample, X, depth)
+            go_left = sample[feature[node]] <= threshold[node]
+            # follow the sample's branch with high probability
+            if rng.random() <= p:
+                go_left = not go_left
+            node = children_left[node] if go_left else children_right[node]
+            depth += 1
+        return node
+
     def traverse_tree(self, node, sample, X, depth=0):
         """
-        Recursively traverses the tree to classify a sample, with a probabilistic decision at each node.
+        Traverses the tree to classify a single sample, with a probabilistic decision at each node.
         
         Parameters:
         - node (int): The current node ID in the tree.
@@ -161,47 +514,53 @@ class MonteCarloDecisionTreeClassifier(DecisionTreeClassifier):
         Returns:
         - The predicted class probabilities for the input sample.
         """
-        # Determine the probability type and calculate the probability for the current node.
+        return self.tree_.value[self.find_leaf(node, sample, X, depth)]
+
+    def get_node_probability_tables(self, X):
+        """
+        Expresses the configured prob_type as the per-node tables used by batch_traverse_tree.
+        
+        Parameters:
+        - X (array-like): The input samples array, used by the 'confidence' type.
+        
+        Returns:
+        - A tuple (base, center, scale, lower, upper, depth_step, depth_cap).
+        """
+        tree = self.tree_
+        cache = self.get_probability_cache()
+        base = np.zeros((tree.node_count, 2))
+        center = np.zeros(tree.node_count)
+        scale = np.full(tree.node_count, np.inf)
+        lower, upper, depth_step, depth_cap = 0.0, np.inf, 0.0, 0.0
         if self.prob_type == 'fixed':
-            p = 0.05
+            base[:] = 0.05
         elif self.prob_type == 'depth':
-            p = self.get_depth_based_probability(depth)
-        elif self.prob_type == 'certainty':
-            p = self.get_certainty_based_probability(node)
-        elif self.prob_type == 'agreement':
-            p = self.get_agreement_based_probability(node)
+            depth_step, depth_cap = 0.05, 0.2
+        elif self.prob_type in ('certainty', 'agreement'):
+            base[:] = cache.node_table(tree, 'uncertainty', self.build_uncertainty_table)[:, None]
         elif self.prob_type == 'distance':
-            p = self.get_distance_based_probability(node, sample)
+            base[:] = 0.1
+            center = tree.threshold
+            scale[:] = cache.node_table(tree, 'max_distance', lambda tree: np.max(np.abs(tree.threshold)))
+            upper = 0.5
         elif self.prob_type == 'confidence':
-            p = self.get_confidence_based_probability(X, node, sample)
+            feature_mean, feature_std = cache.feature_statistics(X)
+            base[:] = 0.1
+            base[tree.feature < 0] = 0
+            center = node_feature_values(tree, feature_mean)
+            scale = node_feature_values(tree, feature_std, np.inf) + 1e-9
         elif self.prob_type == 'bayes':
-            p = self.get_bayes_based_probability(node, sample)
+            base = cache.node_table(tree, 'bayes', self.build_bayes_table)
         else:
             raise ValueError('Invalid prob_type')
-
-        # Traverse the tree based on the calculated probability and the sample's feature value.
-        if self.tree_.feature[node] != _tree.TREE_UNDEFINED:
-            # internal node
-            if sample[self.tree_.feature[node]] <= self.tree_.threshold[node]:
-                # go to the left child with high probability
-                if np.random.rand() > p:
-                    return self.traverse_tree(self.tree_.children_left[node], sample, X, depth + 1)
-                else:
-                    return self.traverse_tree(self.tree_.children_right[node], sample, X, depth + 1)
-            else:
-                # go to the right child with high probability
-                if np.random.rand() > p:
-                    return self.traverse_tree(self.tree_.children_right[node], sample, X, depth + 1)
-                else:
-                    return self.traverse_tree(self.tree_.children_left[node], sample, X, depth + 1)
-        else:
-            # leaf
-            return self.tree_.value[node]
+        return base, center, scale, lower, upper, depth_step, depth_cap
 
     def predict_proba(self, X, n_simulations=None):
         """
         Predict class probabilities for X, averaging over multiple simulations.
         
+        All (sample x simulation) walkers are moved down the tree together by batch_traverse_tree.
+        
         Parameters:
         - X (array-like): The input samples array.
         - n_simulations (int, optional): The number of simulations to run for each sample. Defaults to the value set in the constructor.
@@ -217,15 +576,20 @@ class MonteCarloDecisionTreeClassifier(DecisionTreeClassifier):
         check_is_fitted(self)
         X = super()._validate_X_predict(X, check_input=True)
 
-        # Predict class probabilities for each sample, averaging over multiple simulations.
-        proba = []
-        for x in X:
-            simulation_results = [self.traverse_tree(0, x, X).ravel() for _ in range(n_simulations)]
-            simulation_results = [arr/arr.sum() for arr in simulation_results]
-            mean_proba = np.mean(simulation_results, axis=0)
-            proba.append(mean_proba)
-
-        return np.array(proba)
+        tables = self.get_node_probability_tables(X)
+        node_distributions = self.get_probability_cache().node_table(self.tree_, 'distribution', self.build_distribution_table)
+        rng = np.random.default_rng(get_seed_sequence(self.simulation_random_state))
+        if self.adaptive:
+            # Simulate in rounds, only for the samples whose estimate has not converged yet.
+            def simulate(rows, n):
+                return node_distributions[batch_traverse_tree(self.tree_, X[rows], n, tables, rng)]
+            proba, self.simulation_counts_ = adaptive_average(simulate, X.shape[0], n_simulations, self.min_simulations, self.confidence_interval)
+            return proba
+
+        # Simulate all walkers at once and average the normalized leaf distributions they reached.
+        leaves = batch_traverse_tree(self.tree_, X, n_simulations, tables, rng)
+        self.simulation_counts_ = np.full(X.shape[0], n_simulations)
+        return average_leaf_values(node_distributions, leaves) / n_simulations
     
 
 
@@ -235,11 +599,18 @@ class MonteCarloRandomForestClassifier(RandomForestClassifier):
     This implementation is based on the paper titled 'TTTS: Tree Test Time Simulation for Enhancing Decision Tree Robustness
     Against Adversarial Examples,' authored by Cohen Seffi, Arbili Ofir, Mirsky Yisroel, and Rokach Lior, and published in
     the proceedings of the AAAI 2024 conference.
+
+    After predict_proba, simulation_counts_ holds the number of simulations run for every sample.
     """
 
     def __init__(
         self,
         prob_type="fixed",
+        n_simulations=10,
+        adaptive=False,
+        min_simulations=2,
+        confidence_interval=0.05,
+        simulation_random_state=None,
         n_estimators=100,
         criterion="gini",
         max_depth=None,
@@ -263,6 +634,12 @@ class MonteCarloRandomForestClassifier(RandomForestClassifier):
         """
         Initializes the MonteCarloRandomForestClassifier.
         :param prob_type: The type of probability calculation method to use for determining the traversal path at each node.
+        :param n_simulations: The number of simulations per tree and sample, the maximum number in adaptive mode.
+        :param adaptive: If True, samples stop being simulated once their running estimate has converged.
+        :param min_simulations: The number of simulations per round in adaptive mode.
+        :param confidence_interval: The confidence interval half-width at which a sample stops in adaptive mode.
+        :param simulation_random_state: Seeds the simulations, see get_seed_sequence. Every tree gets its own spawned
+                                        stream, so with an int the result is bit-identical for any n_jobs.
         """
         super().__init__(
             n_estimators=100,
@@ -276,7 +653,7 @@ class MonteCarloRandomForestClassifier(RandomForestClassifier):
             min_impurity_decrease=0.0,
             bootstrap=True,
             oob_score=False,
-            n_jobs=None,
+            n_jobs=n_jobs,
             random_state=None,
             verbose=0,
             warm_start=False,
@@ -296,6 +673,36 @@ class MonteCarloRandomForestClassifier(RandomForestClassifier):
         ]:
             raise ValueError("Invalid prob_type")
         self.prob_type = prob_type
+        self.n_simulations = n_simulations
+        self.adaptive = adaptive
+        self.min_simulations = min_simulations
+        self.confidence_interval = confidence_interval
+        self.simulation_random_state = simulation_random_state
+
+    def get_probability_cache(self):
+        # Return the ProbabilityTableCache bound to the current estimators_, creating it on first use.
+        if getattr(self, "_probability_cache", None) is None:
+            self._probability_cache = ProbabilityTableCache()
+        self._probability_cache.bind([estimator.tree_ for estimator in self.estimators_])
+        return self._probability_cache
+
+    def build_uncertainty_table(self, tree):
+        # Per-node 0.5 - majority class ratio (floored at 0), shared by the 'certainty' and 'agreement' types.
+        node_values = tree.value.reshape(tree.node_count, -1)
+        p = 0.5 - np.max(node_values, axis=1) / np.sum(node_values, axis=1)
+        return np.maximum(p, 0)
+
+    def build_bayes_table(self, tree):
+        # Per-node Bayesian probability, see get_bayes_based_probability; 0 at the leaves.
+        node_values = tree.value.reshape(tree.node_count, -1)
+        majority_ratio = np.max(node_values, axis=1) / np.sum(node_values, axis=1)
+        is_leaf = (tree.children_left == _tree.TREE_LEAF) | (tree.children_right == _tree.TREE_LEAF)
+        left_majority_ratio = majority_ratio[tree.children_left]
+        right_majority_ratio = majority_ratio[tree.children_right]
+        likelihood = left_majority_ratio * right_majority_ratio
+        marginal_likelihood = (left_majority_ratio + right_majority_ratio) / 2
+        posterior = likelihood * (majority_ratio / (marginal_likelihood + 1e-9))
+        return np.where(is_leaf, 0, np.maximum(0.5 - posterior, 0))
 
     # Probability computation methods based on different criteria:
 
@@ -305,19 +712,13 @@ class MonteCarloRandomForestClassifier(RandomForestClassifier):
 
     def get_certainty_based_probability(self, node_id, tree):
         # Compute probability based on the certainty of the classification at the node.
-        node_values = tree.value[node_id].flatten()
-        total = np.sum(node_values)
-        distribution = node_values / total
-        max_certainty = np.max(distribution)
-        p = 0.5 - max_certainty
-        return max(p, 0)
+        cache = self.get_probability_cache()
+        return cache.node_table(tree, "uncertainty", self.build_uncertainty_table)[node_id]
 
     def get_agreement_based_probability(self, node_id, tree):
         # Compute probability based on the agreement (majority class ratio) at the node.
-        node_values = tree.value[node_id].flatten()
-        majority_class_ratio = np.max(node_values) / np.sum(node_values)
-        p = 0.5 - majority_class_ratio
-        return max(p, 0)
+        cache = self.get_probability_cache()
+        return cache.node_table(tree, "uncertainty", self.build_uncertainty_table)[node_id]
 
     def get_confidence_based_probability(self, X, node_id, sample, tree):
         # Compute probability based on the confidence (distance from mean normalized by standard deviation).
@@ -325,9 +726,9 @@ class MonteCarloRandomForestClassifier(RandomForestClassifier):
         if feature_index == _tree.TREE_UNDEFINED:
             return 0
 
-        feature_values = X[:, feature_index]
-        avg = np.mean(feature_values)
-        std = np.std(feature_values)
+        feature_mean, feature_std = self.get_probability_cache().feature_statistics(X)
+        avg = feature_mean[feature_index]
+        std = feature_std[feature_index]
 
         distance = abs(sample[feature_index] - avg)
         p = max(0.5 - (distance / (std + 1e-9)), 0)
@@ -335,32 +736,9 @@ class MonteCarloRandomForestClassifier(RandomForestClassifier):
 
     def get_bayes_based_probability(self, node_id, sample, tree):
         # Compute Bayesian probability, considering the prior, likelihood, and marginal likelihood.
-        if (
-            tree.children_left[node_id] == _tree.TREE_LEAF
-            or tree.children_right[node_id] == _tree.TREE_LEAF
-        ):
-            # Can't calculate Bayesian probability at the leaf node.
-            return 0
-
-        parent_values = tree.value[node_id].flatten()
-        parent_samples = np.sum(parent_values)
-
-        left_child_values = tree.value[tree.children_left[node_id]].flatten()
-        right_child_values = tree.value[tree.children_right[node_id]].flatten()
-
-        prior = np.max(parent_values) / parent_samples
-
-        left_majority_ratio = np.max(left_child_values) / np.sum(left_child_values)
-        right_majority_ratio = np.max(right_child_values) / np.sum(right_child_values)
-        likelihood = left_majority_ratio * right_majority_ratio
-
-        marginal_likelihood = np.mean([left_majority_ratio, right_majority_ratio])
-
-        posterior = likelihood * (prior / (marginal_likelihood + 1e-9))
-
-        p = 0.5 - posterior
-        # Return the scaled posterior
-        return max(p, 0)
+        # The posterior only depends on the fitted node values, so it is looked up from a per-node table.
+        cache = self.get_probability_cache()
+        return cache.node_table(tree, "bayes", self.build_bayes_table)[node_id]
 
     def get_distance_based_probability(self, X, tree, node_id, sample):
         # Compute probability based on the distance of the sample's feature value from the threshold.
@@ -370,73 +748,134 @@ class MonteCarloRandomForestClassifier(RandomForestClassifier):
 
         threshold = tree.threshold[node_id]
         feature_value = sample[feature_index]
-        feature_values = X[:, feature_index]
         distance = abs(feature_value - threshold)
-        std = np.std(feature_values)
+        std = self.get_probability_cache().feature_statistics(X)[1][feature_index]
 
         # The closer the distance is to 0, the lower the probability
         p = max(0.5 - (distance / (std + 1e-9)), 0)
 
         return p
 
-    def traverse_tree(self, tree, node, sample, X, depth=0):
-        # Recursively traverse the tree to make a prediction for a sample.
+    def get_probability_function(self):
+        # Select the per-node probability function (node, sample, X, tree, depth) -> p for the configured prob_type.
         if self.prob_type == "fixed":
-            p = 0.05
+            return lambda node, sample, X, tree, depth: 0.05
         elif self.prob_type == "depth":
-            p = self.get_depth_based_probability(depth)
+            return lambda node, sample, X, tree, depth: self.get_depth_based_probability(depth)
         elif self.prob_type == "certainty":
-            p = self.get_certainty_based_probability(node, tree)
+            return lambda node, sample, X, tree, depth: self.get_certainty_based_probability(node, tree)
         elif self.prob_type == "agreement":
-            p = self.get_agreement_based_probability(node, tree)
+            return lambda node, sample, X, tree, depth: self.get_agreement_based_probability(node, tree)
         elif self.prob_type == "confidence":
-            p = self.get_confidence_based_probability(X, node, sample, tree)
+            return lambda node, sample, X, tree, depth: self.get_confidence_based_probability(X, node, sample, tree)
         elif self.prob_type == "bayes":
-            p = self.get_bayes_based_probability(node, sample, tree)
+            return lambda node, sample, X, tree, depth: self.get_bayes_based_probability(node, sample, tree)
         elif self.prob_type == "distance":
-            p = self.get_distance_based_probability(X, tree, node, sample)
+            return lambda node, sample, X, tree, depth: self.get_distance_based_probability(X, tree, node, sample)
         else:
             raise ValueError("Invalid prob_type")
 
-        # Decision to traverse left or right child node based on the computed probability.
-        if tree.feature[node] != _tree.TREE_UNDEFINED:
-            if sample[tree.feature[node]] <= tree.threshold[node]:
-                if np.random.rand() > p:
-                    return self.traverse_tree(
-                        tree, tree.children_left[node], sample, X, depth + 1
-                    )
-                else:
-                    return self.traverse_tree(
-                        tree, tree.children_right[node], sample, X, depth + 1
-                    )
-            else:
-                if np.random.rand() > p:
-                    return self.traverse_tree(
-                        tree, tree.children_right[node], sample, X, depth + 1
-                    )
-                else:
-                    return self.traverse_tree(
-                        tree, tree.children_left[node], sample, X, depth + 1
-                    )
+    def find_leaf(self, tree, node, sample, X, depth=0, rng=None):
+        # Iteratively walk tree from node for a single sample and return the ID of the leaf reached.
+        # rng is a numpy.random.Generator and defaults to the global np.random.
+        probability = self.get_probability_function()
+        rng = np.random if rng is None else rng
+        feature, threshold = tree.feature, tree.threshold
+        children_left, children_right = tree.children_left, tree.children_right
+        while feature[node] != _tree.TREE_UNDEFINED:
+            p = probability(node, sample, X, tree, depth)
+            go_left = sample[feature[node]] <= threshold[node]
+            # Decision to traverse left or right child node based on the computed probability.
+            if rng.random() <= p:
+                go_left = not go_left
+            node = children_left[node] if go_left else children_right[node]
+            depth += 1
+        return node
+
+    def traverse_tree(self, tree, node, sample, X, depth=0):
+        # Traverse the tree to make a prediction for a sample, returning the value at the leaf node.
+        return tree.value[self.find_leaf(tree, node, sample, X, depth)]
+
+    def get_node_probability_tables(self, tree, X):
+        # Express the configured prob_type as the per-node tables of batch_traverse_tree for one tree.
+        cache = self.get_probability_cache()
+        base = np.zeros((tree.node_count, 2))
+        center = np.zeros(tree.node_count)
+        scale = np.full(tree.node_count, np.inf)
+        lower, upper, depth_step, depth_cap = 0.0, np.inf, 0.0, 0.0
+        if self.prob_type == "fixed":
+            base[:] = 0.05
+        elif self.prob_type == "depth":
+            depth_step, depth_cap = 0.05, 0.2
+        elif self.prob_type in ("certainty", "agreement"):
+            base[:] = cache.node_table(tree, "uncertainty", self.build_uncertainty_table)[:, None]
+        elif self.prob_type == "confidence":
+            feature_mean, feature_std = cache.feature_statistics(X)
+            base[:] = 0.5
+            base[tree.feature < 0] = 0
+            center = node_feature_values(tree, feature_mean)
+            scale = node_feature_values(tree, feature_std, np.inf) + 1e-9
+        elif self.prob_type == "bayes":
+            base[:] = cache.node_table(tree, "bayes", self.build_bayes_table)[:, None]
+        elif self.prob_type == "distance":
+            base[:] = 0.5
+            base[tree.feature < 0] = 0
+            center = tree.threshold
+            scale = node_feature_values(tree, cache.feature_statistics(X)[1], np.inf) + 1e-9
+        else:
+            raise ValueError("Invalid prob_type")
+        return base, center, scale, lower, upper, depth_step, depth_cap
+
+    def accumulate_simulations(self, index, tree, X, n_simulations, tables, rng, proba_sum, turn):
+        # Simulate all walkers of one tree as a single batch and add their leaf values to proba_sum, either
+        # summed over the simulations (2-D proba_sum) or kept per simulation (3-D proba_sum, adaptive mode).
+        leaves = batch_traverse_tree(tree, X, n_simulations, tables, rng)
+        node_values = tree.value.reshape(tree.node_count, -1)
+        if proba_sum.ndim == 3:
+            tree_sum = node_values[leaves]
         else:
-            # Return the value at the leaf node.
-            return tree.value[node]
+            tree_sum = average_leaf_values(node_values, leaves)
+        # Trees are added in order, so the floating point reduction does not depend on n_jobs or thread timing.
+        with turn:
+            turn.wait_for(lambda: turn.next_index == index)
+            proba_sum += tree_sum
+            turn.next_index += 1
+            turn.notify_all()
+
+    def simulate_forest(self, X, n_simulations, tables, rngs, per_simulation=False):
+        # Run n_simulations walks through every tree, each tree with its own random stream, spreading the trees
+        # over n_jobs threads as in RandomForestClassifier.predict_proba and reducing them into one array.
+        n_jobs, _, _ = _partition_estimators(self.n_estimators, self.n_jobs)
+        n_classes = self.estimators_[0].tree_.value.shape[-1]
+        shape = (X.shape[0], n_simulations, n_classes) if per_simulation else (X.shape[0], n_classes)
+        proba_sum = np.zeros(shape, dtype=np.float64)
+        turn = threading.Condition()
+        turn.next_index = 0
+        Parallel(n_jobs=n_jobs, verbose=self.verbose, require="sharedmem")(
+            delayed(self.accumulate_simulations)(index, estimator.tree_, X, n_simulations, tables[index], rngs[index], proba_sum, turn)
+            for index, estimator in enumerate(self.estimators_)
+        )
+        return proba_sum
 
-    def predict_proba(self, X, n_simulations=10):
-        # Make a probability prediction for each sample in X, based on n_simulations.
+    def predict_proba(self, X, n_simulations=None):
+        # Make a probability prediction for each sample in X, based on n_simulations per tree.
+        if n_simulations is None:
+            n_simulations = self.n_simulations
         check_is_fitted(self)
         X = self._validate_X_predict(X)
 
-        proba = []
-        for x in X:
-            simulation_results = []
-            for tree in self.estimators_:
-                tree_results = [
-                    self.traverse_tree(tree.tree_, 0, x, X).ravel()
-                    for _ in range(n_simulations)
-                ]
-                simulation_results.extend(tree_results)
-            mean_proba = np.mean(simulation_results, axis=0)
-            proba.append(mean_proba)
-
-        return np.array(proba)
\ No newline at end of file
+        # The probability tables of every tree are selected once for the whole call.
+        tables = [self.get_node_probability_tables(estimator.tree_, X) for estimator in self.estimators_]
+        # Independent substreams per tree keep the trees parallel-safe and reproducible.
+        seed_sequences = get_seed_sequence(self.simulation_random_state).spawn(len(self.estimators_))
+        rngs = [np.random.default_rng(seed_sequence) for seed_sequence in seed_sequences]
+        if self.adaptive:
+            # One simulation is one walk through every tree; its value is the forest mean of the leaf values.
+            def simulate(rows, n):
+                return self.simulate_forest(X[rows], n, tables, rngs, per_simulation=True) / len(self.estimators_)
+            proba, self.simulation_counts_ = adaptive_average(simulate, X.shape[0], n_simulations, self.min_simulations, self.confidence_interval)
+            return proba
+
+        proba_sum = self.simulate_forest(X, n_simulations, tables, rngs)
+        self.simulation_counts_ = np.full(X.shape[0], n_simulations)
+        return proba_sum / (len(self.estimators_) * n_simulations)
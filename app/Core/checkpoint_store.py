@@ -0,0 +1,66 @@
+import json
+import os
+import shutil
+import tempfile
+import numpy as np
+from app.Core.trial_store import TrialStore
+
+class CheckpointStore:
+    """
+    The CheckpointStore class keeps the outputs of the pipeline stages (metrics and, where needed, an array such as the
+    adversarial examples of an attack) in a run directory named after the model and test data digests.
+    Every output is stored under a hash of the inputs it was computed from (stage name, attack or defense configuration,
+    input array digest), so a rerun reuses the outputs whose inputs are unchanged and only recomputes the others.
+    """
+    def __init__(self, root, model_digest, data_digest):
+        """
+        Initializes the CheckpointStore, creating its run directory if needed.
+
+        :param root: The directory holding the run directories.
+        :param model_digest: The digest of the model file.
+        :param data_digest: The digest of the test data.
+        """
+        self.run_dir = os.path.join(root, TrialStore.make_key(model_digest, data_digest))
+        os.makedirs(self.run_dir, exist_ok=True)
+
+    def get_path(self, parts):
+        return os.path.join(self.run_dir, TrialStore.make_key(*parts))
+
+    def load(self, parts):
+        """
+        Returns the checkpointed output of the inputs identified by parts.
+
+        :param parts: The JSON serializable inputs of the output, e.g. ("attack", attack_config).
+        :return: (metrics, memory-mapped array or None), or None if the output was not checkpointed.
+        """
+        path = self.get_path(parts)
+        if not os.path.isdir(path):
+            return None
+        with open(os.path.join(path, "metrics.json")) as f:
+            metrics = json.load(f)
+        array_path = os.path.join(path, "array.npy")
+        return metrics, np.load(array_path, mmap_mode="r") if os.path.exists(array_path) else None
+
+    def save(self, parts, metrics, array=None):
+        """
+        Checkpoints an output. It is written to a temporary directory that is then renamed, so an interrupted
+        run never leaves a partial checkpoint behind.
+
+        :param parts: The JSON serializable inputs of the output.
+        :param metrics: The metrics dict of the output.
+        :param array: An optional array to checkpoint along with the metrics.
+        """
+        path = self.get_path(parts)
+        tmp_dir = tempfile.mkdtemp(dir=self.run_dir, prefix=".tmp_")
+        try:
+            with open(os.path.join(tmp_dir, "metrics.json"), "w") as f:
+                # Not key-sorted, the metrics keep their order
+                json.dump(metrics, f, default=lambda obj: obj.tolist() if isinstance(obj, (np.generic, np.ndarray)) else str(obj))
+            if array is not None:
+                np.save(os.path.join(tmp_dir, "array.npy"), array)
+            if os.path.isdir(path):
+                shutil.rmtree(path)
+            os.rename(tmp_dir, path)
+        except BaseException:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            raise
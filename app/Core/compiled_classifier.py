@@ -0,0 +1,59 @@
+from art.estimators.classification.scikitlearn import ScikitlearnDecisionTreeClassifier, ScikitlearnRandomForestClassifier
+from sklearn.tree import DecisionTreeClassifier
+from sklearn.ensemble import RandomForestClassifier
+import xgboost as xgb
+from app.Core.xgboost_estimator import InplaceXGBoostClassifier
+
+class CompiledTreeMixin:
+    """
+    Mixin of the ART tree classifiers predicting with a TreeEnsemble (the flattened model) instead of the model's own
+    predict_proba, which has a high fixed cost per call. The ART pre- and postprocessing defences still apply.
+    """
+    def predict(self, x, **kwargs):
+        """
+        Perform prediction for a batch of inputs.
+
+        :param x: Input samples.
+        :return: Array of predictions of shape (nb_inputs, nb_classes).
+        """
+        x_preprocessed, _ = self._apply_preprocessing(x, y=None, fit=False)
+        y_prediction = self.tree_ensemble.predict_proba(x_preprocessed)
+        return self._apply_postprocessing(preds=y_prediction, fit=False)
+
+class CompiledDecisionTreeClassifier(CompiledTreeMixin, ScikitlearnDecisionTreeClassifier):
+    def __init__(self, model, tree_ensemble, **kwargs):
+        super().__init__(model=model, **kwargs)
+        self.tree_ensemble = tree_ensemble
+
+class CompiledRandomForestClassifier(CompiledTreeMixin, ScikitlearnRandomForestClassifier):
+    def __init__(self, model, tree_ensemble, **kwargs):
+        super().__init__(model=model, **kwargs)
+        self.tree_ensemble = tree_ensemble
+
+class CompiledXGBoostClassifier(InplaceXGBoostClassifier):
+    """
+    The CompiledXGBoostClassifier class is an InplaceXGBoostClassifier whose booster is evaluated by a TreeEnsemble.
+    """
+    def __init__(self, model, tree_ensemble, **kwargs):
+        super().__init__(model=model, **kwargs)
+        self.tree_ensemble = tree_ensemble
+
+    def predict_booster(self, x):
+        return self.tree_ensemble.predict_proba(x)
+
+def get_compiled_classifier(model, tree_ensemble, **kwargs):
+    """
+    Wraps model in the ART classifier predicting with tree_ensemble.
+
+    :param model: The DecisionTreeClassifier, RandomForestClassifier, xgb.XGBClassifier or xgb.Booster.
+    :param tree_ensemble: The TreeEnsemble built from model.
+    :param kwargs: The other arguments of the ART classifier.
+    :return: The ART classifier.
+    """
+    if isinstance(model, DecisionTreeClassifier):
+        return CompiledDecisionTreeClassifier(model=model, tree_ensemble=tree_ensemble, **kwargs)
+    if isinstance(model, RandomForestClassifier):
+        return CompiledRandomForestClassifier(model=model, tree_ensemble=tree_ensemble, **kwargs)
+    if isinstance(model, (xgb.XGBClassifier, xgb.Booster)):
+        return CompiledXGBoostClassifier(model=model, tree_ensemble=tree_ensemble, **kwargs)
+    raise ValueError(f"compiled_classifier.get_compiled_classifier()::Unsupported model type: {type(model)}")
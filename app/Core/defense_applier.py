@@ -35,7 +35,13 @@ class DefenseApplier:
             if defense_name == 'TTTS':
                 prob_type = self.defense_config.get('prob_type')
                 n_simulations = self.defense_config.get('n_simulations')
-                new_classifier = self.get_ttts_class(prob_type=prob_type, n_simulations=n_simulations)
+                adaptive = self.defense_config.get('adaptive', False)
+                min_simulations = self.defense_config.get('min_simulations', 2)
+                confidence_interval = self.defense_config.get('confidence_interval', 0.05)
+                random_state = self.defense_config.get('random_state')
+                new_classifier = self.get_ttts_class(prob_type=prob_type, n_simulations=n_simulations, adaptive=adaptive,
+                                                     min_simulations=min_simulations, confidence_interval=confidence_interval,
+                                                     random_state=random_state)
                 new_classifier.__dict__.update(copy.deepcopy(self.model.__dict__))
                 return new_classifier
 
@@ -54,11 +60,18 @@ class DefenseApplier:
         else:
             raise ValueError(f"Unsupported defense: {defense_name}")
     
-    def get_ttts_class(self, prob_type, n_simulations=None):
+    def get_ttts_class(self, prob_type, n_simulations=None, adaptive=False, min_simulations=2, confidence_interval=0.05, random_state=None):
+        if n_simulations is None:
+            n_simulations = 10
+        # random_state seeds the simulations only, the fitted model keeps its own random_state
         if isinstance(self.model, DecisionTreeClassifier):
-            return MonteCarloDecisionTreeClassifier(prob_type=prob_type, n_simulations=n_simulations)
+            return MonteCarloDecisionTreeClassifier(prob_type=prob_type, n_simulations=n_simulations, adaptive=adaptive,
+                                                    min_simulations=min_simulations, confidence_interval=confidence_interval,
+                                                    simulation_random_state=random_state)
         elif isinstance(self.model, RandomForestClassifier):
-            return MonteCarloRandomForestClassifier(prob_type=prob_type)
+            return MonteCarloRandomForestClassifier(prob_type=prob_type, n_simulations=n_simulations, adaptive=adaptive,
+                                                    min_simulations=min_simulations, confidence_interval=confidence_interval,
+                                                    simulation_random_state=random_state)
         
     def apply_preprocessor(self, x):
         x_defended, _ = self.defense(x)
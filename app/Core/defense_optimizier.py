@@ -1,10 +1,34 @@
 from skopt import gp_minimize
-from skopt.space import Real, Integer
+from skopt.space import Real, Integer, Categorical
+from skopt.utils import create_result
 from app.Core.metrics_evaluator import MetricsEvaluator
 from app.Core.defense_applier import DefenseApplier
+from app.Core.successive_halving import SuccessiveHalving
+from app.Core.trial_store import TrialStore
 from app.data_loader import DataLoader
+from app.config import pipeline_settings
+import itertools
 import numpy as np
 
+def squeeze_features(x, bit_depths, clip_values):
+    """
+    Applies feature squeezing (as art's FeatureSqueezing) for several bit depths in one vectorized operation.
+
+    :param x: The input data.
+    :param bit_depths: The bit depths to squeeze x with.
+    :param clip_values: The (min, max) data range.
+    :return: An array of shape (len(bit_depths),) + x.shape, the squeezed x for each bit depth.
+    """
+    x_normalized = np.asarray(x) - clip_values[0]
+    x_normalized = x_normalized / (clip_values[1] - clip_values[0])
+
+    max_values = np.rint(2 ** np.asarray(bit_depths, dtype=np.float64) - 1).reshape((-1,) + (1,) * x_normalized.ndim)
+    res = np.rint(x_normalized * max_values) / max_values
+
+    res = res * (clip_values[1] - clip_values[0])
+    res = res + clip_values[0]
+    return res
+
 class DefensekOptimizier:
     def __init__(self,defense, dataloader, classifier, logger=None):
         self.defense = defense
@@ -36,6 +60,96 @@ class DefensekOptimizier:
 
         return params
 
+    def get_defense_config(self, params):
+        defense_name = self.defense['name']
+        defense_config = self.defense.copy()      
+        if defense_name in self.defense_param_mapping:
+            param_names = self.defense_param_mapping[defense_name]
+            defense_params = dict(zip(param_names, params))
+
+            defense_params = self.validate_parameters_format(defense_params)
+
+            defense_config.update(defense_params)
+        else:
+            raise ValueError(f"Unsupported defense for optimization: {defense_name}")
+        return defense_config
+
+    def get_grid(self, max_points):
+        """
+        Enumerates the search space if it is discrete (Integer/Categorical dimensions) with at most max_points points.
+
+        :return: The list of all points of the space, or None if it is continuous or larger.
+        """
+        values = []
+        for dimension in self.space:
+            if isinstance(dimension, Integer):
+                values.append(list(range(dimension.low, dimension.high + 1)))
+            elif isinstance(dimension, Categorical):
+                values.append(list(dimension.categories))
+            else:
+                return None
+        if np.prod([len(v) for v in values]) > max_points:
+            return None
+        return [list(point) for point in itertools.product(*values)]
+
+    def defend_grid(self, x, grid):
+        """
+        Applies the defense configured by every point of grid to x. Feature squeezing is vectorized over the bit depths.
+
+        :return: The stacked defended inputs, of shape (len(grid),) + x.shape.
+        """
+        if self.defense['name'] == 'FeatureSqueezing':
+            return squeeze_features(x, [params[0] for params in grid], self.__dataloader.clip_values)
+        return np.stack([DefenseApplier(self.get_defense_config(params), self.__classifier, self.__dataloader.clip_values).apply_defense(x=x)
+                         for params in grid])
+
+    def optimize_grid(self, grid, objective, store=None, study=None, x0=None, y0=None):
+        """
+        Evaluates every point of a discrete search space exhaustively: the defended inputs of all points are
+        stacked and scored with a single model call. Points already in the trial store are not evaluated again.
+        If the batch fails, the points are evaluated one by one with objective, which scores a failing point as inf.
+
+        :param objective: The objective of optimize, evaluating a single point.
+        :param x0: The stored trial points of the study.
+        :param y0: The stored objectives of x0.
+        :return: A skopt OptimizeResult over the grid.
+        """
+        x0, y0 = list(x0 or []), list(y0 or [])
+        stored = {tuple(params) for params in x0}
+        pending = [params for params in grid if tuple(params) not in stored]
+        if not pending:
+            return create_result(x0, y0, space=self.space)
+        x, y = np.asarray(self.__dataloader.x), self.__dataloader.y
+        try:
+            x_defended = self.defend_grid(x, pending)
+            y_pred = self.__classifier.predict(x_defended.reshape((-1,) + x.shape[1:]))
+        except Exception as e:
+            print(f"Error during batched defense optimization, evaluating the points one by one: {e}")
+            return create_result(x0 + pending, y0 + [objective(params) for params in pending], space=self.space)
+        objectives = []
+        for i, params in enumerate(pending):
+            try:
+                metrics = MetricsEvaluator(self.__classifier, x_defended[i], y, predictions=y_pred[i * len(x):(i + 1) * len(x)]).get_metrics()
+                perturbation = np.mean(np.linalg.norm(x - x_defended[i], axis=1))
+                self.update_logger(self.get_defense_config(params), params, perturbation, metrics['overall_accuracy'])
+                objectives.append(1 - metrics['overall_accuracy'])
+            except Exception as e:
+                # Scored as a failure, and not stored so that a later run evaluates the point again
+                print(f"Error during defense optimization execution: {e}")
+                objectives.append(float('inf'))
+                continue
+            if store is not None:
+                store.add_trial(study, params, objectives[-1])
+        return create_result(x0 + pending, y0 + objectives, space=self.space)
+
+    def get_study_key(self):
+        """
+        Identifies this optimization (model file, test data, defense and its fixed parameters) in the trial store.
+        """
+        excluded = set(self.defense_param_mapping[self.defense['name']])
+        config = {key: value for key, value in self.defense.items() if key not in excluded}
+        return TrialStore.make_key("defense", self.__dataloader.model_digest, self.__dataloader.data_digest, config)
+
     def update_logger(self,config,params, perturbation,accuracy):
          defense_name = self.defense['name']
          if defense_name in self.defense_param_mapping:
@@ -48,29 +162,29 @@ class DefensekOptimizier:
     def optimize(self):
         # Define the objective function to be minimized
         defense_name = self.defense['name']
-        def objective(params):
-            defense_config = self.defense.copy()      
-            if defense_name in self.defense_param_mapping:
-                param_names = self.defense_param_mapping[defense_name]
-                defense_params = dict(zip(param_names, params))
-
-                defense_params = self.validate_parameters_format(defense_params)
-
-                defense_config.update(defense_params)
-            else:
-                raise ValueError(f"Unsupported defense for optimization: {defense_name}")
-            
+        n_calls = 10
+        store = TrialStore(pipeline_settings["trial_store"]) if pipeline_settings["trial_store"] else None
+        study = self.get_study_key() if store is not None else None
+        x0, y0 = store.get_trials(study) if store is not None else ([], [])
+        grid = self.get_grid(n_calls)
+        def objective(params, indices=None):
+            defense_config = self.get_defense_config(params)
+            x, y = self.__dataloader.x, self.__dataloader.y
+            if indices is not None: # subsampled evaluation of successive halving
+                x, y = x[indices], y[indices]
             try:
                 applier = DefenseApplier(defense_config, self.__classifier, self.__dataloader.clip_values)
-                x_defended = applier.apply_defense(x=self.__dataloader.x)
-                evaluator = MetricsEvaluator(self.__classifier, x_defended, self.__dataloader.y)
+                x_defended = applier.apply_defense(x=x)
+                evaluator = MetricsEvaluator(self.__classifier, x_defended, y)
                 metrics = evaluator.get_metrics()
 
                 # Calculate the perturbation size 
-                perturbation = np.mean(np.linalg.norm(self.__dataloader.x - x_defended, axis=1))         
+                perturbation = np.mean(np.linalg.norm(x - x_defended, axis=1))         
                 # Combine the objectives
                 combined_objective = 1 - metrics['overall_accuracy']
                 self.update_logger(defense_config,params,perturbation,metrics['overall_accuracy'] )
+                if store is not None and indices is None:
+                    store.add_trial(study, params, combined_objective)
                 return combined_objective
             except Exception as e:
                 # Handle potential errors during attack execution and evaluation
@@ -80,7 +194,23 @@ class DefensekOptimizier:
             
 
         # Perform Bayesian optimization
-        result = gp_minimize(objective, self.space, n_calls=10, random_state=0)
+        if len(y0) >= (len(grid) if grid is not None else n_calls):
+            # The study already has enough trials, answer from the store without applying any defense
+            result = create_result(x0, y0, space=self.space)
+            self.logger.info(f"OPTIMIZIER-CACHED::{defense_name}::trials={len(y0)}")
+        elif grid is not None:
+            # No more points than calls, evaluate them all at once instead
+            result = self.optimize_grid(grid, objective, store, study, x0, y0)
+        elif pipeline_settings["search_mode"] == "halving":
+            search = SuccessiveHalving(self.space, n_candidates=pipeline_settings["halving_candidates"],
+                                       min_samples=pipeline_settings["halving_min_samples"], eta=pipeline_settings["halving_eta"], random_state=0)
+            result = search.run(objective, self.__dataloader.y)
+            self.logger.info(f"OPTIMIZIER-HALVING::{defense_name}::{search.describe_budget(n_calls)}")
+        else:
+            # Warm-start from the stored trials, n_calls counting them too
+            n_remaining = n_calls - len(y0)
+            result = gp_minimize(objective, self.space, n_calls=n_remaining, n_initial_points=min(max(10 - len(y0), 0), n_remaining),
+                                 x0=x0 or None, y0=y0 or None, random_state=0)
         
         optimized_params = dict(zip(self.defense_param_mapping[defense_name], result.x))
         optimized_params = self.validate_parameters_format(optimized_params)
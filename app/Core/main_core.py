@@ -5,14 +5,46 @@ from sklearn.tree import DecisionTreeClassifier
 from sklearn.ensemble import RandomForestClassifier
 import xgboost as xgb
 from app.data_loader import DataLoader
-from app.config import supported_libraries, supported_attacks, supported_defenses
+from app.config import supported_libraries, supported_attacks, supported_defenses, pipeline_settings
 from app.Core.metrics_evaluator import MetricsEvaluator
 from app.Core.attack_executor import AttackExecutor
 from app.Core.defense_applier import DefenseApplier
 from app.Core.attack_optimizier import AttackOptimizier
 from app.Core.defense_optimizier import DefensekOptimizier
+from app.Core.prediction_cache import PredictionCache
+from app.Core.attack_pool import AttackPool, spill_path, write_batches
+from app.Core.xgboost_estimator import InplaceXGBoostClassifier
+from app.Core.compiled_classifier import get_compiled_classifier
+from app.Core.checkpoint_store import CheckpointStore
+from app.Core.adversarial_store import AdversarialStore
 
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 import logging
+import os
+import shutil
+import tempfile
+import weakref
+
+
+def preprocess(applier, x, path=None, batch_size=None):
+    """
+    Applies a preprocessor defense to x, batch by batch into the .npy file at path when batch_size is set.
+    """
+    if path is None:
+        return applier.apply_defense(x=x)
+    return write_batches(path, x, lambda batch: applier.apply_defense(x=batch), batch_size)
+
+def evaluate_pairs(model, pairs, y, evaluator_kwargs):
+    """
+    Evaluates model on each (key, x) of pairs, in order.
+
+    :return: A list of (key, metrics, TTTS simulation counts or None, TTTS n_simulations or None).
+    """
+    results = []
+    for key, x in pairs:
+        evaluator = MetricsEvaluator(model, x, y, **evaluator_kwargs)
+        results.append((key, evaluator.get_metrics(), getattr(model, 'simulation_counts_', None), getattr(model, 'n_simulations', None)))
+    return results
 
 
 class Main_Core:
@@ -21,6 +53,23 @@ class Main_Core:
         self.__dataloader = None
         self.__status = "Idle"
         self.__classifier = None
+        self.prediction_cache = PredictionCache(max_bytes=pipeline_settings["prediction_cache_bytes"])
+        self.batch_size = pipeline_settings["batch_size"]
+        self.spill_dir = pipeline_settings["spill_dir"]
+        self.spill_run_dir = None
+        self.spill_finalizer = None
+        self.attack_workers = pipeline_settings["attack_workers"]
+        self.attack_shards = pipeline_settings["attack_shards"]
+        self.attack_random_state = pipeline_settings["attack_random_state"]
+        self.count_queries = pipeline_settings["count_queries"]
+        self.query_cache_rows = pipeline_settings["query_cache_rows"]
+        self.matrix_workers = pipeline_settings["matrix_workers"]
+        self.matrix_executor = pipeline_settings["matrix_executor"]
+        self.checkpoint_dir = pipeline_settings["checkpoint_dir"]
+        self.checkpoints = None
+        self.adversarial_store = None
+        if pipeline_settings["adversarial_store"] is not None:
+            self.adversarial_store = AdversarialStore(pipeline_settings["adversarial_store"], pipeline_settings["adversarial_store_bytes"])
     
     def setup_logger(self):
         logger = logging.getLogger("Main_Core")
@@ -46,7 +95,9 @@ class Main_Core:
             raise ValueError("dataloader must be an instance of DataLoader")
         print(f"in core set dataloader={dataloader}")
         self.__dataloader = dataloader
+        self.prediction_cache.clear()
         self.setup_art_classifier() # sets self.classifier wrapped in ART classifier
+        self.setup_checkpoints()
 
     @property
     def status(self):
@@ -59,6 +110,46 @@ class Main_Core:
             return func(self, *args, **kwargs)
         return wrapper
     
+    def map_batches(self, name, x, transform):
+        """
+        Applies transform (an attack or a preprocessor) to x. In batched mode (batch_size set) x is transformed
+        batch by batch and the result is spilled to a .npy file in spill_dir, which is returned memory-mapped,
+        so that only one batch is held in memory at a time.
+
+        :param name: A name identifying the result, used for the spill file.
+        :param x: The input array, possibly memory-mapped.
+        :param transform: A callable mapping a batch of rows to a batch of the same number of rows.
+        :return: The transformed array.
+        """
+        if not self.batch_size or len(x) == 0:
+            return transform(x)
+        path = spill_path(self.get_spill_dir(), name)
+        x_out = write_batches(path, x, transform, self.batch_size)
+        self.logger.info(f"BATCHED::{name} written to {path}")
+        return x_out
+
+    def get_spill_dir(self):
+        """
+        Returns the directory where the arrays of this run are spilled to disk: a unique subdirectory of spill_dir
+        (of the system temporary directory if none is configured), so concurrent runs never share spill files.
+        It is removed by cleanup_spill_dir, or at the latest when the Main_Core is garbage collected.
+        """
+        if self.spill_run_dir is None:
+            if self.spill_dir is not None:
+                os.makedirs(self.spill_dir, exist_ok=True)
+            self.spill_run_dir = tempfile.mkdtemp(prefix="auto_defense_ml_", dir=self.spill_dir)
+            self.spill_finalizer = weakref.finalize(self, shutil.rmtree, self.spill_run_dir, ignore_errors=True)
+        return self.spill_run_dir
+
+    def cleanup_spill_dir(self):
+        """
+        Removes the spill directory of the run, once its spilled arrays are no longer used.
+        """
+        if self.spill_finalizer is not None:
+            self.spill_finalizer()
+        self.spill_run_dir = None
+        self.spill_finalizer = None
+
     def optimize_attacks(self, attacks):
         print("in optimize attacks")
 
@@ -70,20 +161,66 @@ class Main_Core:
         return optimized_attacks
     
     @requires_dataloader
-    def perform_attacks(self, attacks):
+    def perform_attacks(self, attacks, progress_callback=None):
+        """
+        Runs the attacks and evaluates the model on their adversarial examples. With attack_workers > 1 the
+        attacks run concurrently in worker processes and are evaluated in completion order.
+
+        :param progress_callback: Optional callable receiving a progress message as each attack finishes.
+        """
         x_org = self.__dataloader.x
         y_org = self.__dataloader.y
         clip_values = self.__dataloader.clip_values
         metrics = {}
         adv_examples = {}
+        checkpoint_parts = {att['name']: self.get_attack_checkpoint_parts(att) for att in attacks}
+        pending = []
         for att in attacks:
-            executor = AttackExecutor(attack_config=att, model=self.__classifier,clip_values=clip_values)
-            x_adv = executor.execute_attack(x_org)
-            evaluator = MetricsEvaluator(self.__classifier, x_adv, y_org)
-            metrics[att['name']] = evaluator.get_metrics()
-            adv_examples[att['name']] = x_adv
+            checkpoint = self.load_checkpoint(checkpoint_parts[att['name']])
+            if checkpoint is None:
+                pending.append(att)
+                continue
+            metrics[att['name']], adv_examples[att['name']] = checkpoint
+            if progress_callback is not None:
+                progress_callback(f"{att['name']} restored from checkpoint ({len(metrics)}/{len(attacks)})")
+        if self.attack_workers and self.attack_workers > 1 and len(pending) > 1:
+            pool = AttackPool(self.__classifier, self.attack_workers, self.get_spill_dir())
+            results = pool.run(pending, x_org, clip_values, self.batch_size, self.count_queries, self.query_cache_rows,
+                               self.adversarial_store, self.__dataloader.model_digest)
+        else:
+            results = ((att['name'],) + self.execute_attack(att, x_org, clip_values) for att in pending)
+        for att_name, x_adv, query_metrics in results:
+            evaluator = MetricsEvaluator(self.__classifier, x_adv, y_org, prediction_cache=self.prediction_cache, batch_size=self.batch_size)
+            metrics[att_name] = evaluator.get_metrics()
+            # The query cost of the attack is reported next to its accuracy
+            metrics[att_name].update(query_metrics)
+            adv_examples[att_name] = x_adv
+            self.save_checkpoint(checkpoint_parts[att_name], metrics[att_name], x_adv)
+            if progress_callback is not None:
+                progress_callback(f"{att_name} done ({len(metrics)}/{len(attacks)})")
         return metrics, adv_examples
 
+    def get_attack_checkpoint_parts(self, att):
+        """
+        Identifies the output of an attack in the checkpoints: its configuration and every pipeline setting that
+        changes its adversarial examples or metrics (the shard seeds depend on the seed, the shards and the batches).
+        """
+        return ("attack", self.get_config_signature(att), self.count_queries,
+                self.attack_random_state, self.attack_shards, self.batch_size)
+
+    def execute_attack(self, att, x, clip_values):
+        """
+        Runs one attack on x.
+
+        :return: The adversarial examples and the query metrics of the attack.
+        """
+        executor = AttackExecutor(attack_config=att, model=self.__classifier,clip_values=clip_values,
+                                  n_shards=self.attack_shards, random_state=self.attack_random_state,
+                                  count_queries=self.count_queries, query_cache_rows=self.query_cache_rows,
+                                  store=self.adversarial_store, model_digest=self.__dataloader.model_digest)
+        x_adv = self.map_batches(f"adv_{att['name']}", x, executor.execute_attack)
+        return x_adv, executor.get_query_metrics(len(x))
+
 
     def optimize_defenses(self, defenses):
         print("in optimize defenses")
@@ -104,67 +241,187 @@ class Main_Core:
         defended_examples = {}
         
         for defense in defenses:
+            checkpoint_parts = ("defense", self.get_config_signature(defense))
+            checkpoint = self.load_checkpoint(checkpoint_parts)
+            if checkpoint is not None:
+                metrics[defense['name']], x_defended = checkpoint
+                # A new classifier is evaluated on x itself, which is not checkpointed
+                defended_examples[defense['name']] = x_org if defense['defense_type'] == "new_classifier" else x_defended
+                continue
+
             if defense['defense_type'] == "new_classifier":
                 applier = DefenseApplier(defense_config=defense, model=self.__dataloader.model,clip_values=clip_values)
                 new_classifier =  applier.defense
-                evaluator = MetricsEvaluator(new_classifier, x_org, y_org, use_predict_proba=True)
+                evaluator = MetricsEvaluator(new_classifier, x_org, y_org, use_predict_proba=True, prediction_cache=self.prediction_cache, batch_size=self.batch_size)
+                self.log_simulation_counts(defense['name'], getattr(new_classifier, 'simulation_counts_', None), new_classifier.n_simulations)
                 defended_examples[defense['name']] = x_org
                 metrics[defense['name']] = evaluator.get_metrics()
+                self.save_checkpoint(checkpoint_parts, metrics[defense['name']])
                 continue
 
             applier = DefenseApplier(defense_config=defense, model=self.__classifier,clip_values=clip_values)
             if applier.is_preprocessor():
-                x_defended = applier.apply_defense(x=x_org)
-                evaluator = MetricsEvaluator(self.__classifier, x_defended, y_org)
+                x_defended = self.map_batches(f"def_{defense['name']}", x_org, lambda x: applier.apply_defense(x=x))
+                evaluator = MetricsEvaluator(self.__classifier, x_defended, y_org, prediction_cache=self.prediction_cache, batch_size=self.batch_size)
                 defended_examples[defense['name']] = x_defended
             else:
-                evaluator = MetricsEvaluator(self.__classifier, x_org, y_org, postprocessor=applier.defense)
+                evaluator = MetricsEvaluator(self.__classifier, x_org, y_org, postprocessor=applier.defense, prediction_cache=self.prediction_cache, batch_size=self.batch_size)
                 defended_examples[defense['name']] = None
 
             metrics[defense['name']] = evaluator.get_metrics()
-            
+            self.save_checkpoint(checkpoint_parts, metrics[defense['name']], defended_examples[defense['name']])
 
         return metrics, defended_examples
     
     @requires_dataloader
     def perform_defenses_on_attacks(self, defenses, adv_examples):
+        """
+        Evaluates every (defense, attack) pair as independent tasks on the matrix pool (see get_matrix_pool).
+        Each distinct preprocessor is applied once per distinct adversarial input, and a TTTS classifier
+        evaluates all of its attacks in a single task because its Monte Carlo state is not thread-safe.
+        Pairs whose defense configuration and adversarial examples are unchanged are restored from their checkpoint.
+        """
         y_org = self.__dataloader.y
         clip_values = self.__dataloader.clip_values
-        metrics = {}
         adv_defended_examples = {}
+        preprocessed = {}
+        pending = []
+        evaluations = []
+        results = {}
+        checkpoint_parts = {}
 
-        for defense in defenses:
-            if defense['defense_type'] == "new_classifier":
-                applier = DefenseApplier(defense_config=defense, model=self.__dataloader.model,clip_values=clip_values)
-                new_classifier =  applier.defense
+        with self.get_matrix_pool() as pool:
+            for defense in defenses:
+                signature = self.get_config_signature(defense)
+                missing = {}
                 for att_name, adv_ex in adv_examples.items():
-                    evaluator = MetricsEvaluator(new_classifier, adv_ex, y_org, use_predict_proba=True)
-                    adv_defended_examples[defense['name'], att_name] = adv_ex      
-                    metrics[defense['name'], att_name] = evaluator.get_metrics()
-                continue
-        
-            applier = DefenseApplier(defense_config=defense, model=self.__classifier,clip_values=clip_values)
-            for att_name, adv_ex in adv_examples.items():
-                if applier.is_preprocessor():
-                    x_adv_defended = applier.apply_defense(x=adv_ex)
-                    evaluator = MetricsEvaluator(self.__classifier, x_adv_defended, y_org)
-                    adv_defended_examples[defense['name'], att_name] = x_adv_defended
-                else:
-                    evaluator = MetricsEvaluator(self.__classifier, adv_ex, y_org, postprocessor=applier.defense)
-                    adv_defended_examples[defense['name'], att_name] = None
-
-                metrics[defense['name'], att_name] = evaluator.get_metrics()
-                
+                    key = (defense['name'], att_name)
+                    checkpoint_parts[key] = ("defense_on_attack", signature, PredictionCache.hash_array(adv_ex))
+                    checkpoint = self.load_checkpoint(checkpoint_parts[key])
+                    if checkpoint is None:
+                        missing[att_name] = adv_ex
+                        adv_defended_examples[key] = None
+                        continue
+                    results[key], adv_defended_examples[key] = checkpoint
+                    if defense['defense_type'] == "new_classifier":
+                        adv_defended_examples[key] = adv_ex
+                if not missing:
+                    continue
+
+                if defense['defense_type'] == "new_classifier":
+                    applier = DefenseApplier(defense_config=defense, model=self.__dataloader.model,clip_values=clip_values)
+                    new_classifier =  applier.defense
+                    pairs = [((defense['name'], att_name), adv_ex) for att_name, adv_ex in missing.items()]
+                    adv_defended_examples.update(pairs)
+                    evaluations.append(pool.submit(evaluate_pairs, new_classifier, pairs, y_org, self.get_evaluator_kwargs(use_predict_proba=True)))
+                    continue
 
+                applier = DefenseApplier(defense_config=defense, model=self.__classifier,clip_values=clip_values)
+                for att_name, adv_ex in missing.items():
+                    key = (defense['name'], att_name)
+                    if applier.is_preprocessor():
+                        input_key = (self.get_defense_signature(defense), PredictionCache.hash_array(adv_ex))
+                        if input_key not in preprocessed:
+                            path = spill_path(self.get_spill_dir(), f"def_{defense['name']}_adv_{att_name}") if self.batch_size else None
+                            preprocessed[input_key] = pool.submit(preprocess, applier, adv_ex, path, self.batch_size)
+                        pending.append((key, preprocessed[input_key]))
+                    else:
+                        evaluations.append(pool.submit(evaluate_pairs, self.__classifier, [(key, adv_ex)], y_org,
+                                                       self.get_evaluator_kwargs(postprocessor=applier.defense)))
+
+            for key, future in pending:
+                adv_defended_examples[key] = future.result()
+                evaluations.append(pool.submit(evaluate_pairs, self.__classifier, [(key, adv_defended_examples[key])], y_org,
+                                               self.get_evaluator_kwargs()))
+
+            preprocessed_keys = {key for key, _ in pending}
+            for future in evaluations:
+                for key, key_metrics, counts, n_simulations in future.result():
+                    results[key] = key_metrics
+                    self.log_simulation_counts(f"{key[0]}::{key[1]}", counts, n_simulations)
+                    self.save_checkpoint(checkpoint_parts[key], key_metrics, adv_defended_examples[key] if key in preprocessed_keys else None)
+
+        metrics = {key: results[key] for key in adv_defended_examples}
         return metrics, adv_defended_examples
+
+    def get_matrix_pool(self):
+        """
+        Returns the executor evaluating the defense x attack matrix: a pool of matrix_workers threads
+        (sharing the prediction cache) or, with matrix_executor set to "process", worker processes.
+        """
+        n_workers = self.matrix_workers or 1
+        if self.matrix_executor == "process":
+            return ProcessPoolExecutor(max_workers=n_workers)
+        return ThreadPoolExecutor(max_workers=n_workers)
+
+    def get_evaluator_kwargs(self, **kwargs):
+        """
+        Returns the MetricsEvaluator keyword arguments of a matrix task. The prediction cache is only shared
+        with threads, worker processes would each receive a copy.
+        """
+        kwargs["batch_size"] = self.batch_size
+        if self.matrix_executor != "process":
+            kwargs["prediction_cache"] = self.prediction_cache
+        return kwargs
+
+    @staticmethod
+    def get_defense_signature(defense):
+        """
+        Identifies a defense by its parameters, so that identically configured preprocessors share their outputs.
+        """
+        return tuple(sorted((key, repr(value)) for key, value in defense.items() if key not in ('name', 'applicable_to')))
+
+    @staticmethod
+    def get_config_signature(config):
+        """
+        Identifies an attack or defense configuration in checkpoint keys.
+        """
+        return {key: value for key, value in config.items() if key != 'applicable_to'}
+
+    def setup_checkpoints(self):
+        """
+        Opens the checkpoint run directory of the current model and test data, unless checkpointing is disabled.
+        """
+        self.checkpoints = None
+        if self.checkpoint_dir is not None and self.__dataloader.model_digest is not None:
+            self.checkpoints = CheckpointStore(self.checkpoint_dir, self.__dataloader.model_digest, self.__dataloader.data_digest)
+
+    def load_checkpoint(self, parts):
+        """
+        Returns the checkpointed (metrics, array) of the stage output identified by parts, or None.
+        """
+        if self.checkpoints is None:
+            return None
+        checkpoint = self.checkpoints.load(parts)
+        if checkpoint is not None:
+            self.logger.info(f"CHECKPOINT::{parts[0]} restored from {self.checkpoints.get_path(parts)}")
+        return checkpoint
+
+    def save_checkpoint(self, parts, metrics, array=None):
+        if self.checkpoints is not None:
+            self.checkpoints.save(parts, metrics, array)
     
+    def log_simulation_counts(self, name, counts, n_simulations):
+        """
+        Logs how many Monte Carlo simulations a TTTS classifier ran in its last prediction, compared to the fixed count.
+        """
+        if counts is None or len(counts) == 0:
+            return
+        full = len(counts) * n_simulations
+        self.logger.info(f"TTTS::{name}::simulations={int(counts.sum())}/{full}, mean per sample={counts.mean():.2f}, saved={1 - counts.sum() / full:.1%}")
+
     @requires_dataloader
     def perform_benign_evaluation(self):
         x_org = self.__dataloader.x
         y_org = self.__dataloader.y
         metrics = {}
-        evaluator = MetricsEvaluator(self.__classifier, x_org, y_org)
+        checkpoint = self.load_checkpoint(("benign",))
+        if checkpoint is not None:
+            metrics['Clean'] = checkpoint[0]
+            return metrics
+        evaluator = MetricsEvaluator(self.__classifier, x_org, y_org, prediction_cache=self.prediction_cache, batch_size=self.batch_size)
         metrics['Clean'] = evaluator.get_metrics()
+        self.save_checkpoint(("benign",), metrics['Clean'])
         return metrics
     
     def print_all_metrics(self, all_metrics, by_class=False):
@@ -191,12 +448,33 @@ class Main_Core:
             print("\n")  # Add an empty line for better readability between section
 
     
+    def get_xgboost_nthread(self):
+        """
+        Returns the number of threads of XGBoost predictions, 1 when they already run in a pool of workers
+        (unless pipeline_settings['xgboost_nthread'] is set), so that the threads do not oversubscribe the cores.
+        """
+        if pipeline_settings["xgboost_nthread"] is not None:
+            return pipeline_settings["xgboost_nthread"]
+        pools = [pipeline_settings["attack_workers"], pipeline_settings["attack_shards"], pipeline_settings["matrix_workers"]]
+        return 1 if any((n or 1) > 1 for n in pools) else None
+
     def setup_art_classifier(self):
         model = self.__dataloader.model
         nb_features=self.__dataloader.nb_features
         nb_classes=self.__dataloader.nb_classes
-        if isinstance(model, (Booster, XGBoostClassifier, xgb.XGBClassifier)):
-            self.__classifier = XGBoostClassifier(model=model, nb_features=nb_features, nb_classes=nb_classes)
+        tree_ensemble = self.__dataloader.tree_ensemble
+        if pipeline_settings["compiled_trees"] and tree_ensemble is not None:
+            if isinstance(model, (DecisionTreeClassifier, RandomForestClassifier)):
+                self.__classifier = get_compiled_classifier(model, tree_ensemble)
+            else:
+                self.__classifier = get_compiled_classifier(model, tree_ensemble, nthread=self.get_xgboost_nthread(),
+                                                            nb_features=nb_features, nb_classes=nb_classes)
+        elif isinstance(model, (Booster, XGBoostClassifier, xgb.XGBClassifier)):
+            if pipeline_settings["xgboost_inplace_predict"]:
+                self.__classifier = InplaceXGBoostClassifier(model=model, nthread=self.get_xgboost_nthread(),
+                                                             nb_features=nb_features, nb_classes=nb_classes)
+            else:
+                self.__classifier = XGBoostClassifier(model=model, nb_features=nb_features, nb_classes=nb_classes)
 
         elif isinstance(model, (DecisionTreeClassifier, RandomForestClassifier)):
             self.__classifier = SklearnClassifier(model=model)
@@ -1,44 +1,91 @@
-from sklearn.metrics import accuracy_score, recall_score, precision_score, classification_report
 import numpy as np
 
 class MetricsEvaluator:
     """
     The MetricsEvaluator class is designed to compute and store various performance metrics for a given machine learning model.
     """
-    def __init__(self, model, x_test, y_test, postprocessor=None, use_predict_proba=False):
+    def __init__(self, model, x_test, y_test, postprocessor=None, use_predict_proba=False, prediction_cache=None, batch_size=None, predictions=None):
         """
         Initializes the MetricsEvaluator with a model and test dataset.
         
         :param model: The machine learning model to be evaluated.
         :param x_test: Test dataset features.
         :param y_test: Test dataset labels, assumed to be one-hot encoded.
+        :param prediction_cache: Optional PredictionCache shared between evaluators, so that a (model, x_test) pair
+                                 that was already scored is not predicted again.
+        :param batch_size: If set, x_test is predicted batch by batch and only the confusion counts are kept, so that
+                           memory is bounded by the batch size (x_test may then be a memory-mapped array).
+                           With a postprocessor, which is not row-wise (e.g. ClassLabels), the model outputs of all
+                           batches are gathered and postprocessed at once, so that the metrics do not depend on it.
+        :param predictions: Optional outputs of the model on x_test computed beforehand, e.g. by one model call over
+                            several stacked test sets, in which case the model is not called again.
         """
         self.classifier = model
         self.x_test = x_test
         self.postprocessor = postprocessor
         self.use_predict_proba = use_predict_proba
+        self.prediction_cache = prediction_cache
+        self.batch_size = batch_size
         # Check if y_test is one-hot encoded and convert it to label encoding if true
         if len(y_test.shape) == 2 and y_test.shape[1] > 1:
             self.y_test = np.argmax(y_test, axis=1)
         else:
             self.y_test = y_test
-        self.y_pred = self.predict()
+        self.pair_counts = {}
+        if predictions is not None:
+            self.y_pred = self.to_labels(predictions)
+            self.count_predictions(self.y_test, self.y_pred)
+        elif batch_size and self.postprocessor:
+            outputs = [self.predict_outputs(np.asarray(self.x_test[start:start + batch_size]))
+                       for start in range(0, len(self.x_test), batch_size)]
+            self.y_pred = self.to_labels(np.concatenate(outputs))
+            self.count_predictions(self.y_test, self.y_pred)
+        elif batch_size:
+            self.y_pred = None
+            for start in range(0, len(self.x_test), batch_size):
+                x_batch = np.asarray(self.x_test[start:start + batch_size])
+                self.count_predictions(self.y_test[start:start + batch_size], self.predict(x_batch))
+        else:
+            self.y_pred = self.predict()
+            self.count_predictions(self.y_test, self.y_pred)
         self.run_metrics_calculations()
 
-    def predict(self):
+    def predict(self, x=None):
         """
         Predicts the labels for the test dataset using the provided model.
         
+        :param x: The features to predict, defaults to the whole test dataset.
         :return: The predicted labels, converted from one-hot encoding if necessary.
         """
-        if self.use_predict_proba:
-          y_pred = self.classifier.predict_proba(self.x_test)
+        return self.to_labels(self.predict_outputs(x))
+
+    def predict_outputs(self, x=None):
+        """
+        Calls the model on the features, through the prediction cache if one is set.
+        
+        :param x: The features to predict, defaults to the whole test dataset.
+        :return: The model outputs, before postprocessing.
+        """
+        if x is None:
+            x = self.x_test
+        method_name = 'predict_proba' if self.use_predict_proba else 'predict'
+        predict = getattr(self.classifier, method_name)
+        if self.prediction_cache is not None:
+          y_pred = self.prediction_cache.get_or_compute(self.classifier, method_name, x, lambda: predict(x))
         else:
-          y_pred = self.classifier.predict(self.x_test)
+          y_pred = predict(x)
 
         if y_pred is None:
             raise ValueError("The classifier returned None as predictions.")
+        return y_pred
+
+    def to_labels(self, y_pred):
+        """
+        Applies the postprocessor to the model outputs and converts them to labels.
         
+        :param y_pred: The model outputs.
+        :return: The predicted labels, converted from one-hot encoding if necessary.
+        """
         if y_pred.shape[1] > 1:  # Check if y_pred is probabilities (one-hot encoded)
             if self.postprocessor:
                 y_pred = self.postprocessor(y_pred)
@@ -48,16 +95,77 @@ class MetricsEvaluator:
             if self.postprocessor:
                 y_pred = self.postprocessor(y_pred)
             return y_pred
+
+    def count_predictions(self, y_true, y_pred):
+        """
+        Adds the (true label, predicted label) pairs of one batch to the running confusion counts,
+        counting them in a single np.bincount pass.
+        
+        :param y_true: The true labels of the batch.
+        :param y_pred: The predicted labels of the batch.
+        """
+        y_true = np.asarray(y_true).ravel()
+        y_pred = np.asarray(y_pred).ravel()
+        if y_true.shape[0] != y_pred.shape[0]:
+            raise ValueError(f"Found {y_true.shape[0]} labels but {y_pred.shape[0]} predictions.")
+        if y_true.shape[0] == 0:
+            return
+        labels, codes = np.unique(np.concatenate([y_true, y_pred]), return_inverse=True)
+        n_labels = labels.shape[0]
+        pairs = codes[:y_true.shape[0]] * n_labels + codes[y_true.shape[0]:]
+        counts = np.bincount(pairs, minlength=n_labels * n_labels)
+        for pair in np.flatnonzero(counts):
+            key = (labels[pair // n_labels], labels[pair % n_labels])
+            self.pair_counts[key] = self.pair_counts.get(key, 0) + int(counts[pair])
     
+    def compute_confusion_matrix(self):
+        """
+        Builds the confusion matrix from the accumulated confusion counts.
+        
+        :return: The sorted labels found in y_test or y_pred, and the confusion matrix with true labels as rows.
+        """
+        if not self.pair_counts:
+            raise ValueError("Cannot calculate metrics on an empty test set.")
+        pairs = np.array(list(self.pair_counts.keys()))
+        labels = np.unique(pairs)
+        codes = np.searchsorted(labels, pairs)
+        confusion_matrix = np.zeros((labels.shape[0], labels.shape[0]), dtype=np.int64)
+        confusion_matrix[codes[:, 0], codes[:, 1]] = list(self.pair_counts.values())
+        return labels, confusion_matrix
+
+    @staticmethod
+    def divide(numerator, denominator):
+        """
+        Divides element-wise, returning 0 where the denominator is 0 (sklearn's zero_division=0).
+        """
+        numerator = np.asarray(numerator, dtype=np.float64)
+        denominator = np.asarray(denominator, dtype=np.float64).copy()
+        mask = denominator == 0
+        denominator[mask] = 1
+        result = numerator / denominator
+        result[mask] = 0.0
+        return result
+
     def run_metrics_calculations(self):
         """
         Calculates various performance metrics based on the true labels and the predictions.
+        All metrics are derived from one confusion matrix, matching sklearn's accuracy_score, the weighted
+        precision_score/recall_score and classification_report with zero_division=0.
         
         :return: A dictionary containing overall accuracy, precision, recall, and metrics per class.
         """
-        self.overall_accuracy = accuracy_score(self.y_test, self.y_pred)
-        self.overall_precision = precision_score(self.y_test, self.y_pred, average='weighted', zero_division=0)
-        self.overall_recall = recall_score(self.y_test, self.y_pred, average='weighted', zero_division=0)
+        self.labels, self.confusion_matrix = self.compute_confusion_matrix()
+        tp_sum = np.diag(self.confusion_matrix)
+        pred_sum = self.confusion_matrix.sum(axis=0)
+        true_sum = self.confusion_matrix.sum(axis=1)
+        self.precision_per_class = self.divide(tp_sum, pred_sum)
+        self.recall_per_class = self.divide(tp_sum, true_sum)
+        self.f1_per_class = self.divide(2 * tp_sum, true_sum + pred_sum)
+        self.support_per_class = true_sum
+
+        self.overall_accuracy = float(tp_sum.sum() / true_sum.sum())
+        self.overall_precision = float(np.average(self.precision_per_class, weights=true_sum))
+        self.overall_recall = float(np.average(self.recall_per_class, weights=true_sum))
         self.metrics_per_class = self.calculate_metrics_per_class() # might need to extend this for other metrics, so different function
 
     
@@ -72,11 +180,22 @@ class MetricsEvaluator:
 
     def calculate_metrics_per_class(self):
         """
-        Calculates precision, recall, and f1-score for each class individually.
+        Calculates precision, recall, and f1-score for each class individually, in the format of
+        sklearn's classification_report(output_dict=True).
         
         :return: A dictionary with the classification report for each class.
         """
-        return classification_report(self.y_test, self.y_pred, output_dict=True, zero_division=0)
+        headers = ["precision", "recall", "f1-score", "support"]
+        report = {}
+        for label, *scores in zip(self.labels, self.precision_per_class, self.recall_per_class, self.f1_per_class, self.support_per_class):
+            report["%s" % label] = dict(zip(headers, [float(score) for score in scores]))
+
+        support = float(np.sum(self.support_per_class))
+        per_class = [self.precision_per_class, self.recall_per_class, self.f1_per_class]
+        report["accuracy"] = self.overall_accuracy
+        report["macro avg"] = dict(zip(headers, [float(np.nanmean(values)) for values in per_class] + [support]))
+        report["weighted avg"] = dict(zip(headers, [float(np.average(values, weights=self.support_per_class)) for values in per_class] + [support]))
+        return report
     
     def print_metrics(self,by_class):
         """
@@ -0,0 +1,98 @@
+from collections import OrderedDict
+import hashlib
+import threading
+import weakref
+import numpy as np
+
+class PredictionCache:
+    """
+    The PredictionCache class stores model outputs keyed by the model's identity, the prediction method and a hash of the
+    input array, so that evaluations scoring the same (model, input) pair share one prediction.
+    Least recently used entries are evicted once the stored outputs exceed max_bytes.
+    """
+    def __init__(self, max_bytes=256 * 1024 * 1024):
+        """
+        Initializes an empty PredictionCache.
+
+        :param max_bytes: The maximum total size in bytes of the cached predictions.
+        """
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.__entries = OrderedDict()
+        self.__lock = threading.Lock()
+
+    @staticmethod
+    def hash_array(x):
+        """
+        Computes a content hash of an array, including its shape and dtype.
+
+        :param x: The array to hash.
+        :return: A hex digest identifying the content of x.
+        """
+        x = np.ascontiguousarray(x)
+        digest = hashlib.blake2b(digest_size=20)
+        digest.update(str((x.shape, x.dtype.str)).encode())
+        digest.update(x.view(np.uint8).data if x.size else b"")
+        return digest.hexdigest()
+
+    def get_or_compute(self, model, method_name, x, compute):
+        """
+        Returns the cached output of model.method_name(x), computing and storing it on a miss.
+
+        :param model: The model producing the predictions, identified by object identity.
+        :param method_name: The name of the prediction method, e.g. 'predict' or 'predict_proba'.
+        :param x: The input array.
+        :param compute: A callable returning the predictions when they are not cached.
+        :return: The (read-only) predictions.
+        """
+        key = (id(model), method_name, self.hash_array(x))
+        with self.__lock:
+            entry = self.__entries.get(key)
+            # The model reference guards against a new model reusing the id of a collected one.
+            if entry is not None and entry[0]() is model:
+                self.__entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+        y_pred = compute()
+        if not isinstance(y_pred, np.ndarray):
+            return y_pred
+        y_pred = y_pred.copy()
+        y_pred.setflags(write=False)
+        self.store(key, model, y_pred)
+        return y_pred
+
+    def store(self, key, model, y_pred):
+        """
+        Stores y_pred under key and evicts least recently used entries until the cache fits in max_bytes.
+        """
+        if y_pred.nbytes > self.max_bytes:
+            return
+        try:
+            model_ref = weakref.ref(model)
+        except TypeError:
+            return
+        with self.__lock:
+            previous = self.__entries.pop(key, None)
+            if previous is not None:
+                self.current_bytes -= previous[1].nbytes
+            self.__entries[key] = (model_ref, y_pred)
+            self.current_bytes += y_pred.nbytes
+            while self.current_bytes > self.max_bytes:
+                _, (_, evicted) = self.__entries.popitem(last=False)
+                self.current_bytes -= evicted.nbytes
+
+    def clear(self):
+        """
+        Removes all cached predictions and resets the hit/miss counters.
+        """
+        with self.__lock:
+            self.__entries.clear()
+            self.current_bytes = 0
+            self.hits = 0
+            self.misses = 0
+
+    def __len__(self):
+        return len(self.__entries)
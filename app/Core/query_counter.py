@@ -0,0 +1,67 @@
+from collections import OrderedDict
+import copy
+import threading
+import numpy as np
+
+class QueryCounter:
+    """
+    The QueryCounter class wraps the predict method of an ART classifier to count the queries an attack sends to the
+    model, and answers rows that were already queried from a bounded least recently used cache.
+    The wrapped estimator is a shallow copy of the classifier, so it shares the model and passes ART's estimator checks.
+    """
+    def __init__(self, classifier, max_rows=100000):
+        """
+        Initializes the QueryCounter.
+
+        :param classifier: The ART classifier to wrap.
+        :param max_rows: The maximum number of cached prediction rows.
+        """
+        self.classifier = classifier
+        self.max_rows = max_rows
+        self.queries = 0 # rows sent by the attack
+        self.model_queries = 0 # rows actually predicted by the model
+        self.calls = 0
+        self.model_calls = 0
+        self.__rows = OrderedDict()
+        self.__lock = threading.Lock()
+        self.estimator = copy.copy(classifier)
+        self.estimator.predict = self.predict
+
+    def predict(self, x, batch_size=128, **kwargs):
+        """
+        Predicts x, querying the model once for the distinct rows of x that are not cached.
+
+        :param x: The input rows.
+        :param batch_size: Ignored, the uncached rows are predicted in a single batch.
+        :return: The predictions of the classifier for x.
+        """
+        x = np.asarray(x)
+        self.calls += 1
+        self.queries += len(x)
+        if len(x) == 0:
+            return self.classifier.predict(x, **kwargs)
+        prefix = str((x.dtype.str, x.shape[1:])).encode()
+        keys = [prefix + row.tobytes() for row in np.ascontiguousarray(x).reshape(len(x), -1)]
+        y_pred = [None] * len(x)
+        missing = OrderedDict()
+        with self.__lock:
+            for i, key in enumerate(keys):
+                row = self.__rows.get(key)
+                if row is not None:
+                    self.__rows.move_to_end(key)
+                    y_pred[i] = row
+                else:
+                    missing.setdefault(key, []).append(i)
+        if missing:
+            first = [indices[0] for indices in missing.values()]
+            y_missing = self.classifier.predict(x[first], batch_size=len(first), **kwargs)
+            self.model_calls += 1
+            self.model_queries += len(first)
+            with self.__lock:
+                for (key, indices), row in zip(missing.items(), y_missing):
+                    for i in indices:
+                        y_pred[i] = row
+                    self.__rows[key] = row.copy()
+                while len(self.__rows) > self.max_rows:
+                    self.__rows.popitem(last=False)
+        return np.stack(y_pred)
@@ -0,0 +1,90 @@
+import numpy as np
+from skopt.space import Space
+from skopt.utils import create_result
+
+def stratified_order(y, random_state=None):
+    """
+    Returns a permutation of the sample indices whose every prefix is (approximately) stratified by class,
+    so that growing subsamples are nested and keep the class proportions of y.
+
+    :param y: The labels, one-hot encoded or not.
+    :param random_state: Seed of the permutation.
+    :return: The permuted sample indices.
+    """
+    y = np.asarray(y)
+    if y.ndim == 2 and y.shape[1] > 1:
+        y = np.argmax(y, axis=1)
+    rng = np.random.default_rng(random_state)
+    keys = np.empty(len(y))
+    for label in np.unique(y):
+        members = np.flatnonzero(y == label)
+        # The i-th sample drawn from a class is placed at the relative position (i + u) / class size.
+        keys[members] = (rng.permutation(len(members)) + rng.random(len(members))) / len(members)
+    return np.argsort(keys, kind="stable")
+
+class SuccessiveHalving:
+    """
+    The SuccessiveHalving class searches a skopt space by successive halving: random candidates are scored on a small
+    stratified subsample, and only the best 1/eta of them are promoted to an eta times larger subsample, until the
+    survivors are scored on the whole test set.
+    """
+    def __init__(self, space, n_candidates=27, min_samples=100, eta=3, random_state=0):
+        """
+        Initializes the search.
+
+        :param space: The list of skopt dimensions to search.
+        :param n_candidates: The number of random candidates of the first round.
+        :param min_samples: The subsample size of the first round.
+        :param eta: The factor by which the candidates are reduced and the subsample grows at each round.
+        :param random_state: Seed of the candidates and of the subsamples.
+        """
+        if eta < 2:
+            raise ValueError("eta must be at least 2.")
+        self.space = space
+        self.n_candidates = n_candidates
+        self.min_samples = min_samples
+        self.eta = eta
+        self.random_state = random_state
+        self.samples_spent = 0
+        self.exhaustive_samples = 0
+        self.n_samples = 0
+
+    def run(self, evaluate, y):
+        """
+        Runs the search, minimizing evaluate.
+
+        :param evaluate: A callable taking a candidate and the sorted indices of a subsample, returning the objective.
+        :param y: The labels of the test set, used to stratify the subsamples.
+        :return: A skopt OptimizeResult over the candidates scored on the whole test set.
+        """
+        n_samples = len(y)
+        self.n_samples = n_samples
+        order = stratified_order(y, self.random_state)
+        space = Space(self.space)
+        candidates = space.rvs(n_samples=self.n_candidates, random_state=self.random_state)
+        budget = min(self.min_samples, n_samples)
+        self.samples_spent = 0
+        while True:
+            indices = np.sort(order[:budget])
+            scores = [evaluate(params, indices) for params in candidates]
+            self.samples_spent += len(candidates) * budget
+            if budget == n_samples:
+                break
+            ranked = np.argsort(scores, kind="stable")[:max(1, len(candidates) // self.eta)]
+            candidates = [candidates[i] for i in ranked]
+            # A single survivor is scored on the whole test set right away
+            budget = n_samples if len(candidates) == 1 else min(budget * self.eta, n_samples)
+        self.exhaustive_samples = self.n_candidates * n_samples
+        return create_result(candidates, scores, space=space)
+
+    def describe_budget(self, n_calls):
+        """
+        Describes the samples spent by the last run for the logs, compared to the default search (n_calls Bayesian
+        optimization evaluations on the whole test set) and to scoring every candidate on the whole test set.
+
+        :param n_calls: The number of evaluations of the Bayesian optimization.
+        """
+        bayesian_samples = n_calls * self.n_samples
+        spent = self.samples_spent / bayesian_samples if bayesian_samples else 0.0
+        return (f"sample-evaluations={self.samples_spent}, bayesian={bayesian_samples} (n_calls={n_calls}), "
+                f"spent={spent:.1%} of bayesian, all-candidates={self.exhaustive_samples}")
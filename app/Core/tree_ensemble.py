@@ -0,0 +1,235 @@
+import json
+import numpy as np
+import xgboost as xgb
+from sklearn.tree import DecisionTreeClassifier
+from sklearn.ensemble import RandomForestClassifier
+
+# XGBoost objectives the TreeEnsemble can evaluate, with the transform of the raw margin into probabilities
+XGBOOST_OBJECTIVES = ("binary:logistic", "multi:softprob")
+
+class TreeEnsemble:
+    """
+    The TreeEnsemble class holds a decision tree, a random forest or an XGBoost model as flat arrays, one entry per node
+    of all trees (feature, threshold, children, missing value direction and leaf value), and evaluates all trees for a
+    batch of inputs at once with vectorized numpy operations.
+    Leaves point to themselves, so every sample is routed for max_depth steps without checking which ones are done.
+    Splits go left when x <= threshold, x being cast to float32 as the native models do.
+    """
+    def __init__(self, feature, threshold, left, right, missing_left, value, roots, max_depth, kind,
+                 tree_group=None, base_margin=None, objective=None, binary_proba=False):
+        """
+        Initializes the TreeEnsemble. Use TreeEnsemble.from_model to build one from a model.
+
+        :param feature, threshold, left, right, missing_left: The split of every node, leaves split on feature 0
+                                                              with an infinite threshold and point to themselves.
+        :param value: The leaf values, class probabilities for scikit-learn models and margins for XGBoost models.
+        :param roots: The index of the root node of every tree.
+        :param max_depth: The depth of the deepest tree.
+        :param kind: "sklearn" (the class probabilities of the trees are averaged) or "xgboost" (margins are summed).
+        :param tree_group: XGBoost only, the output (class) every tree contributes to.
+        :param base_margin: XGBoost only, the initial margin of every output.
+        :param objective: XGBoost only, one of XGBOOST_OBJECTIVES.
+        :param binary_proba: XGBoost only, if True binary:logistic predicts both class probabilities, as XGBClassifier.
+        """
+        self.feature = feature
+        self.threshold = threshold
+        self.left = left
+        self.right = right
+        self.missing_left = missing_left
+        self.value = value
+        self.roots = roots
+        self.max_depth = max_depth
+        self.kind = kind
+        self.tree_group = tree_group
+        self.base_margin = base_margin
+        self.objective = objective
+        self.binary_proba = binary_proba
+
+    @property
+    def n_trees(self):
+        return len(self.roots)
+
+    @property
+    def n_nodes(self):
+        return len(self.feature)
+
+    @classmethod
+    def from_model(cls, model):
+        """
+        Flattens a DecisionTreeClassifier, RandomForestClassifier, xgb.XGBClassifier or xgb.Booster.
+
+        :raises ValueError: If the model (or its objective, multi-output or categorical splits) is not supported.
+        """
+        if isinstance(model, DecisionTreeClassifier):
+            return cls.from_sklearn([model])
+        if isinstance(model, RandomForestClassifier):
+            return cls.from_sklearn(model.estimators_)
+        if isinstance(model, (xgb.XGBClassifier, xgb.Booster)):
+            return cls.from_xgboost(model)
+        raise ValueError(f"TreeEnsemble.from_model()::Unsupported model type: {type(model)}")
+
+    @classmethod
+    def from_sklearn(cls, estimators):
+        """
+        Flattens fitted scikit-learn decision trees, whose class probabilities are averaged.
+        """
+        features, thresholds, lefts, rights, missing_lefts, values, roots = [], [], [], [], [], [], []
+        offset = 0
+        for estimator in estimators:
+            tree = estimator.tree_
+            if tree.n_outputs != 1:
+                raise ValueError("TreeEnsemble.from_sklearn()::Multi-output trees are not supported")
+            nodes = np.arange(tree.node_count)
+            is_leaf = tree.children_left == -1
+            features.append(np.where(is_leaf, 0, tree.feature))
+            thresholds.append(np.where(is_leaf, np.inf, tree.threshold))
+            lefts.append(np.where(is_leaf, nodes, tree.children_left) + offset)
+            rights.append(np.where(is_leaf, nodes, tree.children_right) + offset)
+            # NaN never satisfies x <= threshold, so it goes right in versions without missing value support
+            missing_lefts.append(getattr(tree, "missing_go_to_left", np.zeros(tree.node_count, dtype=np.uint8)).astype(bool))
+            proba = tree.value[:, 0, :].astype(np.float64)
+            normalizer = proba.sum(axis=1, keepdims=True)
+            normalizer[normalizer == 0.0] = 1.0
+            values.append(proba / normalizer)
+            roots.append(offset)
+            offset += tree.node_count
+        return cls(feature=np.concatenate(features).astype(np.intp), threshold=np.concatenate(thresholds),
+                   left=np.concatenate(lefts).astype(np.intp), right=np.concatenate(rights).astype(np.intp),
+                   missing_left=np.concatenate(missing_lefts), value=np.concatenate(values), roots=np.array(roots, dtype=np.intp),
+                   max_depth=max(estimator.tree_.max_depth for estimator in estimators), kind="sklearn")
+
+    @classmethod
+    def from_xgboost(cls, model):
+        """
+        Flattens an XGBoost tree booster from its JSON dump. The trees used are those of XGBClassifier.predict_proba,
+        i.e. up to the best iteration when the model was fitted with early stopping.
+        """
+        booster = model.get_booster() if isinstance(model, xgb.XGBClassifier) else model
+        learner = json.loads(booster.save_raw("json"))["learner"]
+        objective = learner["objective"]["name"]
+        if objective not in XGBOOST_OBJECTIVES:
+            raise ValueError(f"TreeEnsemble.from_xgboost()::Unsupported objective: {objective}")
+        if learner["gradient_booster"]["name"] != "gbtree":
+            raise ValueError(f"TreeEnsemble.from_xgboost()::Unsupported booster: {learner['gradient_booster']['name']}")
+        gbtree = learner["gradient_booster"]["model"]
+        trees = gbtree["trees"]
+        tree_group = np.array(gbtree["tree_info"], dtype=np.intp)
+        try:
+            best_iteration = model.best_iteration if isinstance(model, xgb.XGBClassifier) else None
+        except AttributeError:
+            best_iteration = None
+        if best_iteration is not None:
+            n_trees = gbtree["iteration_indptr"][best_iteration + 1]
+            trees, tree_group = trees[:n_trees], tree_group[:n_trees]
+
+        features, thresholds, lefts, rights, missing_lefts, values, roots, depths = [], [], [], [], [], [], [], []
+        offset = 0
+        for tree in trees:
+            if any(tree["split_type"]) or int(tree["tree_param"].get("size_leaf_vector", "1")) > 1:
+                raise ValueError("TreeEnsemble.from_xgboost()::Categorical splits and vector leaves are not supported")
+            left = np.array(tree["left_children"], dtype=np.intp)
+            right = np.array(tree["right_children"], dtype=np.intp)
+            condition = np.array(tree["split_conditions"], dtype=np.float32)
+            nodes = np.arange(len(left))
+            is_leaf = left == -1
+            features.append(np.where(is_leaf, 0, tree["split_indices"]))
+            # XGBoost goes left when x < condition in float32, i.e. x <= the largest float32 below condition
+            thresholds.append(np.where(is_leaf, np.inf, np.nextafter(condition, np.float32(-np.inf)).astype(np.float64)))
+            lefts.append(np.where(is_leaf, nodes, left) + offset)
+            rights.append(np.where(is_leaf, nodes, right) + offset)
+            missing_lefts.append(np.array(tree["default_left"], dtype=bool))
+            # The leaf value is stored as the split condition of the leaf
+            values.append(np.where(is_leaf, condition, np.float32(0)))
+            roots.append(offset)
+            depths.append(cls.get_depth(left, right))
+            offset += len(left)
+
+        return cls(feature=np.concatenate(features).astype(np.intp), threshold=np.concatenate(thresholds),
+                   left=np.concatenate(lefts), right=np.concatenate(rights), missing_left=np.concatenate(missing_lefts),
+                   value=np.concatenate(values).astype(np.float32), roots=np.array(roots, dtype=np.intp),
+                   max_depth=max(depths, default=0), kind="xgboost", tree_group=tree_group,
+                   base_margin=cls.get_base_margin(booster), objective=objective,
+                   binary_proba=isinstance(model, xgb.XGBClassifier))
+
+    @staticmethod
+    def get_base_margin(booster):
+        """
+        Returns the margin XGBoost starts every output from. It is read from the predictions of a copy of the booster
+        whose leaves are all zero, rather than derived from base_score, whose JSON form is rounded.
+        """
+        model = json.loads(booster.save_raw("json"))
+        for tree in model["learner"]["gradient_booster"]["model"]["trees"]:
+            tree["split_conditions"] = [0.0 if left == -1 else condition
+                                        for left, condition in zip(tree["left_children"], tree["split_conditions"])]
+        zero_booster = xgb.Booster(model_file=bytearray(json.dumps(model).encode()))
+        margin = zero_booster.inplace_predict(np.zeros((1, booster.num_features()), dtype=np.float32), predict_type="margin")
+        return np.asarray(margin, dtype=np.float32).ravel()
+
+    @staticmethod
+    def get_depth(left, right):
+        """
+        Returns the depth of a tree given by its child arrays (-1 for leaves), the root being node 0.
+        """
+        depth, level = 0, np.array([0])
+        while True:
+            level = np.concatenate([left[level], right[level]])
+            level = level[level != -1]
+            if len(level) == 0:
+                return depth
+            depth += 1
+
+    def apply(self, x):
+        """
+        Returns the index of the leaf every sample reaches in every tree.
+
+        :param x: The input samples, of shape (n_samples, n_features).
+        :return: An array of shape (n_samples, n_trees) of node indices.
+        """
+        x = np.asarray(x, dtype=np.float32).reshape(len(x), -1)
+        rows = np.arange(len(x))[:, None]
+        nodes = np.broadcast_to(self.roots, (len(x), self.n_trees)).copy()
+        for _ in range(self.max_depth):
+            values = x[rows, self.feature[nodes]]
+            go_left = (values <= self.threshold[nodes]) | (np.isnan(values) & self.missing_left[nodes])
+            nodes = np.where(go_left, self.left[nodes], self.right[nodes])
+        return nodes
+
+    def predict_proba(self, x):
+        """
+        Returns the class probabilities of the samples, as the native model's predict_proba.
+
+        :param x: The input samples, of shape (n_samples, n_features).
+        :return: An array of shape (n_samples, n_classes).
+        """
+        leaves = self.apply(x)
+        if self.kind == "sklearn":
+            # Summed tree by tree and then averaged, as RandomForestClassifier.predict_proba
+            proba = self.sequential_sum(self.value[leaves.T])
+            return proba / self.n_trees if self.n_trees > 1 else proba
+        margin = np.empty((len(leaves), len(self.base_margin)), dtype=np.float32)
+        leaf_values = self.value[leaves]
+        for group, base in enumerate(self.base_margin):
+            # XGBoost adds the leaf values to the base margin tree by tree in float32
+            terms = np.vstack([np.full((1, len(leaves)), base, dtype=np.float32), leaf_values[:, self.tree_group == group].T])
+            margin[:, group] = self.sequential_sum(terms)
+        if self.objective == "binary:logistic":
+            proba = (np.float32(1) / (np.float32(1) + self.expf(-margin)))[:, 0]
+            return np.column_stack([1 - proba, proba]) if self.binary_proba else proba
+        exp = self.expf(margin - margin.max(axis=1, keepdims=True))
+        # XGBoost sums the exponentials in float64
+        return exp / self.sequential_sum(exp.T.astype(np.float64)).astype(np.float32)[:, None]
+
+    @staticmethod
+    def sequential_sum(terms):
+        """
+        Sums terms over the first axis one term after the other, as the native models do. np.sum may sum pairwise,
+        which rounds differently.
+        """
+        return np.cumsum(terms, axis=0)[-1]
+
+    @staticmethod
+    def expf(x):
+        """
+        The float32 exponential, correctly rounded like the C expf used by XGBoost (numpy's float32 exp may differ by an ulp).
+        """
+        return np.exp(x.astype(np.float64)).astype(np.float32)
@@ -0,0 +1,59 @@
+from contextlib import closing
+import hashlib
+import json
+import sqlite3
+import numpy as np
+
+def to_json(value):
+    """
+    Serializes value to a canonical JSON string, converting numpy scalars and arrays to Python values.
+    """
+    def default(obj):
+        if isinstance(obj, (np.generic, np.ndarray)):
+            return obj.tolist()
+        return str(obj)
+    return json.dumps(value, sort_keys=True, default=default)
+
+class TrialStore:
+    """
+    The TrialStore class persists the evaluated configurations of parameter optimizations in a SQLite database,
+    keyed by a study key identifying the model, the test data and the optimized attack or defense, so that
+    later optimizations of the same study can be warm-started or answered right away.
+    """
+    def __init__(self, path):
+        """
+        Initializes the TrialStore, creating the database at path if needed.
+
+        :param path: The path of the SQLite database file.
+        """
+        self.path = path
+        with closing(sqlite3.connect(self.path)) as connection, connection:
+            connection.execute("CREATE TABLE IF NOT EXISTS trials (study TEXT NOT NULL, params TEXT NOT NULL, objective REAL NOT NULL)")
+            connection.execute("CREATE INDEX IF NOT EXISTS trials_study ON trials (study)")
+
+    @staticmethod
+    def make_key(*parts):
+        """
+        Hashes the JSON serializable parts (e.g. model and data digests, a configuration dict) into a study key.
+        """
+        return hashlib.blake2b(to_json(parts).encode(), digest_size=20).hexdigest()
+
+    def add_trial(self, study, params, objective):
+        """
+        Records the objective of one evaluated configuration. Failed (non-finite) evaluations are not stored.
+        """
+        if not np.isfinite(objective):
+            return
+        with closing(sqlite3.connect(self.path)) as connection, connection:
+            connection.execute("INSERT INTO trials (study, params, objective) VALUES (?, ?, ?)",
+                               (study, to_json(list(params)), float(objective)))
+
+    def get_trials(self, study):
+        """
+        Returns the stored trials of a study.
+
+        :return: The evaluated configurations (x0) and their objectives (y0), in evaluation order.
+        """
+        with closing(sqlite3.connect(self.path)) as connection:
+            rows = connection.execute("SELECT params, objective FROM trials WHERE study = ? ORDER BY rowid", (study,)).fetchall()
+        return [json.loads(params) for params, _ in rows], [objective for _, objective in rows]
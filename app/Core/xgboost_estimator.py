@@ -0,0 +1,57 @@
+from art.estimators.classification import XGBoostClassifier
+from art.utils import to_categorical
+import numpy as np
+import xgboost as xgb
+
+class InplaceXGBoostClassifier(XGBoostClassifier):
+    """
+    The InplaceXGBoostClassifier class is an ART XGBoostClassifier predicting with Booster.inplace_predict on
+    contiguous float32 arrays, instead of building a DMatrix for every call. Its predictions are those of
+    XGBoostClassifier, but the per-call overhead is much lower for the many tiny queries of decision-based attacks.
+    """
+    def __init__(self, model, nthread=None, **kwargs):
+        """
+        Initializes the InplaceXGBoostClassifier.
+
+        :param model: The xgb.XGBClassifier or xgb.Booster to wrap.
+        :param nthread: The number of threads XGBoost uses per predict, XGBoost's default if None.
+                        Set it to 1 when the predictions already run in a pool of workers. It is set on a copy
+                        of the booster, the booster of model keeps its own setting.
+        :param kwargs: The other arguments of XGBoostClassifier (nb_features, nb_classes, clip_values, ...).
+        """
+        super().__init__(model=model, **kwargs)
+        self.nthread = nthread
+        booster = model.get_booster() if isinstance(model, xgb.XGBClassifier) else model
+        if nthread is not None:
+            booster = booster.copy()
+            booster.set_param({"nthread": nthread})
+        self._booster = booster
+        # Same trees as XGBClassifier.predict_proba when the model was fitted with early stopping
+        try:
+            self._iteration_range = (0, model.best_iteration + 1) if isinstance(model, xgb.XGBClassifier) else (0, 0)
+        except AttributeError:
+            self._iteration_range = (0, 0)
+
+    def predict(self, x, **kwargs):
+        """
+        Perform prediction for a batch of inputs.
+
+        :param x: Input samples.
+        :return: Array of predictions of shape (nb_inputs, nb_classes).
+        """
+        x_preprocessed, _ = self._apply_preprocessing(x, y=None, fit=False)
+        y_prediction = self.predict_booster(x_preprocessed)
+        if y_prediction.ndim == 1:
+            if isinstance(self._model, xgb.XGBClassifier):
+                # binary:logistic gives the probability of the positive class, as in XGBClassifier.predict_proba
+                y_prediction = np.column_stack([1 - y_prediction, y_prediction])
+            else:
+                y_prediction = to_categorical(labels=y_prediction, nb_classes=self.nb_classes)
+        return self._apply_postprocessing(preds=y_prediction, fit=False)
+
+    def predict_booster(self, x):
+        """
+        Returns the output of the booster for the preprocessed x, as Booster.predict.
+        """
+        x = np.ascontiguousarray(x, dtype=np.float32)
+        return self._booster.inplace_predict(x, iteration_range=self._iteration_range)
@@ -30,12 +30,14 @@ def get_os_type():
         return "Unknown"
     
 class Json_To_Pdf:
-    def __init__(self, json_file, data, adv_examples):
+    def __init__(self, json_file, data, adv_examples, output_pdf=None):
         self.json_file = json_file
         self.output_pdf = os.path.dirname(os.path.realpath(filename))+"/app/Reports/"+filename+".pdf"
         self.data = data
         self.adv = adv_examples
         self.path = os.path.dirname(os.path.abspath(__file__))+"/"+filename+".pdf"
+        if output_pdf is not None:
+            self.output_pdf = self.path = output_pdf
         with open(self.json_file, 'r') as f:
             json_data = json.load(f)
         methods = list(json_data.keys())
@@ -211,7 +213,7 @@ class Json_To_Pdf:
         results["rec"] = [x for x in recall_values]
         return results
 
-    def create_pdf(self):
+    def create_pdf(self, open_pdf=True):
         ##print("output path:", self.output_pdf)
         with open(self.json_file, 'r') as f:
             json_data = json.load(f)
@@ -414,7 +416,9 @@ class Json_To_Pdf:
         for filename in os.listdir(os.getcwd()):
             if filename.endswith('.png'):
                 os.remove(os.path.join(os.getcwd(), filename))
-        self.open_pdf()
+        if open_pdf:
+            self.open_pdf()
+        return self.output_pdf
 
 
     # # Example usage:
@@ -2,9 +2,9 @@ import app.Reports.json_to_pdf_converter as jtp
 import json
 
 class Report_Generator:
-    def __init__(self, all_metrics):
+    def __init__(self, all_metrics, file="metrics.json"):
             self.all_metrics = all_metrics
-            self.file = "metrics.json"
+            self.file = file
 
     def dict_preperation(self):
         to_be_changed = []
@@ -25,7 +25,7 @@ class Report_Generator:
         with open(self.file, "w") as json_file:
             json.dump(self.all_metrics, json_file)
 
-    def generate_pdf(self, data, adv_examples):
+    def generate_pdf(self, data, adv_examples, output_pdf=None, open_pdf=True):
          self.build_json()
-         pdf = jtp.Json_To_Pdf(self.file, data, adv_examples)
-         return pdf.create_pdf()
\ No newline at end of file
+         pdf = jtp.Json_To_Pdf(self.file, data, adv_examples, output_pdf=output_pdf)
+         return pdf.create_pdf(open_pdf=open_pdf)
\ No newline at end of file
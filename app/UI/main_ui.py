@@ -243,6 +243,9 @@ class Main_UI:
                 if param not in updated_config:  # Exclude already copied essential attributes
                     input_value = dpg.get_value(f"{defense_config['name']}_{param}")
                     original_type = type(value)
+                    if value is None: # optional integers such as a random_state, shown as "None"
+                        updated_config[param] = int(input_value) if input_value and input_value != "None" else None
+                        continue
                     updated_config[param] = original_type(input_value) if input_value else value  # Fallback to original value if input is empty
             updated_defenses_config.append(updated_config)
         
@@ -0,0 +1,238 @@
+"""
+Batch evaluation of several models against the same attack suite, without the UI.
+
+    python -m app.batch_runner manifest.yaml --workers 4 --output batch_metrics.csv
+
+A manifest looks like:
+
+    entries:
+      - {model: models/iris_xgboost.model, library: XGBoost, x: models/iris_xgboost_x_test.npy, y: models/iris_xgboost_y_test.npy}
+      - {name: iris_tree, model: models/iris_decision_tree.model, library: scikit-learn,
+         x: models/iris_xgboost_x_test.npy, y: models/iris_xgboost_y_test.npy}
+    attacks: [HopSkipJump, {name: BoundaryAttack, max_iter: 50}]
+    defenses: [FeatureSqueezing, ClassLabels]
+    workers: 4
+
+The attacks and defenses are given as in a run spec of app.cli; those not applicable to the library of an entry are
+left out for it. The entries run in a pool of workers processes, and each test set (x, y) is read once however many
+entries share it. The metrics of all entries are written to a single table (.csv or .json), with one
+row per entry and evaluation.
+"""
+import argparse
+import csv
+import json
+import os
+import sys
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from app.config import supported_libraries, supported_attacks, supported_defenses, pipeline_settings
+from app.data_loader import DataLoader
+from app.Core.main_core import Main_Core
+from app.cli import (config_list_schema, read_spec, resolve_paths, resolve_configs, apply_pipeline_settings,
+                     run_pipeline, EXIT_OK, EXIT_FAILED, EXIT_INVALID_SPEC)
+
+manifest_schema = {
+    "type": "object",
+    "properties": {
+        "entries": {
+            "type": "array",
+            "minItems": 1,
+            "items": {
+                "type": "object",
+                "properties": {
+                    "name": {"type": "string"},
+                    "model": {"type": "string"},
+                    "library": {"enum": list(supported_libraries)},
+                    "x": {"type": "string"},
+                    "y": {"type": "string"},
+                },
+                "required": ["model", "library", "x"],
+                "additionalProperties": False,
+            },
+        },
+        "attacks": config_list_schema,
+        "defenses": config_list_schema,
+        "optimize": {"type": "boolean"},
+        "pipeline": {"type": "object"},
+        "workers": {"type": "integer", "minimum": 1},
+        "output": {"type": "string"},
+    },
+    "required": ["entries"],
+    "additionalProperties": False,
+}
+
+# Test sets loaded in this process, keyed by their (x, y) paths, so entries sharing one read it once
+worker_datasets = {}
+
+def load_manifest(path):
+    """
+    Reads a batch manifest from a .json, .yaml or .yml file and resolves its relative paths against the file's directory.
+    Entries without a name are named after their model file.
+
+    :raises ValueError: If the manifest is not valid.
+    """
+    manifest = read_spec(path, manifest_schema)
+    base_dir = os.path.dirname(os.path.abspath(path))
+    resolve_paths(manifest, ("output",), base_dir)
+    for entry in manifest["entries"]:
+        entry.setdefault("name", os.path.splitext(os.path.basename(entry["model"]))[0])
+        resolve_paths(entry, ("model", "x", "y"), base_dir)
+    return manifest
+
+def get_dataset(x_path, y_path):
+    """
+    Returns a DataLoader holding the test set (x_path, y_path), loading it on its first use in this process.
+
+    :raises ValueError: If the test set cannot be loaded.
+    """
+    key = (x_path, y_path)
+    if key not in worker_datasets:
+        dataloader = DataLoader()
+        if not dataloader.load_test(x_path, y_path):
+            raise ValueError(f"Failed to load the test data {x_path}, {y_path}")
+        worker_datasets[key] = dataloader
+    return worker_datasets[key]
+
+def init_worker(pipeline_overrides):
+    """
+    Initializes a pool worker with the pipeline_settings overrides of the manifest.
+    """
+    apply_pipeline_settings(pipeline_overrides)
+
+def evaluate_entry(entry, attacks, defenses, optimize=False):
+    """
+    Runs the pipeline of Main_Core for one manifest entry.
+
+    :param entry: The manifest entry, a dict of name, model, library, x and y.
+    :param attacks: The attack configurations applicable to the entry's library.
+    :param defenses: The defense configurations applicable to the entry's library.
+    :return: The table rows of the entry, a single row with the error if the entry failed.
+    """
+    try:
+        dataloader = DataLoader()
+        if not dataloader.load_model(supported_libraries[entry["library"]], entry["model"]):
+            raise ValueError(f"Failed to load the model {entry['model']}")
+        dataloader.share_test(get_dataset(entry["x"], entry.get("y")))
+        core = Main_Core()
+        core.dataloader = dataloader
+        try:
+            metrics, _ = run_pipeline(core, attacks, defenses, optimize, progress_callback=lambda message: None)
+        finally:
+            core.cleanup_spill_dir()
+    except Exception as e:
+        # Only the message is returned, the exceptions of ART may hold the classifier, which cannot be pickled
+        return get_rows(entry, error=str(e))
+    return get_rows(entry, metrics)
+
+def get_rows(entry, metrics=None, error=None):
+    """
+    Flattens the metrics of an entry into table rows, one per evaluation (clean, attack, defense or defense on attack).
+    The per-class metrics are left out; a failed entry gets a single row with its error.
+    """
+    columns = {"model": entry["name"], "library": entry["library"], "x": entry["x"]}
+    if error is not None:
+        return [dict(columns, error=error)]
+    rows = []
+    for key, values in metrics.items():
+        if isinstance(key, tuple):
+            defense, attack = key
+        else:
+            defense, attack = (None, key) if key in supported_attacks else (key, None) if key in supported_defenses else (None, None)
+        row = dict(columns, defense=defense, attack=attack)
+        row.update({name: value for name, value in values.items() if not isinstance(value, dict)})
+        rows.append(row)
+    return rows
+
+def write_table(rows, path):
+    """
+    Writes the rows to path, as CSV if it ends with .csv and as a JSON list of rows otherwise.
+    """
+    if os.path.dirname(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+    if path.endswith(".csv"):
+        fieldnames = []
+        for row in rows:
+            fieldnames += [name for name in row if name not in fieldnames]
+        with open(path, "w", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=fieldnames)
+            writer.writeheader()
+            writer.writerows(rows)
+    else:
+        with open(path, "w") as f:
+            json.dump(rows, f, indent=2, default=lambda obj: obj.item() if hasattr(obj, "item") else str(obj))
+
+def run_batch(manifest, workers=None, progress_callback=print):
+    """
+    Evaluates every entry of the manifest, in a pool of worker processes or serially in this process if workers
+    is 1 or None. Every test set is loaded once, before the entries run.
+
+    :param manifest: The manifest, as returned by load_manifest.
+    :param workers: The number of worker processes.
+    :return: The rows of the consolidated table, in manifest order, and the number of failed entries.
+    :raises ValueError: If an attack or defense of the manifest is not supported.
+    """
+    configs = {}
+    for library in {entry["library"] for entry in manifest["entries"]}:
+        configs[library] = (resolve_configs(manifest.get("attacks", []), supported_attacks, library, "attack", skip_inapplicable=True),
+                            resolve_configs(manifest.get("defenses", []), supported_defenses, library, "defense", skip_inapplicable=True))
+    optimize = manifest.get("optimize", False)
+    pipeline_overrides = manifest.get("pipeline", {})
+    apply_pipeline_settings(pipeline_overrides)
+    entries = manifest["entries"]
+    # Loaded before the pool starts, so that forked workers inherit the test sets instead of reading them again
+    for x_path, y_path in {(entry["x"], entry.get("y")) for entry in entries}:
+        try:
+            get_dataset(x_path, y_path)
+        except ValueError:
+            pass # reported by the entries of the test set
+    results = [None] * len(entries)
+
+    def collect(i, rows):
+        results[i] = rows
+        status = f"failed: {rows[0]['error']}" if "error" in rows[0] else "done"
+        progress_callback(f"{entries[i]['name']} {status} ({sum(r is not None for r in results)}/{len(entries)})")
+
+    if workers is None or workers <= 1:
+        for i, entry in enumerate(entries):
+            collect(i, evaluate_entry(entry, *configs[entry["library"]], optimize))
+    else:
+        with ProcessPoolExecutor(max_workers=workers, initializer=init_worker, initargs=(pipeline_overrides,)) as pool:
+            futures = {pool.submit(evaluate_entry, entry, *configs[entry["library"]], optimize): i for i, entry in enumerate(entries)}
+            for future in as_completed(futures):
+                collect(futures[future], future.result())
+    failed = sum("error" in rows[0] for rows in results)
+    return [row for rows in results for row in rows], failed
+
+def get_parser():
+    parser = argparse.ArgumentParser(prog="python -m app.batch_runner", description="Evaluates the models of a manifest against the same attack suite.")
+    parser.add_argument("manifest", help="The JSON or YAML batch manifest.")
+    parser.add_argument("--workers", type=int, help="The number of worker processes, overrides the manifest.")
+    parser.add_argument("--output", help="Where the consolidated table (.csv or .json) is written (default batch_metrics.csv).")
+    parser.add_argument("--quiet", action="store_true", help="Do not print progress messages.")
+    return parser
+
+def main(argv=None):
+    """
+    Runs the batch described by the manifest and arguments in argv.
+
+    :return: The exit code, EXIT_OK, EXIT_FAILED if any entry failed or EXIT_INVALID_SPEC.
+    """
+    args = get_parser().parse_args(argv)
+    progress_callback = (lambda message: None) if args.quiet else print
+    try:
+        manifest = load_manifest(args.manifest)
+        workers = args.workers or manifest.get("workers") or pipeline_settings["batch_workers"]
+        output = args.output or manifest.get("output", "batch_metrics.csv")
+        rows, failed = run_batch(manifest, workers, progress_callback)
+    except (OSError, ValueError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return EXIT_INVALID_SPEC
+    except Exception:
+        traceback.print_exc()
+        return EXIT_FAILED
+    write_table(rows, output)
+    progress_callback(f"Metrics of {len(manifest['entries']) - failed}/{len(manifest['entries'])} models written to {output}")
+    return EXIT_FAILED if failed else EXIT_OK
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,239 @@
+"""
+Headless entry point: runs the evaluation pipeline of Main_Core from a JSON or YAML run spec, without the UI.
+
+    python -m app.cli run.yaml --output metrics.json [--pdf report.pdf]
+
+A run spec looks like:
+
+    model: models/iris_xgboost.model
+    library: XGBoost
+    x: models/iris_xgboost_x_test.npy
+    y: models/iris_xgboost_y_test.npy
+    attacks: [HopSkipJump, {name: BoundaryAttack, max_iter: 50}]
+    defenses: [FeatureSqueezing, ClassLabels]
+    optimize: false
+    pipeline: {attack_workers: 4, matrix_workers: 4}
+
+Attacks and defenses are given by name (default parameters) or as a dict overriding some parameters.
+"pipeline" overrides entries of pipeline_settings. Relative paths in a spec are relative to the spec file.
+"""
+import argparse
+import copy
+import json
+import os
+import sys
+import traceback
+from jsonschema import validate
+import jsonschema
+from app.config import supported_libraries, supported_attacks, supported_defenses, pipeline_settings
+from app.data_loader import DataLoader
+from app.Core.main_core import Main_Core
+from app.Reports.report_generator import Report_Generator
+
+# Exit codes of the runner
+EXIT_OK = 0
+EXIT_FAILED = 1 # the model or data could not be loaded, or the pipeline raised
+EXIT_INVALID_SPEC = 2 # the run spec or the arguments are invalid
+
+config_list_schema = {
+    "type": "array",
+    "items": {
+        "anyOf": [
+            {"type": "string"},
+            {"type": "object", "properties": {"name": {"type": "string"}}, "required": ["name"]},
+        ]
+    },
+}
+
+run_spec_schema = {
+    "type": "object",
+    "properties": {
+        "model": {"type": "string"},
+        "library": {"enum": list(supported_libraries)},
+        "x": {"type": "string"},
+        "y": {"type": "string"},
+        "attacks": config_list_schema,
+        "defenses": config_list_schema,
+        "optimize": {"type": "boolean"},
+        "pipeline": {"type": "object"},
+        "output": {"type": "string"},
+        "pdf": {"type": "string"},
+    },
+    "additionalProperties": False,
+}
+
+def read_spec(path, schema):
+    """
+    Reads a .json, .yaml or .yml file and validates it against schema.
+
+    :raises ValueError: If the file does not match the schema.
+    """
+    with open(path) as f:
+        if path.endswith((".yaml", ".yml")):
+            import yaml
+            spec = yaml.safe_load(f) or {}
+        else:
+            spec = json.load(f)
+    try:
+        validate(instance=spec, schema=schema)
+    except jsonschema.ValidationError as e:
+        raise ValueError(f"Invalid spec {path}: {e.message}")
+    return spec
+
+def resolve_paths(spec, keys, base_dir):
+    """
+    Makes the relative paths under keys of spec relative to base_dir.
+    """
+    for key in keys:
+        if key in spec:
+            spec[key] = os.path.join(base_dir, spec[key])
+
+def load_spec(path):
+    """
+    Reads a run spec from a .json, .yaml or .yml file and resolves its relative paths against the file's directory.
+
+    :raises ValueError: If the spec is not valid.
+    """
+    spec = read_spec(path, run_spec_schema)
+    resolve_paths(spec, ("model", "x", "y", "output", "pdf"), os.path.dirname(os.path.abspath(path)))
+    return spec
+
+def resolve_configs(entries, supported, library, kind, skip_inapplicable=False):
+    """
+    Builds the attack or defense configurations of a spec from the supported defaults.
+
+    :param entries: The names, or dicts of a name and the parameters to override.
+    :param supported: supported_attacks or supported_defenses.
+    :param library: The library of the model, every configuration must be applicable to it.
+    :param kind: "attack" or "defense", for error messages.
+    :param skip_inapplicable: If True, configurations not applicable to the library are left out instead.
+    :raises ValueError: On an unknown name or parameter, or a configuration not applicable to the library.
+    """
+    configs = []
+    for entry in entries:
+        overrides = {"name": entry} if isinstance(entry, str) else dict(entry)
+        name = overrides["name"]
+        if name not in supported:
+            raise ValueError(f"Unsupported {kind}: {name}")
+        config = copy.deepcopy(supported[name])
+        unknown = set(overrides) - set(config)
+        if unknown:
+            raise ValueError(f"Unknown parameters of {kind} {name}: {sorted(unknown)}")
+        if library not in config["applicable_to"]:
+            if skip_inapplicable:
+                continue
+            raise ValueError(f"The {kind} {name} is not applicable to {library} models")
+        config.update(overrides)
+        configs.append(config)
+    return configs
+
+def apply_pipeline_settings(overrides):
+    """
+    Overrides entries of pipeline_settings, before Main_Core reads them.
+
+    :raises ValueError: On an unknown setting.
+    """
+    unknown = set(overrides) - set(pipeline_settings)
+    if unknown:
+        raise ValueError(f"Unknown pipeline settings: {sorted(unknown)}")
+    pipeline_settings.update(overrides)
+
+def create_dataloader(model_path, library, x_path, y_path):
+    """
+    Loads the model and test data.
+
+    :return: The DataLoader, or None if the model or the data could not be loaded.
+    """
+    dataloader = DataLoader()
+    if not dataloader.load_model(supported_libraries[library], model_path):
+        return None
+    if not dataloader.load_test(x_path, y_path):
+        return None
+    return dataloader
+
+def run_pipeline(core, attacks, defenses, optimize=False, progress_callback=print):
+    """
+    Runs benign evaluation, attacks, defenses and defenses on attacks, as Controller.start_main_pipeline.
+
+    :param core: A Main_Core whose dataloader is set.
+    :param optimize: If True, the attack and defense parameters are optimized first.
+    :return: The metrics of all stages in a single dict, and the adversarial examples.
+    """
+    if optimize:
+        progress_callback("Performing attack optimization...")
+        attacks = core.optimize_attacks(attacks)
+        progress_callback("Performing defense optimization...")
+        defenses = core.optimize_defenses(defenses)
+    progress_callback("Performing benign evaluation...")
+    metrics = core.perform_benign_evaluation()
+    progress_callback("perform_attacks...")
+    metrics_att, adv_examples = core.perform_attacks(attacks, progress_callback=progress_callback)
+    progress_callback("perform_defenses...")
+    metrics_def, _ = core.perform_defenses(defenses)
+    progress_callback("perform_defenses_on_attacks...")
+    metrics_att_def, _ = core.perform_defenses_on_attacks(defenses, adv_examples)
+    metrics.update(metrics_att)
+    metrics.update(metrics_def)
+    metrics.update(metrics_att_def)
+    return metrics, adv_examples
+
+def get_parser():
+    parser = argparse.ArgumentParser(prog="python -m app.cli", description="Runs the evaluation pipeline headless, from a run spec.")
+    parser.add_argument("spec", help="The JSON or YAML run spec.")
+    parser.add_argument("--model", help="The model file, overrides the spec.")
+    parser.add_argument("--library", choices=list(supported_libraries), help="The model library, overrides the spec.")
+    parser.add_argument("--x", help="The test data (.npy or .npz), overrides the spec.")
+    parser.add_argument("--y", help="The test labels (.npy), overrides the spec.")
+    parser.add_argument("--optimize", action="store_true", default=None, help="Optimize the attack and defense parameters first.")
+    parser.add_argument("--output", help="Where the metrics JSON is written (default metrics.json).")
+    parser.add_argument("--pdf", help="If set, the PDF report is written to this path.")
+    parser.add_argument("--quiet", action="store_true", help="Do not print progress messages.")
+    return parser
+
+def main(argv=None):
+    """
+    Runs the pipeline for the spec and arguments in argv.
+
+    :return: The exit code, EXIT_OK, EXIT_FAILED or EXIT_INVALID_SPEC.
+    """
+    args = get_parser().parse_args(argv)
+    try:
+        spec = load_spec(args.spec)
+        for key in ("model", "library", "x", "y", "optimize", "output", "pdf"):
+            if getattr(args, key) is not None:
+                spec[key] = getattr(args, key)
+        missing = [key for key in ("model", "library", "x") if key not in spec]
+        if missing:
+            raise ValueError(f"Missing {missing} in the run spec and arguments")
+        attacks = resolve_configs(spec.get("attacks", []), supported_attacks, spec["library"], "attack")
+        defenses = resolve_configs(spec.get("defenses", []), supported_defenses, spec["library"], "defense")
+        apply_pipeline_settings(spec.get("pipeline", {}))
+    except (OSError, ValueError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return EXIT_INVALID_SPEC
+
+    progress_callback = (lambda message: None) if args.quiet else print
+    try:
+        dataloader = create_dataloader(spec["model"], spec["library"], spec["x"], spec.get("y"))
+        if dataloader is None:
+            print(f"Error: failed to load {spec['model']} or its test data", file=sys.stderr)
+            return EXIT_FAILED
+        core = Main_Core()
+        core.dataloader = dataloader
+        try:
+            metrics, adv_examples = run_pipeline(core, attacks, defenses, spec.get("optimize", False), progress_callback)
+            report = Report_Generator(metrics, file=spec.get("output", "metrics.json"))
+            if spec.get("pdf"):
+                progress_callback(f"PDF report written to {report.generate_pdf(dataloader, adv_examples, output_pdf=spec['pdf'], open_pdf=False)}")
+            else:
+                report.build_json()
+        finally:
+            core.cleanup_spill_dir()
+        progress_callback(f"Metrics written to {report.file}")
+    except Exception:
+        traceback.print_exc()
+        return EXIT_FAILED
+    return EXIT_OK
+
+if __name__ == "__main__":
+    sys.exit(main())
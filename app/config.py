@@ -1,6 +1,34 @@
 from jsonschema import validate
 import jsonschema
 
+# Settings of the evaluation pipeline itself, independent of the selected attacks and defenses
+pipeline_settings = {
+    "prediction_cache_bytes": 256 * 1024 * 1024, # predictions shared between evaluations of the same (model, input)
+    "batch_size": None, # if set, data is attacked, defended and evaluated in batches of this many rows
+    "spill_dir": None, # where batched adversarial/defended arrays are written, a temporary directory if None
+    "attack_workers": None, # if > 1, attacks run concurrently in a pool of this many worker processes
+    "attack_shards": None, # if > 1, each attack (run sequentially) is split into this many row shards run in parallel
+    "attack_random_state": None, # seed of the per-shard seeds of sharded attacks
+    "count_queries": False, # count the model queries of every attack and report them next to its accuracy (slower, per-sample attacks run row by row)
+    "query_cache_rows": 100000, # prediction rows cached per attack, so repeated queries do not reach the model
+    "compiled_trees": True, # predict tree models with the flattened TreeEnsemble built when the model is loaded
+    "xgboost_inplace_predict": True, # predict XGBoost models with Booster.inplace_predict instead of a DMatrix per call
+    "xgboost_nthread": None, # XGBoost threads per predict, 1 if None and attacks or the matrix run in worker pools
+    "matrix_workers": None, # number of workers evaluating the defense x attack matrix, serial if None
+    "matrix_executor": "thread", # "thread" (shares the prediction cache) or "process"
+    "batch_workers": None, # number of worker processes evaluating the models of a batch manifest, serial if None
+    "search_mode": "bayesian", # attack/defense parameter search: "bayesian" or "halving" (successive halving on subsamples)
+    "halving_candidates": 27, # random candidates of the first successive halving round
+    "halving_min_samples": 100, # subsample size of the first successive halving round
+    "halving_eta": 3, # candidates kept (1/eta) and subsample growth (eta) per round
+    "trial_store": None, # e.g. "optimizer_trials.sqlite" to keep optimizer trials and warm-start later optimizations, off if None
+    "adversarial_store": None, # e.g. "adversarial_store" to keep generated adversarial examples for reuse across runs, off if None
+    "adversarial_store_bytes": 1024 * 1024 * 1024, # size bound of the adversarial store, least recently used entries are evicted
+    "checkpoint_dir": None, # e.g. "pipeline_runs" to checkpoint stage outputs so reruns only recompute what changed, off if None
+    "mmap_mode": None, # e.g. 'r' to memory-map the test data instead of reading it into memory
+    "stats_chunk_size": 65536, # rows per chunk when computing statistics over (memory-mapped) test data
+}
+
 supported_libraries = {
     "XGBoost": {
         "name": "XGBoost",
@@ -28,6 +56,9 @@ supported_attacks = {
         "abort_early": True,
         "use_resize": False,
         "variable_h":0.2,
+        "n_calls": 10, # optimization: number of evaluated configurations
+        "n_initial_points": 10, # optimization: random configurations before the GP is used
+        "n_parallel_calls": 1, # optimization: configurations evaluated concurrently
         "applicable_to": ["XGBoost", "scikit-learn"]
     },
     "HopSkipJump": {
@@ -40,6 +71,9 @@ supported_attacks = {
         "init_eval": 100,
         "init_size": 100,
         "norm":2,
+        "n_calls": 10,
+        "n_initial_points": 10,
+        "n_parallel_calls": 1,
         "applicable_to": ["XGBoost", "scikit-learn"]
     },
     "SignOPTAttack": { # self.clip_min not defined, bug in ART ? temporary fix by defining it manually in executor
@@ -54,6 +88,9 @@ supported_attacks = {
         "alpha": 0.2,
         "beta": 0.001,
         "batch_size": 1,
+        "n_calls": 10,
+        "n_initial_points": 10,
+        "n_parallel_calls": 1,
         "applicable_to": ["XGBoost", "scikit-learn"]
     },
     "BoundaryAttack": {
@@ -69,12 +106,18 @@ supported_attacks = {
         "sample_size": 20,
         "init_size": 100,
         "min_epsilon":0.0,
+        "n_calls": 10,
+        "n_initial_points": 10,
+        "n_parallel_calls": 1,
         "applicable_to": ["XGBoost", "scikit-learn"]
     },
     "Papernot_DT_Attack": {
         "name": "Papernot_DT_Attack",
         "type":"black-box",
         "offset": 0.001,
+        "n_calls": 10,
+        "n_initial_points": 10,
+        "n_parallel_calls": 1,
         "applicable_to": ["scikit-learn"]
     },
     "CubeAttack": {
@@ -84,6 +127,9 @@ supported_attacks = {
         "n_trials":100,
         "p":0.5,
         "independent_delta":False,
+        "n_calls": 10,
+        "n_initial_points": 10,
+        "n_parallel_calls": 1,
         "applicable_to": ["XGBoost"]
     },
     "SamplingAttack": {
@@ -91,6 +137,9 @@ supported_attacks = {
         "type":"black-box",
         "eps": 0.1,
         "n_trials":100,
+        "n_calls": 10,
+        "n_initial_points": 10,
+        "n_parallel_calls": 1,
         "applicable_to": ["XGBoost","scikit-learn"]
     },
 }
@@ -116,6 +165,10 @@ supported_defenses = {
         "defense_type" : "new_classifier",
         "prob_type": "depth",
         "n_simulations": 10,
+        "adaptive": False, # stop simulating a sample once its estimate converges, n_simulations is then the cap
+        "min_simulations": 2,
+        "confidence_interval": 0.05,
+        "random_state": None, # seed of the simulations, an int gives reproducible metrics
         "applicable_to": ["scikit-learn"]
     },
 }
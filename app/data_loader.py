@@ -1,19 +1,89 @@
 import xgboost as xgb
 import numpy as np
 import joblib
+import hashlib
+import zipfile
+from app.config import pipeline_settings
+from app.Core.tree_ensemble import TreeEnsemble
+
+# Keys under which the arrays are looked up in a .npz test file
+NPZ_KEYS = {
+    "x": ("x", "x_test"),
+    "y": ("y", "y_test"),
+    "y_test_proba": ("y_test_proba", "y_proba"),
+}
+
+def load_npz_member(path, name, mmap_mode=None):
+    """
+    Loads one array from a .npz file. Members stored uncompressed (np.savez) are memory-mapped in place
+    when mmap_mode is set; compressed members (np.savez_compressed) cannot be and are read into memory.
+
+    :param path: The path to the .npz file.
+    :param name: The name of the member, without the .npy extension.
+    :param mmap_mode: The np.memmap mode, or None to read the array into memory.
+    :return: The array.
+    """
+    with zipfile.ZipFile(path) as archive:
+        info = archive.getinfo(name + ".npy")
+        if mmap_mode is None or info.compress_type != zipfile.ZIP_STORED:
+            with archive.open(info) as member:
+                return np.lib.format.read_array(member)
+    with open(path, "rb") as f:
+        # The member data starts after the local file header, whose name and extra field lengths are at offset 26.
+        f.seek(info.header_offset + 26)
+        name_length, extra_length = np.frombuffer(f.read(4), dtype="<u2")
+        f.seek(info.header_offset + 30 + int(name_length) + int(extra_length))
+        version = np.lib.format.read_magic(f)
+        if version == (1, 0):
+            shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(f)
+        else:
+            shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(f)
+        offset = f.tell()
+    return np.memmap(path, dtype=dtype, mode=mmap_mode, shape=shape, order="F" if fortran_order else "C", offset=offset)
+
+def load_array(path, key=None, mmap_mode=None):
+    """
+    Loads an array from a .npy file, or the array stored under one of the NPZ_KEYS[key] names of a .npz file.
+
+    :param path: The path to the .npy or .npz file.
+    :param key: The kind of array to look up in a .npz file ('x', 'y' or 'y_test_proba').
+    :param mmap_mode: The np.memmap mode, or None to read the array into memory.
+    :return: The array, or None if a .npz file does not contain it.
+    """
+    if not str(path).endswith(".npz"):
+        return np.load(path, mmap_mode=mmap_mode)
+    with zipfile.ZipFile(path) as archive:
+        names = {name[:-len(".npy")] for name in archive.namelist()}
+    for name in NPZ_KEYS[key]:
+        if name in names:
+            return load_npz_member(path, name, mmap_mode)
+    return None
 
 class DataLoader:
     def __init__(self):
         self.__model = None
+        self.__model_digest = None
+        self.__tree_ensemble = None
         self.__x_test = None
         self.__y_test = None
         self.__y_test_proba = None
+        self.__statistics = None
 
     @property
     def model(self):
         return self.__model
     
     
+    @property
+    def model_digest(self):
+        """A hash of the loaded model file's bytes."""
+        return self.__model_digest
+
+    @property
+    def tree_ensemble(self):
+        """The loaded model flattened into a TreeEnsemble, None if the model is not supported."""
+        return self.__tree_ensemble
+
     @property
     def x(self):
         return self.__x_test
@@ -22,6 +92,10 @@ class DataLoader:
     def y(self):
         return self.__y_test
 
+    @property
+    def y_proba(self):
+        return self.__y_test_proba
+
     def load_model(self,library, path_to_model) -> bool:
         lib_name = library['name']
         try:
@@ -35,28 +109,118 @@ class DataLoader:
             else:
                 print(f"Unsupported library: {lib_name}")
                 return False
+            with open(path_to_model, "rb") as f:
+                self.__model_digest = hashlib.sha256(f.read()).hexdigest()
+            try:
+                self.__tree_ensemble = TreeEnsemble.from_model(self.__model)
+            except Exception as e:
+                # Flattening is only an optimization, any failure (e.g. an unexpected model dump layout) falls back
+                # to the model's own prediction
+                self.__tree_ensemble = None
+                print(f"The model cannot be flattened, it is evaluated natively: {type(e).__name__}: {str(e)}")
             return True
         except Exception as e:
             print(f"Failed to load model from {path_to_model}. Error: {str(e)}")
             return False
     
-    def load_test(self,x_test_path=None,y_test_path=None, y_test_proba_fpath=None):
-        # if .npy extension...
+    def load_test(self,x_test_path=None,y_test_path=None, y_test_proba_fpath=None, mmap_mode=None):
+        """
+        Loads the test data from .npy files, or from a single .npz file holding x, y and y_test_proba.
+        A .npz passed as x_test_path also provides y and y_test_proba when their paths are not given.
+
+        :param mmap_mode: The np.memmap mode (e.g. 'r'), so that only the rows in use are read from disk.
+                          Defaults to pipeline_settings['mmap_mode'].
+        """
+        if mmap_mode is None:
+            mmap_mode = pipeline_settings["mmap_mode"]
         try:
             if x_test_path is not None:
-                self.__x_test = np.load(x_test_path)
+                self.__x_test = load_array(x_test_path, "x", mmap_mode)
+                if str(x_test_path).endswith(".npz"):
+                    if y_test_path is None:
+                        y_test_path = x_test_path
+                    if y_test_proba_fpath is None:
+                        self.__y_test_proba = load_array(x_test_path, "y_test_proba", mmap_mode)
             if y_test_path is not None:
-                self.__y_test = np.load(y_test_path)
+                self.__y_test = load_array(y_test_path, "y", mmap_mode)
             if y_test_proba_fpath is not None:
-                self.__y_test_proba = np.load(y_test_proba_fpath)
+                self.__y_test_proba = load_array(y_test_proba_fpath, "y_test_proba", mmap_mode)
+            self.__statistics = self.compute_statistics()
             return True
         except:
             return False
 
+    def share_test(self, dataloader):
+        """
+        Uses the test data and statistics already loaded by another DataLoader instead of reading them again,
+        e.g. when several models are evaluated on the same test set.
+        """
+        self.__x_test = dataloader.x
+        self.__y_test = dataloader.y
+        self.__y_test_proba = dataloader.y_proba
+        self.__statistics = dataloader.statistics
+
+    def iter_chunks(self, array):
+        """
+        Yields consecutive row chunks of array, so that statistics over memory-mapped data are computed
+        without reading the whole array into memory at once.
+        """
+        chunk_size = pipeline_settings["stats_chunk_size"]
+        for start in range(0, len(array), chunk_size):
+            yield np.asarray(array[start:start + chunk_size])
+
+    def compute_statistics(self):
+        """
+        Computes the dataset statistics in a single chunked pass over x and y. They are cached until
+        load_test is called again.
+
+        :return: A dictionary with the per-feature min/max, the class histogram, the dtypes and a digest of x and y.
+        """
+        statistics = {"feature_min": None, "feature_max": None, "classes": None, "class_counts": None,
+                      "x_dtype": None, "y_dtype": None}
+        digest = hashlib.sha256()
+        for array in (self.__x_test, self.__y_test):
+            if array is not None:
+                digest.update(str((array.shape, array.dtype.str)).encode())
+        if self.__x_test is not None and len(self.__x_test) > 0:
+            feature_min, feature_max = None, None
+            for chunk in self.iter_chunks(self.__x_test):
+                digest.update(np.ascontiguousarray(chunk).data)
+                chunk_min, chunk_max = chunk.min(axis=0), chunk.max(axis=0)
+                feature_min = chunk_min if feature_min is None else np.minimum(feature_min, chunk_min)
+                feature_max = chunk_max if feature_max is None else np.maximum(feature_max, chunk_max)
+            statistics.update(feature_min=feature_min, feature_max=feature_max, x_dtype=self.__x_test.dtype)
+        if self.__y_test is not None:
+            histogram = {}
+            for chunk in self.iter_chunks(self.__y_test):
+                digest.update(np.ascontiguousarray(chunk).data)
+                for label, count in zip(*np.unique(chunk, return_counts=True)):
+                    histogram[label] = histogram.get(label, 0) + int(count)
+            classes = np.array(sorted(histogram))
+            class_counts = np.array([histogram[label] for label in classes], dtype=np.int64)
+            statistics.update(classes=classes, class_counts=class_counts, y_dtype=self.__y_test.dtype)
+        statistics["digest"] = digest.hexdigest()
+        return statistics
+
+    @property
+    def statistics(self):
+        if self.__statistics is None:
+            self.__statistics = self.compute_statistics()
+        return self.__statistics
+
+
+    @property
+    def data_digest(self):
+        """A hash of the content of x and y."""
+        return self.statistics["digest"]
 
     @property
     def nb_classes(self):
-        return len(np.unique(self.__y_test))
+        return len(self.statistics["classes"])
+
+    @property
+    def class_histogram(self):
+        return dict(zip(self.statistics["classes"], self.statistics["class_counts"]))
     
     @property
     def nb_features(self):
@@ -64,10 +228,14 @@ class DataLoader:
     
     @property
     def clip_values(self):
-        min_clip = self.__x_test.min(axis=0).min()  # Minimum values for each feature across all samples
-        max_clip = self.__x_test.max(axis=0).max()  # Maximum values for each feature across all samples
+        min_clip = self.statistics["feature_min"].min()  # Minimum value across all features and samples
+        max_clip = self.statistics["feature_max"].max()  # Maximum value across all features and samples
         clip_values = (min_clip, max_clip)
         return clip_values
 
+    @property
+    def feature_clip_values(self):
+        return self.statistics["feature_min"], self.statistics["feature_max"]
+
 
 
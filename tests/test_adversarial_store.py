@@ -0,0 +1,55 @@
+import unittest
+import os
+import tempfile
+import numpy as np
+from app.Core.adversarial_store import AdversarialStore
+
+class TestAdversarialStore(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.attack = {"name": "HopSkipJump", "max_iter": 100, "n_calls": 10, "applicable_to": ["XGBoost"]}
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    # TC_AdvStore_01
+    def test_key_ignores_optimization_parameters(self):
+        key = AdversarialStore.make_key("model", "x", self.attack, (0, None))
+        self.assertEqual(key, AdversarialStore.make_key("model", "x", dict(self.attack, n_calls=20, applicable_to=[]), (0, None)))
+        self.assertNotEqual(key, AdversarialStore.make_key("model", "x", dict(self.attack, max_iter=50), (0, None)))
+        self.assertNotEqual(key, AdversarialStore.make_key("model", "x", self.attack, (1, None)))
+        self.assertNotEqual(key, AdversarialStore.make_key("other model", "x", self.attack, (0, None)))
+
+    # TC_AdvStore_02
+    def test_least_recently_used_entries_evicted(self):
+        rng = np.random.default_rng(0)
+        arrays = [rng.random((200, 10)) for _ in range(3)]
+        store = AdversarialStore(self.tmp_dir.name)
+        store.put("a", x_adv=arrays[0], queries=np.int64(5))
+        entry = store.get("a")
+        np.testing.assert_array_equal(entry["x_adv"], arrays[0])
+        self.assertEqual(int(entry["queries"]), 5)
+        self.assertIsNone(store.get("b"))
+
+        # Room for two entries: "a" is used after "b" is stored, so "b" is the one evicted by "c"
+        store = AdversarialStore(self.tmp_dir.name, max_bytes=int(store.total_bytes * 2.5))
+        store.put("b", x_adv=arrays[1])
+        store.get("a")
+        store.put("c", x_adv=arrays[2])
+        self.assertEqual(len(store), 2)
+        self.assertIsNone(store.get("b"))
+        np.testing.assert_array_equal(store.get("a")["x_adv"], arrays[0])
+        np.testing.assert_array_equal(store.get("c")["x_adv"], arrays[2])
+        self.assertLessEqual(store.total_bytes, store.max_bytes)
+
+    # TC_AdvStore_03
+    def test_entry_removed_concurrently_is_a_miss(self):
+        store = AdversarialStore(self.tmp_dir.name)
+        store.put("a", x_adv=np.zeros((2, 3)))
+        # Another process sharing the store evicted the file after this one found it in the index
+        os.remove(store.get_path("a"))
+        self.assertIsNone(store.get("a"))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,38 @@
+import unittest
+import numpy as np
+from sklearn.datasets import load_iris
+from sklearn.tree import DecisionTreeClassifier
+from art.estimators.classification import SklearnClassifier
+from app.Core.attack_executor import AttackExecutor
+import app.config as config
+
+class TestAttackExecutor(unittest.TestCase):
+
+    def setUp(self):
+        x, y = load_iris(return_X_y=True)
+        x = x.astype(np.float32)
+        self.model = SklearnClassifier(DecisionTreeClassifier(max_depth=3, random_state=0).fit(x, y))
+        self.x = x[::15]
+        self.clip_values = (float(x.min()), float(x.max()))
+
+    def execute(self, attack_config, n_shards=None, random_state=None):
+        executor = AttackExecutor(attack_config, self.model, self.clip_values, n_shards=n_shards, random_state=random_state)
+        return executor.execute_attack(self.x)
+
+    # TC_Attack_01
+    def test_sharded_attack_reproducible(self):
+        # ZooAttack draws its coordinates from numpy's global generator, which run_shard seeds per (batch, shard)
+        zoo = dict(config.supported_attacks["ZooAttack"], max_iter=5, binary_search_steps=2)
+        first = self.execute(zoo, n_shards=2, random_state=0)
+        np.testing.assert_array_equal(self.execute(zoo, n_shards=2, random_state=0), first)
+        self.assertEqual(first.shape, self.x.shape)
+
+        # The decision tree attack is deterministic, so the stitched shards must equal the unsharded rows
+        papernot = config.supported_attacks["Papernot_DT_Attack"]
+        x_adv = self.execute(papernot)
+        self.assertFalse(np.array_equal(x_adv, self.x))
+        np.testing.assert_array_equal(self.execute(papernot, n_shards=2, random_state=0), x_adv)
+        np.testing.assert_array_equal(self.execute(papernot, n_shards=3, random_state=0), x_adv)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,59 @@
+import unittest
+import numpy as np
+from unittest.mock import MagicMock
+from sklearn.datasets import load_iris
+from sklearn.tree import DecisionTreeClassifier
+from app.Core.main_core import Main_Core
+from app.data_loader import DataLoader
+import app.config as config
+
+class TestAttackPool(unittest.TestCase):
+
+    def setUp(self):
+        x, y = load_iris(return_X_y=True)
+        x = x.astype(np.float32)
+        model = DecisionTreeClassifier(max_depth=3, random_state=0).fit(x, y)
+
+        self.mock_dataloader = MagicMock(spec=DataLoader)
+        self.mock_dataloader.model = model
+        self.mock_dataloader.nb_features = x.shape[1]
+        self.mock_dataloader.nb_classes = 3
+        self.mock_dataloader.x = x[::10]
+        self.mock_dataloader.y = y[::10]
+        self.mock_dataloader.clip_values = (float(x.min()), float(x.max()))
+        # evaluated natively and without checkpoints
+        self.mock_dataloader.tree_ensemble = None
+        self.mock_dataloader.model_digest = None
+
+        # Attacks whose adversarial examples do not depend on the random state of the process running them
+        self.attacks = [config.supported_attacks["Papernot_DT_Attack"],
+                        dict(config.supported_attacks["ZooAttack"], max_iter=5, binary_search_steps=2, nb_parallel=x.shape[1])]
+
+    def run_attacks(self, attack_workers, batch_size=None):
+        core = Main_Core()
+        core.attack_workers = attack_workers
+        core.batch_size = batch_size
+        core.dataloader = self.mock_dataloader
+        messages = []
+        try:
+            metrics, adv_examples = core.perform_attacks(self.attacks, progress_callback=messages.append)
+            adv_examples = {name: np.array(x_adv) for name, x_adv in adv_examples.items()}
+        finally:
+            core.cleanup_spill_dir()
+        return metrics, adv_examples, messages
+
+    # TC_Pool_01
+    def test_pool_matches_serial(self):
+        metrics, adv_examples, _ = self.run_attacks(attack_workers=None)
+        self.assertFalse(np.array_equal(adv_examples["Papernot_DT_Attack"], self.mock_dataloader.x))
+        for batch_size in [None, 4]:
+            pool_metrics, pool_adv_examples, messages = self.run_attacks(attack_workers=2, batch_size=batch_size)
+            self.assertEqual(pool_metrics, metrics)
+            self.assertEqual(set(pool_adv_examples), set(adv_examples))
+            for name, x_adv in adv_examples.items():
+                np.testing.assert_array_equal(pool_adv_examples[name], x_adv)
+            self.assertEqual(len(messages), len(self.attacks))
+            self.assertEqual(sorted(message.split()[0] for message in messages), sorted(att["name"] for att in self.attacks))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,55 @@
+import unittest
+import csv
+import json
+import os
+import tempfile
+from app.batch_runner import load_manifest, get_rows, write_table
+
+class TestBatchRunner(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def write_manifest(self, manifest):
+        path = os.path.join(self.tmp_dir.name, "batch.json")
+        with open(path, "w") as f:
+            json.dump(manifest, f)
+        return path
+
+    # TC_Batch_01
+    def test_load_manifest(self):
+        manifest = load_manifest(self.write_manifest({"entries": [
+            {"model": "iris_xgboost.model", "library": "XGBoost", "x": "x.npy", "y": "y.npy"},
+            {"name": "tree", "model": "tree.model", "library": "scikit-learn", "x": "x.npy"},
+        ], "workers": 2}))
+        self.assertEqual([entry["name"] for entry in manifest["entries"]], ["iris_xgboost", "tree"])
+        self.assertEqual(manifest["entries"][0]["x"], os.path.join(self.tmp_dir.name, "x.npy"))
+        for invalid in [{"entries": []}, {"entries": [{"model": "m", "library": "XGBoost"}]}, {"entries": [], "workers": 0}]:
+            with self.assertRaises(ValueError):
+                load_manifest(self.write_manifest(invalid))
+
+    # TC_Batch_02
+    def test_consolidated_table(self):
+        metrics = {"Clean": {"overall_accuracy": 1.0, "metrics_per_class": {"0": {"recall": 1.0}}},
+                   "HopSkipJump": {"overall_accuracy": 0.5, "queries": 30},
+                   "FeatureSqueezing": {"overall_accuracy": 0.9},
+                   ("FeatureSqueezing", "HopSkipJump"): {"overall_accuracy": 0.7}}
+        entry = {"name": "tree", "library": "scikit-learn", "x": "x.npy"}
+        rows = get_rows(entry, metrics) + get_rows(dict(entry, name="broken"), error="Failed to load the model")
+        self.assertEqual([(row.get("defense"), row.get("attack")) for row in rows],
+                         [(None, None), (None, "HopSkipJump"), ("FeatureSqueezing", None), ("FeatureSqueezing", "HopSkipJump"), (None, None)])
+        self.assertNotIn("metrics_per_class", rows[0])
+
+        path = os.path.join(self.tmp_dir.name, "table.csv")
+        write_table(rows, path)
+        with open(path) as f:
+            written = list(csv.DictReader(f))
+        self.assertEqual(len(written), 5)
+        self.assertEqual(written[1]["queries"], "30")
+        self.assertEqual(written[4]["error"], "Failed to load the model")
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,39 @@
+import unittest
+import tempfile
+import numpy as np
+from app.Core.checkpoint_store import CheckpointStore
+
+class TestCheckpointStore(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    # TC_Checkpoint_01
+    def test_outputs_restored_per_inputs(self):
+        store = CheckpointStore(self.tmp_dir.name, "model", "data")
+        parts = ("attack", {"name": "HopSkipJump", "max_iter": 100}, True)
+        metrics = {"overall_accuracy": 0.5, "metrics_per_class": {"0": {"recall": 1.0}}, "queries": np.int64(30)}
+        x_adv = np.arange(12.0).reshape(4, 3)
+        self.assertIsNone(store.load(parts))
+        store.save(parts, metrics, x_adv)
+
+        restored_metrics, restored_x_adv = CheckpointStore(self.tmp_dir.name, "model", "data").load(parts)
+        self.assertEqual(restored_metrics, metrics)
+        self.assertEqual(list(restored_metrics), list(metrics))
+        np.testing.assert_array_equal(restored_x_adv, x_adv)
+
+        self.assertIsNone(store.load(("attack", {"name": "HopSkipJump", "max_iter": 50}, True)))
+        self.assertIsNone(CheckpointStore(self.tmp_dir.name, "model", "other data").load(parts))
+
+    # TC_Checkpoint_02
+    def test_output_without_array(self):
+        store = CheckpointStore(self.tmp_dir.name, "model", "data")
+        store.save(("benign",), {"overall_accuracy": 1.0})
+        store.save(("benign",), {"overall_accuracy": 0.9})
+        self.assertEqual(store.load(("benign",)), ({"overall_accuracy": 0.9}, None))
+
+if __name__ == '__main__':
+    unittest.main()
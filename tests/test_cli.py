@@ -0,0 +1,50 @@
+import unittest
+import json
+import os
+import tempfile
+from app.config import supported_attacks, supported_defenses, pipeline_settings
+from app.cli import load_spec, resolve_configs, apply_pipeline_settings, main, EXIT_INVALID_SPEC
+
+class TestCli(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def write_spec(self, spec, name="run.json"):
+        path = os.path.join(self.tmp_dir.name, name)
+        with open(path, "w") as f:
+            json.dump(spec, f)
+        return path
+
+    # TC_Cli_01
+    def test_load_spec(self):
+        path = self.write_spec({"model": "model.json", "library": "XGBoost", "x": "x.npy", "attacks": ["HopSkipJump"]})
+        spec = load_spec(path)
+        self.assertEqual(spec["model"], os.path.join(self.tmp_dir.name, "model.json"))
+        self.assertEqual(spec["attacks"], ["HopSkipJump"])
+        for invalid in [{"library": "PyTorch"}, {"attacks": [{"max_iter": 5}]}, {"optimise": True}]:
+            with self.assertRaises(ValueError):
+                load_spec(self.write_spec(invalid))
+        self.assertEqual(main([self.write_spec({"library": "PyTorch"}), "--quiet"]), EXIT_INVALID_SPEC)
+
+    # TC_Cli_02
+    def test_resolve_configs(self):
+        attacks = resolve_configs(["HopSkipJump", {"name": "BoundaryAttack", "max_iter": 5}], supported_attacks, "XGBoost", "attack")
+        self.assertEqual(attacks[0], supported_attacks["HopSkipJump"])
+        self.assertEqual(attacks[1]["max_iter"], 5)
+        self.assertNotEqual(supported_attacks["BoundaryAttack"]["max_iter"], 5)
+        with self.assertRaises(ValueError):
+            resolve_configs(["NoSuchAttack"], supported_attacks, "XGBoost", "attack")
+        with self.assertRaises(ValueError):
+            resolve_configs([{"name": "FeatureSqueezing", "bit_depth": 4, "depth": 4}], supported_defenses, "XGBoost", "defense")
+        with self.assertRaises(ValueError):
+            resolve_configs(["TTTS"], supported_defenses, "XGBoost", "defense")
+        with self.assertRaises(ValueError):
+            apply_pipeline_settings({"attack_worker": 4})
+        self.assertNotIn("attack_worker", pipeline_settings)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,76 @@
+import unittest
+import os
+import tempfile
+import numpy as np
+import joblib
+from unittest.mock import patch
+from sklearn.tree import DecisionTreeClassifier
+from sklearn.datasets import load_iris
+from app.config import supported_libraries
+from app.data_loader import DataLoader
+
+class TestDataLoader(unittest.TestCase):
+
+    def setUp(self):
+        self.x, self.y = load_iris(return_X_y=True)
+        self.y_proba = np.eye(3)[self.y]
+        self.tmp_dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def path(self, name):
+        return os.path.join(self.tmp_dir.name, name)
+
+    # TC_Data_01
+    def test_load_npy_memory_mapped(self):
+        np.save(self.path("x.npy"), self.x)
+        np.save(self.path("y.npy"), self.y)
+        dataloader = DataLoader()
+        self.assertTrue(dataloader.load_test(self.path("x.npy"), self.path("y.npy"), mmap_mode='r'))
+        self.assertIsInstance(dataloader.x, np.memmap)
+        np.testing.assert_array_equal(dataloader.x, self.x)
+        self.assertEqual(dataloader.nb_classes, 3)
+        self.assertEqual(dataloader.nb_features, 4)
+        self.assertEqual(dataloader.clip_values, (self.x.min(), self.x.max()))
+
+    # TC_Data_02
+    def test_load_npz(self):
+        for save in [np.savez, np.savez_compressed]:
+            save(self.path("test.npz"), x=self.x, y=self.y, y_test_proba=self.y_proba)
+            for mmap_mode in [None, 'r']:
+                dataloader = DataLoader()
+                self.assertTrue(dataloader.load_test(self.path("test.npz"), mmap_mode=mmap_mode))
+                np.testing.assert_array_equal(dataloader.x, self.x)
+                np.testing.assert_array_equal(dataloader.y, self.y)
+                np.testing.assert_array_equal(dataloader.y_proba, self.y_proba)
+                self.assertEqual(isinstance(dataloader.x, np.memmap), save is np.savez and mmap_mode == 'r')
+    # TC_Data_03
+    def test_statistics_cached_until_reload(self):
+        np.save(self.path("x.npy"), self.x)
+        np.save(self.path("y.npy"), self.y)
+        dataloader = DataLoader()
+        dataloader.load_test(self.path("x.npy"), self.path("y.npy"))
+        statistics = dataloader.statistics
+        self.assertIs(dataloader.statistics, statistics)
+        np.testing.assert_array_equal(dataloader.feature_clip_values[0], self.x.min(axis=0))
+        np.testing.assert_array_equal(dataloader.feature_clip_values[1], self.x.max(axis=0))
+        self.assertEqual(dataloader.class_histogram, {0: 50, 1: 50, 2: 50})
+
+        np.save(self.path("x.npy"), self.x * 2)
+        np.save(self.path("y.npy"), self.y[:100])
+        dataloader.load_test(self.path("x.npy"), self.path("y.npy"))
+        self.assertEqual(dataloader.clip_values, (self.x.min() * 2, self.x.max() * 2))
+        self.assertEqual(dataloader.nb_classes, 2)
+
+    # TC_Data_04
+    def test_model_loaded_when_flattening_fails(self):
+        joblib.dump(DecisionTreeClassifier(random_state=0).fit(self.x, self.y), self.path("tree.model"))
+        dataloader = DataLoader()
+        with patch("app.data_loader.TreeEnsemble.from_model", side_effect=KeyError("split_indices")):
+            self.assertTrue(dataloader.load_model(supported_libraries["scikit-learn"], self.path("tree.model")))
+        self.assertIsNone(dataloader.tree_ensemble)
+        self.assertIsNotNone(dataloader.model)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,66 @@
+import unittest
+import logging
+import os
+import tempfile
+import numpy as np
+from unittest.mock import MagicMock, patch
+from sklearn.datasets import load_iris
+from sklearn.tree import DecisionTreeClassifier
+from art.defences.preprocessor import FeatureSqueezing
+from app.Core.defense_optimizier import DefensekOptimizier, squeeze_features
+from app.Core.trial_store import TrialStore
+from app.config import supported_defenses
+
+class TestDefenseOptimizier(unittest.TestCase):
+
+    def setUp(self):
+        self.x, self.y = load_iris(return_X_y=True)
+        self.x = self.x / 8
+        self.model = DecisionTreeClassifier(random_state=0).fit(self.x, self.y)
+
+    # TC_DefOpt_01
+    def test_squeeze_features_matches_art(self):
+        squeezed = squeeze_features(self.x, list(range(3, 10)), (0.0, 1.0))
+        for i, bit_depth in enumerate(range(3, 10)):
+            expected, _ = FeatureSqueezing(clip_values=(0.0, 1.0), bit_depth=bit_depth)(self.x)
+            np.testing.assert_array_equal(squeezed[i], expected)
+
+    # TC_DefOpt_02
+    @patch.dict('app.Core.defense_optimizier.pipeline_settings', {"trial_store": None})
+    def test_discrete_space_scored_with_one_model_call(self):
+        classifier = MagicMock()
+        classifier.predict.side_effect = lambda x: np.eye(3)[self.model.predict(x)]
+        dataloader = MagicMock(x=self.x, y=self.y, clip_values=(0.0, 1.0))
+        optimizer = DefensekOptimizier(dict(supported_defenses["FeatureSqueezing"]), dataloader, classifier, logger=logging.getLogger("test"))
+        self.assertEqual(len(optimizer.get_grid(10)), 7)
+        self.assertIsNone(optimizer.get_grid(5))
+        optimized = optimizer.optimize()
+        self.assertEqual(classifier.predict.call_count, 1)
+        accuracies = [np.mean(self.model.predict(squeeze_features(self.x, [b], (0.0, 1.0))[0]) == self.y) for b in range(3, 10)]
+        self.assertEqual(optimized['bit_depth'], 3 + int(np.argmax(accuracies)))
+
+    # TC_DefOpt_03
+    def test_grid_skips_stored_points_and_survives_failures(self):
+        dataloader = MagicMock(x=self.x, y=self.y, clip_values=(0.0, 1.0), model_digest="model", data_digest="data")
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, "trials.sqlite")
+            with patch.dict('app.Core.defense_optimizier.pipeline_settings', {"trial_store": path}):
+                classifier = MagicMock()
+                classifier.predict.side_effect = lambda x: np.eye(3)[self.model.predict(x)]
+                optimizer = DefensekOptimizier(dict(supported_defenses["FeatureSqueezing"]), dataloader, classifier, logger=logging.getLogger("test"))
+                store = TrialStore(path)
+                for bit_depth in [3, 4, 5]:
+                    store.add_trial(optimizer.get_study_key(), [bit_depth], 0.5)
+                optimizer.optimize()
+                x0, y0 = store.get_trials(optimizer.get_study_key())
+                self.assertEqual(sorted(x0), [[b] for b in range(3, 10)])
+                self.assertEqual(classifier.predict.call_args[0][0].shape[0], 4 * len(self.x))
+
+                # A failing model call scores the points as inf instead of aborting the optimization
+                classifier.predict.side_effect = RuntimeError("model unavailable")
+                failing = DefensekOptimizier(dict(supported_defenses["FeatureSqueezing"], apply_fit=True), dataloader, classifier, logger=logging.getLogger("test"))
+                self.assertEqual(failing.optimize()['bit_depth'], 3)
+                self.assertEqual(store.get_trials(failing.get_study_key()), ([], []))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,7 +1,8 @@
 import unittest
 import numpy as np
-from unittest.mock import MagicMock
+from unittest.mock import MagicMock, patch
 from app.Core.main_core import Main_Core
+from app.Core.defense_applier import DefenseApplier
 from app.data_loader import DataLoader
 import app.config as config
 import os
@@ -32,6 +33,9 @@ class TestMainCore(unittest.TestCase):
         self.mock_dataloader.x = x_test
         self.mock_dataloader.y = y_test
         self.mock_dataloader.clip_values = (0.0, 1.0)
+        # evaluated natively and without checkpoints
+        self.mock_dataloader.tree_ensemble = None
+        self.mock_dataloader.model_digest = None
 
         self.main_core.dataloader = self.mock_dataloader
 
@@ -120,5 +124,36 @@ class TestMainCore(unittest.TestCase):
         with self.assertRaises(ValueError):
             metrics = self.main_core.perform_benign_evaluation()
 
+    # TC_Core_13
+    def test_spill_dir_per_run(self):
+        other_core = Main_Core()
+        spill_dir = self.main_core.get_spill_dir()
+        self.assertTrue(os.path.isdir(spill_dir))
+        self.assertNotEqual(spill_dir, other_core.get_spill_dir())
+        self.main_core.cleanup_spill_dir()
+        self.assertFalse(os.path.exists(spill_dir))
+        other_core.cleanup_spill_dir()
+
+    # TC_Core_14
+    def test_perform_defenses_on_attacks_parallel(self):
+        defenses = [config.supported_defenses["FeatureSqueezing"], config.supported_defenses["ClassLabels"]]
+        rng = np.random.default_rng(0)
+        x_adv = rng.random(self.mock_dataloader.x.shape)
+        # ZooAttack and HopSkipJump share their input, so FeatureSqueezing is applied to it once
+        adv_examples = {'ZooAttack': x_adv, 'HopSkipJump': x_adv.copy(), 'BoundaryAttack': rng.random(x_adv.shape)}
+        serial_metrics, _ = self.main_core.perform_defenses_on_attacks(defenses, adv_examples)
+        self.main_core.matrix_workers = 4
+        for executor in ["thread", "process"]:
+            self.main_core.matrix_executor = executor
+            self.main_core.prediction_cache.clear()
+            with patch.object(DefenseApplier, "apply_defense", autospec=True, side_effect=DefenseApplier.apply_defense) as apply_defense:
+                metrics, adv_defended_examples = self.main_core.perform_defenses_on_attacks(defenses, adv_examples)
+            self.assertEqual(metrics, serial_metrics)
+            np.testing.assert_array_equal(adv_defended_examples[('FeatureSqueezing', 'ZooAttack')],
+                                          adv_defended_examples[('FeatureSqueezing', 'HopSkipJump')])
+            if executor == "thread":
+                # the process workers count their calls in their own copy of the mock
+                self.assertEqual(apply_defense.call_count, 2)
+
 if __name__ == '__main__':
     unittest.main()
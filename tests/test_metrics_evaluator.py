@@ -0,0 +1,72 @@
+import unittest
+import numpy as np
+from unittest.mock import MagicMock
+from sklearn.datasets import load_iris
+from sklearn.tree import DecisionTreeClassifier
+from sklearn.metrics import accuracy_score, recall_score, precision_score, classification_report
+from art.defences.postprocessor.class_labels import ClassLabels
+from app.Core.metrics_evaluator import MetricsEvaluator
+from app.Core.prediction_cache import PredictionCache
+
+class TestMetricsEvaluator(unittest.TestCase):
+
+    def setUp(self):
+        self.x, self.y = load_iris(return_X_y=True)
+        self.model = DecisionTreeClassifier(max_depth=2, random_state=0).fit(self.x, self.y)
+
+    # TC_Metrics_01
+    def test_prediction_cache_shared_between_evaluators(self):
+        cache = PredictionCache()
+        model = MagicMock()
+        model.predict.side_effect = lambda x: np.eye(3)[self.model.predict(x)]
+        first = MetricsEvaluator(model, self.x, self.y, prediction_cache=cache).get_metrics()
+        second = MetricsEvaluator(model, self.x.copy(), self.y, prediction_cache=cache).get_metrics()
+        self.assertEqual(model.predict.call_count, 1)
+        self.assertEqual(first, second)
+
+        MetricsEvaluator(model, self.x + 1, self.y, prediction_cache=cache)
+        self.assertEqual(model.predict.call_count, 2)
+        self.assertEqual((cache.hits, cache.misses), (1, 2))
+
+    # TC_Metrics_02
+    def test_prediction_cache_eviction(self):
+        cache = PredictionCache(max_bytes=2 * len(self.x) * 3 * 8)
+        model = MagicMock()
+        model.predict.side_effect = lambda x: np.eye(3)[self.model.predict(x)]
+        for shift in range(3):
+            MetricsEvaluator(model, self.x + shift, self.y, prediction_cache=cache)
+        self.assertEqual(len(cache), 2)
+        self.assertLessEqual(cache.current_bytes, cache.max_bytes)
+
+    # TC_Metrics_03
+    def test_metrics_match_sklearn(self):
+        rng = np.random.default_rng(0)
+        for n_classes in [2, 3, 7]:
+            y_true = rng.integers(0, n_classes, size=500)
+            # leave one class out of the predictions to exercise zero_division
+            y_pred = np.where(rng.random(500) < 0.6, y_true, rng.integers(0, n_classes - 1, size=500))
+            model = MagicMock()
+            model.predict.return_value = np.eye(n_classes)[y_pred]
+            metrics = MetricsEvaluator(model, np.zeros((500, 1)), y_true).get_metrics()
+            self.assertEqual(metrics, {
+                "overall_accuracy": accuracy_score(y_true, y_pred),
+                "overall_precision": precision_score(y_true, y_pred, average='weighted', zero_division=0),
+                "overall_recall": recall_score(y_true, y_pred, average='weighted', zero_division=0),
+                "metrics_per_class": classification_report(y_true, y_pred, output_dict=True, zero_division=0),
+            })
+    # TC_Metrics_04
+    def test_batched_metrics_match_full(self):
+        model = MagicMock()
+        model.predict.side_effect = lambda x: np.eye(3)[self.model.predict(x)]
+        full = MetricsEvaluator(model, self.x, self.y).get_metrics()
+        for batch_size in [1, 7, 1000]:
+            self.assertEqual(MetricsEvaluator(model, self.x, self.y, batch_size=batch_size).get_metrics(), full)
+
+        # ClassLabels is not row-wise, it sets the labels seen anywhere in its input
+        postprocessor = ClassLabels()
+        full = MetricsEvaluator(model, self.x, self.y, postprocessor=postprocessor).get_metrics()
+        for batch_size in [1, 7, 1000]:
+            self.assertEqual(MetricsEvaluator(model, self.x, self.y, postprocessor=postprocessor, batch_size=batch_size).get_metrics(), full)
+
+if __name__ == '__main__':
+    unittest.main()
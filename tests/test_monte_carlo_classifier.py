@@ -0,0 +1,167 @@
+import unittest
+import numpy as np
+from sklearn.datasets import load_iris
+from sklearn.tree import DecisionTreeClassifier
+from sklearn.ensemble import RandomForestClassifier
+from app.Core.attacks.MonteCarloClassifier import MonteCarloDecisionTreeClassifier, MonteCarloRandomForestClassifier
+from app.Core.attacks import MonteCarloClassifier
+
+class TestMonteCarloDecisionTree(unittest.TestCase):
+
+    def setUp(self):
+        self.x, self.y = load_iris(return_X_y=True)
+        self.model = DecisionTreeClassifier(random_state=0).fit(self.x, self.y)
+
+    def make_classifier(self, prob_type, n_simulations=10):
+        classifier = MonteCarloDecisionTreeClassifier(prob_type=prob_type, n_simulations=n_simulations)
+        classifier.__dict__.update(self.model.__dict__)
+        classifier.prob_type = prob_type
+        classifier.n_simulations = n_simulations
+        return classifier
+
+    # TC_MC_01
+    def test_predict_proba_shape(self):
+        for prob_type in ['fixed', 'depth', 'certainty', 'agreement', 'distance', 'confidence']:
+            proba = self.make_classifier(prob_type).predict_proba(self.x)
+            self.assertEqual(proba.shape, (len(self.x), len(np.unique(self.y))))
+            np.testing.assert_allclose(proba.sum(axis=1), 1.0)
+
+    # TC_MC_02
+    def test_predict_proba_matches_recursive_traversal(self):
+        classifier = self.make_classifier('fixed')
+        x = classifier._validate_X_predict(self.x[::10], check_input=True)
+        np.random.seed(0)
+        proba = classifier.predict_proba(x, n_simulations=2000)
+        expected = []
+        for sample in x:
+            results = [classifier.traverse_tree(0, sample, x).ravel() for _ in range(2000)]
+            expected.append(np.mean([arr / arr.sum() for arr in results], axis=0))
+        np.testing.assert_allclose(proba, np.array(expected), atol=0.05)
+
+    # TC_MC_09
+    def test_seeded_predictions_are_reproducible(self):
+        classifier = self.make_classifier('depth')
+        classifier.simulation_random_state = 42
+        np.testing.assert_array_equal(classifier.predict_proba(self.x), classifier.predict_proba(self.x))
+        proba = classifier.predict_proba(self.x)
+        classifier.simulation_random_state = 43
+        self.assertFalse(np.array_equal(classifier.predict_proba(self.x), proba))
+
+    # TC_MC_05
+    def test_probability_tables(self):
+        classifier = self.make_classifier('certainty')
+        node_values = classifier.tree_.value.reshape(classifier.tree_.node_count, -1)
+        expected = np.minimum(1 - node_values.max(axis=1) / node_values.sum(axis=1), 0.5)
+        for node_id in range(classifier.tree_.node_count):
+            self.assertAlmostEqual(classifier.get_certainty_based_probability(node_id), expected[node_id])
+
+        # Refitting replaces tree_, which must invalidate the cached node tables.
+        classifier.fit(self.x[:100], self.y[:100])
+        node_values = classifier.tree_.value.reshape(classifier.tree_.node_count, -1)
+        self.assertAlmostEqual(classifier.get_certainty_based_probability(0), min(1 - node_values[0].max() / node_values[0].sum(), 0.5))
+
+        # A different reference X must invalidate the cached feature statistics.
+        cache = classifier.get_probability_cache()
+        mean, _ = cache.feature_statistics(self.x)
+        np.testing.assert_allclose(mean, self.x.mean(axis=0))
+        mean, _ = cache.feature_statistics(self.x * 2)
+        np.testing.assert_allclose(mean, self.x.mean(axis=0) * 2)
+
+    # TC_MC_06
+    @unittest.skipIf(MonteCarloClassifier.traverse_chunk_numba is None, "numba is not installed")
+    def test_numba_kernel_matches_numpy_kernel(self):
+        for prob_type in ['fixed', 'depth', 'certainty', 'distance', 'confidence']:
+            classifier = self.make_classifier(prob_type)
+            x = classifier._validate_X_predict(self.x, check_input=True)
+            tables = classifier.get_node_probability_tables(x)
+            leaves_numpy = MonteCarloClassifier.batch_traverse_tree(classifier.tree_, x, 10, tables, np.random.default_rng(0), use_numba=False)
+            leaves_numba = MonteCarloClassifier.batch_traverse_tree(classifier.tree_, x, 10, tables, np.random.default_rng(0), use_numba=True)
+            np.testing.assert_array_equal(leaves_numpy, leaves_numba)
+
+    # TC_MC_07
+    def test_adaptive_predict_proba(self):
+        classifier = self.make_classifier('depth', n_simulations=200)
+        classifier.simulation_random_state = 0
+        expected = classifier.predict_proba(self.x)
+        classifier.adaptive = True
+        proba = classifier.predict_proba(self.x)
+        counts = classifier.simulation_counts_
+        self.assertEqual(counts.shape, (len(self.x),))
+        self.assertTrue(np.all((counts >= classifier.min_simulations) & (counts <= 200)))
+        self.assertLess(counts.sum(), 200 * len(self.x))
+        np.testing.assert_allclose(proba.sum(axis=1), 1.0)
+        self.assertGreater(np.mean(proba.argmax(axis=1) == expected.argmax(axis=1)), 0.9)
+
+class TestMonteCarloRandomForest(unittest.TestCase):
+
+    def setUp(self):
+        self.x, self.y = load_iris(return_X_y=True)
+        self.model = RandomForestClassifier(n_estimators=5, random_state=0, n_jobs=2).fit(self.x, self.y)
+
+    def make_classifier(self, prob_type):
+        classifier = MonteCarloRandomForestClassifier(prob_type=prob_type)
+        classifier.__dict__.update(self.model.__dict__)
+        classifier.prob_type = prob_type
+        return classifier
+
+    # TC_MC_03
+    def test_predict_proba_shape(self):
+        for prob_type in ['fixed', 'depth', 'certainty', 'agreement', 'bayes', 'confidence', 'distance']:
+            proba = self.make_classifier(prob_type).predict_proba(self.x)
+            self.assertEqual(proba.shape, (len(self.x), len(np.unique(self.y))))
+
+    # TC_MC_04
+    def test_predict_proba_matches_recursive_traversal(self):
+        classifier = self.make_classifier('fixed')
+        x = classifier._validate_X_predict(self.x[::10])
+        np.random.seed(0)
+        proba = classifier.predict_proba(x, n_simulations=1000)
+        expected = []
+        for sample in x:
+            results = []
+            for tree in classifier.estimators_:
+                results.extend(classifier.traverse_tree(tree.tree_, 0, sample, x).ravel() for _ in range(400))
+            expected.append(np.mean(results, axis=0))
+        np.testing.assert_allclose(proba, np.array(expected), atol=0.05)
+
+    # TC_MC_08
+    def test_adaptive_predict_proba(self):
+        classifier = self.make_classifier('certainty')
+        classifier.adaptive = True
+        proba = classifier.predict_proba(self.x, n_simulations=50)
+        self.assertEqual(proba.shape, (len(self.x), len(np.unique(self.y))))
+        self.assertTrue(np.all(classifier.simulation_counts_ <= 50))
+        self.assertLess(classifier.simulation_counts_.sum(), 50 * len(self.x))
+
+    # TC_MC_10
+    def test_seeded_predictions_do_not_depend_on_n_jobs(self):
+        classifier = self.make_classifier('depth')
+        classifier.simulation_random_state = 42
+        classifier.n_jobs = 1
+        proba = classifier.predict_proba(self.x)
+        classifier.n_jobs = 3
+        np.testing.assert_array_equal(classifier.predict_proba(self.x), proba)
+        self.assertEqual(MonteCarloRandomForestClassifier(n_jobs=3).n_jobs, 3)
+
+    # TC_MC_11
+    def test_single_feature_data(self):
+        # Leaves split on no feature (tree.feature is -2), so they must not index the per-feature statistics.
+        x = self.x[:, :1]
+        for model, classifier_class in [(DecisionTreeClassifier(random_state=0), MonteCarloDecisionTreeClassifier),
+                                        (RandomForestClassifier(n_estimators=5, random_state=0), MonteCarloRandomForestClassifier)]:
+            model.fit(x, self.y)
+            for prob_type in ['confidence', 'distance']:
+                classifier = classifier_class(prob_type=prob_type)
+                classifier.__dict__.update(model.__dict__)
+                classifier.prob_type = prob_type
+                proba = classifier.predict_proba(x)
+                self.assertEqual(proba.shape, (len(x), len(np.unique(self.y))))
+                np.testing.assert_allclose(proba.sum(axis=1), 1.0)
+        tree = classifier.estimators_[0].tree_
+        base, center, scale = classifier.get_node_probability_tables(tree, x)[:3]
+        leaves = tree.feature < 0
+        self.assertTrue(np.all(base[leaves] == 0))
+        self.assertTrue(np.all(np.isinf(scale[leaves])))
+
+if __name__ == '__main__':
+    unittest.main()
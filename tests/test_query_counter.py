@@ -0,0 +1,34 @@
+import unittest
+import numpy as np
+from sklearn.datasets import load_iris
+from sklearn.tree import DecisionTreeClassifier
+from art.estimators.classification import SklearnClassifier
+from app.Core.query_counter import QueryCounter
+
+class TestQueryCounter(unittest.TestCase):
+
+    def setUp(self):
+        self.x, self.y = load_iris(return_X_y=True)
+        self.classifier = SklearnClassifier(model=DecisionTreeClassifier(random_state=0).fit(self.x, self.y))
+
+    # TC_Query_01
+    def test_counts_and_deduplicates_queries(self):
+        counter = QueryCounter(self.classifier)
+        x = np.concatenate([self.x[:10], self.x[:10]])
+        np.testing.assert_array_equal(counter.estimator.predict(x), self.classifier.predict(x))
+        self.assertEqual((counter.queries, counter.model_queries), (20, 10))
+        np.testing.assert_array_equal(counter.estimator.predict(self.x[5:15]), self.classifier.predict(self.x[5:15]))
+        self.assertEqual((counter.queries, counter.model_queries), (30, 15))
+        self.assertEqual((counter.calls, counter.model_calls), (2, 2))
+
+    # TC_Query_02
+    def test_cache_is_bounded(self):
+        counter = QueryCounter(self.classifier, max_rows=20)
+        counter.estimator.predict(self.x[:30])
+        counter.estimator.predict(self.x[:10])
+        # the first 10 rows were evicted by the last 20
+        self.assertEqual(counter.model_queries, 40)
+        self.assertIs(counter.estimator.model, self.classifier.model)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,41 @@
+import unittest
+import numpy as np
+from skopt.space import Real, Integer, Space
+from app.Core.successive_halving import SuccessiveHalving, stratified_order
+
+class TestSuccessiveHalving(unittest.TestCase):
+
+    # TC_Halving_01
+    def test_stratified_order_prefixes_keep_class_proportions(self):
+        y = np.repeat([0, 1, 2], [500, 300, 200])
+        order = stratified_order(y, random_state=0)
+        np.testing.assert_array_equal(np.sort(order), np.arange(len(y)))
+        for size in [10, 100, 333]:
+            counts = np.bincount(y[order[:size]], minlength=3)
+            np.testing.assert_allclose(counts / size, [0.5, 0.3, 0.2], atol=2 / size + 0.01)
+        # one-hot labels are stratified by class as well
+        np.testing.assert_array_equal(stratified_order(np.eye(3)[y], random_state=0), order)
+
+    # TC_Halving_02
+    def test_search_promotes_best_candidates(self):
+        y = np.repeat([0, 1], 500)
+        budgets = []
+        def evaluate(params, indices):
+            budgets.append(len(indices))
+            return (params[0] - 0.3) ** 2 + params[1] * 1e-3
+        search = SuccessiveHalving([Real(0, 1), Integer(1, 5)], n_candidates=27, min_samples=50, eta=3, random_state=0)
+        result = search.run(evaluate, y)
+        self.assertEqual(budgets.count(50), 27)
+        self.assertEqual(budgets.count(150), 9)
+        self.assertEqual(budgets.count(450), 3)
+        self.assertEqual(budgets.count(1000), 1)
+        self.assertEqual(search.samples_spent, sum(budgets))
+        self.assertEqual(search.exhaustive_samples, 27 * 1000)
+        # the savings are reported against n_calls Bayesian optimization evaluations on the whole test set
+        self.assertIn(f"bayesian=10000 (n_calls=10), spent={sum(budgets) / 10000:.1%} of bayesian", search.describe_budget(10))
+        # the objective does not depend on the subsample, so the best first round candidate must win
+        candidates = Space([Real(0, 1), Integer(1, 5)]).rvs(n_samples=27, random_state=0)
+        self.assertEqual(result.fun, min(evaluate(params, []) for params in candidates))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,78 @@
+import unittest
+import os
+import tempfile
+import numpy as np
+import xgboost as xgb
+from sklearn.datasets import load_iris, load_breast_cancer
+from sklearn.tree import DecisionTreeClassifier
+from sklearn.ensemble import RandomForestClassifier
+from art.estimators.classification import SklearnClassifier, XGBoostClassifier
+from art.defences.preprocessor import FeatureSqueezing
+from app.config import supported_libraries
+from app.data_loader import DataLoader
+from app.Core.tree_ensemble import TreeEnsemble
+from app.Core.compiled_classifier import get_compiled_classifier
+
+MODELS_DIR = os.path.join(os.path.dirname(__file__), "..", "models")
+
+class TestTreeEnsemble(unittest.TestCase):
+
+    def models(self, x, y):
+        return [DecisionTreeClassifier(random_state=0).fit(x, y),
+                RandomForestClassifier(n_estimators=20, random_state=0).fit(x, y),
+                xgb.XGBClassifier(n_estimators=30, max_depth=4).fit(x, y)]
+
+    def assert_same_predictions(self, model, actual, expected):
+        if isinstance(model, xgb.XGBClassifier):
+            # The margins are identical, the probabilities may differ by an ulp of the platform's C expf
+            np.testing.assert_array_equal(actual.argmax(axis=1), expected.argmax(axis=1))
+            np.testing.assert_allclose(actual, expected, rtol=1e-6, atol=1e-9)
+        else:
+            np.testing.assert_array_equal(actual, expected)
+
+    # TC_Tree_01
+    def test_predictions_identical_to_native(self):
+        for load in [load_iris, load_breast_cancer]:
+            x, y = load(return_X_y=True)
+            x_missing = x.copy()
+            x_missing[::5, 0] = np.nan
+            x_noisy = x + np.random.default_rng(0).normal(0, 0.5, x.shape)
+            with tempfile.TemporaryDirectory() as tmp_dir:
+                for model in self.models(x, y):
+                    if isinstance(model, xgb.XGBClassifier):
+                        # A saved model, as loaded by the DataLoader
+                        model.save_model(os.path.join(tmp_dir, "model.json"))
+                        model = xgb.XGBClassifier()
+                        model.load_model(os.path.join(tmp_dir, "model.json"))
+                    ensemble = TreeEnsemble.from_model(model)
+                    for x_test in [x, x_missing, x_noisy, x[:1]]:
+                        self.assert_same_predictions(model, ensemble.predict_proba(x_test), model.predict_proba(x_test))
+
+    # TC_Tree_02
+    def test_bundled_models(self):
+        for name, library in [("iris_decision_tree", "scikit-learn"), ("iris_xgboost", "XGBoost"), ("wine_xgboost", "XGBoost")]:
+            with self.subTest(model=name):
+                dataloader = DataLoader()
+                if not dataloader.load_model(supported_libraries[library], os.path.join(MODELS_DIR, f"{name}.model")):
+                    self.skipTest(f"{name}.model cannot be read by the installed {library} version")
+                dataloader.load_test(os.path.join(MODELS_DIR, f"{name}_x_test.npy"), os.path.join(MODELS_DIR, f"{name}_y_test.npy"))
+                self.assert_same_predictions(dataloader.model, dataloader.tree_ensemble.predict_proba(dataloader.x),
+                                             dataloader.model.predict_proba(dataloader.x))
+
+    # TC_Tree_03
+    def test_compiled_classifier_matches_art(self):
+        x, y = load_iris(return_X_y=True)
+        clip_values = (x.min(), x.max())
+        for model in self.models(x, y):
+            defence = FeatureSqueezing(clip_values=clip_values, bit_depth=3)
+            if isinstance(model, xgb.XGBClassifier):
+                kwargs = dict(nb_features=4, nb_classes=3)
+                expected = XGBoostClassifier(model=model, preprocessing_defences=[defence], **kwargs).predict(x)
+            else:
+                kwargs = {}
+                expected = SklearnClassifier(model=model, preprocessing_defences=[defence]).predict(x)
+            classifier = get_compiled_classifier(model, TreeEnsemble.from_model(model), preprocessing_defences=[defence], **kwargs)
+            self.assert_same_predictions(model, classifier.predict(x), expected)
+
+if __name__ == '__main__':
+    unittest.main()
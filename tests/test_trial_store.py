@@ -0,0 +1,34 @@
+import unittest
+import os
+import tempfile
+import numpy as np
+from app.Core.trial_store import TrialStore
+
+class TestTrialStore(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp_dir.name, "trials.sqlite")
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    # TC_Trials_01
+    def test_trials_persist_per_study(self):
+        study = TrialStore.make_key("attack", "model", "data", {"name": "HopSkipJump", "norm": 2})
+        store = TrialStore(self.path)
+        store.add_trial(study, [np.float64(0.5), np.int64(60)], 0.25)
+        store.add_trial(study, [0.1, 70], float('inf'))
+        store.add_trial(TrialStore.make_key("attack", "model", "other data", {"name": "HopSkipJump", "norm": 2}), [0.2, 80], 0.5)
+
+        x0, y0 = TrialStore(self.path).get_trials(study)
+        self.assertEqual((x0, y0), ([[0.5, 60]], [0.25]))
+        self.assertIsInstance(x0[0][1], int)
+
+    # TC_Trials_02
+    def test_study_key_ignores_dict_order(self):
+        self.assertEqual(TrialStore.make_key({"a": 1, "b": 2}), TrialStore.make_key({"b": 2, "a": 1}))
+        self.assertNotEqual(TrialStore.make_key({"a": 1}), TrialStore.make_key({"a": 2}))
+
+if __name__ == '__main__':
+    unittest.main()
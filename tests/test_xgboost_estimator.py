@@ -0,0 +1,47 @@
+import unittest
+import json
+import numpy as np
+import xgboost as xgb
+from sklearn.datasets import load_iris, load_breast_cancer
+from art.estimators.classification import XGBoostClassifier
+from art.defences.preprocessor import FeatureSqueezing
+from app.Core.xgboost_estimator import InplaceXGBoostClassifier
+
+class TestInplaceXGBoostClassifier(unittest.TestCase):
+
+    # TC_XGB_01
+    def test_predictions_match_art(self):
+        for load in [load_iris, load_breast_cancer]:
+            x, y = load(return_X_y=True)
+            model = xgb.XGBClassifier(n_estimators=20, max_depth=3).fit(x, y)
+            nb_classes = len(np.unique(y))
+            for booster in [False, True]:
+                wrapped = model.get_booster() if booster else model
+                expected = XGBoostClassifier(model=wrapped, nb_features=x.shape[1], nb_classes=nb_classes).predict(x)
+                classifier = InplaceXGBoostClassifier(model=wrapped, nthread=1, nb_features=x.shape[1], nb_classes=nb_classes)
+                np.testing.assert_allclose(classifier.predict(x), expected, rtol=1e-6)
+                np.testing.assert_allclose(classifier.predict(x[:1]), expected[:1], rtol=1e-6)
+
+    # TC_XGB_02
+    def test_preprocessing_defences_applied(self):
+        x, y = load_iris(return_X_y=True)
+        model = xgb.XGBClassifier(n_estimators=20, max_depth=3).fit(x, y)
+        clip_values = (x.min(), x.max())
+        kwargs = dict(nb_features=4, nb_classes=3, clip_values=clip_values,
+                      preprocessing_defences=[FeatureSqueezing(clip_values=clip_values, bit_depth=2)])
+        expected = XGBoostClassifier(model=model, **kwargs).predict(x)
+        np.testing.assert_allclose(InplaceXGBoostClassifier(model=model, **kwargs).predict(x), expected, rtol=1e-6)
+
+    # TC_XGB_03
+    def test_nthread_leaves_model_unchanged(self):
+        x, y = load_iris(return_X_y=True)
+        model = xgb.XGBClassifier(n_estimators=20, max_depth=3, n_jobs=4).fit(x, y)
+        get_nthread = lambda booster: json.loads(booster.save_config())["learner"]["generic_param"]["nthread"]
+        for wrapped in [model, model.get_booster()]:
+            classifier = InplaceXGBoostClassifier(model=wrapped, nthread=1, nb_features=4, nb_classes=3)
+            self.assertEqual(get_nthread(classifier._booster), "1")
+            self.assertEqual(get_nthread(model.get_booster()), "4")
+            np.testing.assert_allclose(classifier.predict(x), model.predict_proba(x), rtol=1e-6)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,51 @@
+from sklearn.datasets import load_iris
+from sklearn.model_selection import train_test_split
+import xgboost as xgb
+import numpy as np
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.normpath(os.path.join(os.path.dirname(__file__), "..")))
+from art.estimators.classification import XGBoostClassifier
+from app.Core.xgboost_estimator import InplaceXGBoostClassifier
+
+def get_model():
+    # Train a small iris model, the model saved by iris_xgboost.py may be in a format the installed XGBoost cannot read
+    X, y = load_iris(return_X_y=True)
+    X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
+    model = xgb.XGBClassifier(n_estimators=100, eval_metric='mlogloss')
+    model.fit(X_train, y_train)
+    return model, X_test
+
+def time_predict(classifier, x, batch_size, repeats):
+    # Median latency of one predict call on batch_size rows, in microseconds
+    batch = x[:batch_size]
+    classifier.predict(batch)
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        classifier.predict(batch)
+        timings.append(time.perf_counter() - start)
+    return np.median(timings) * 1e6
+
+def run_benchmark(batch_sizes=(1, 10, 100), repeats=1000, nthread=1):
+    model, X_test = get_model()
+    x = np.resize(X_test, (max(batch_sizes), X_test.shape[1]))
+    # ART builds a DMatrix per predict for a Booster (and goes through predict_proba for an XGBClassifier)
+    dmatrix = XGBoostClassifier(model=model.get_booster(), nb_features=x.shape[1], nb_classes=3)
+    inplace = InplaceXGBoostClassifier(model=model, nthread=nthread, nb_features=x.shape[1], nb_classes=3)
+    assert np.allclose(dmatrix.predict(x), inplace.predict(x))
+    print(f"{'rows':>6} {'DMatrix (us)':>14} {'inplace (us)':>14} {'speedup':>8}")
+    for batch_size in batch_sizes:
+        t_dmatrix = time_predict(dmatrix, x, batch_size, repeats)
+        t_inplace = time_predict(inplace, x, batch_size, repeats)
+        print(f"{batch_size:>6} {t_dmatrix:>14.1f} {t_inplace:>14.1f} {t_dmatrix / t_inplace:>7.1f}x")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Latency of ART's DMatrix predict vs Booster.inplace_predict")
+    parser.add_argument("--repeats", type=int, default=1000)
+    parser.add_argument("--nthread", type=int, default=1)
+    args = parser.parse_args()
+    run_benchmark(repeats=args.repeats, nthread=args.nthread)